@@ -1,10 +1,185 @@
-from flask import Flask, jsonify, request
+import os
+import math
+import time
+import hashlib
+import tempfile
+from datetime import datetime, UTC
+from functools import wraps
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    make_response,
+    request,
+    stream_with_context,
+)
 from flask_cors import CORS
+from change_feed import ChangeFeed, event_stream, tombstones
+from fleet_stats import parse_stats_args
 from user_model import User
 from auth_controller import VMAuth
+from token_cache import TokenCache
+from json_stream import stream_json_array
+from metrics import CONTENT_TYPE, METRICS
+from password_hasher import VerifierBusy
+from profiling import RequestProfiler
+from rate_limit import ConcurrencyLimit, RateLimiter, parse_limits
+from response_cache import ResponseCache
+from search_index import SearchQuery
+from response_encoding import (
+    JSON,
+    accepts_gzip,
+    as_record,
+    choose_format,
+    dumps,
+    encode,
+)
+from vm_model import VM_FIELDS
+from vm_query import VMQuery
 
 app = Flask(__name__)
-CORS(app)
+CORS(
+    app,
+    expose_headers=[
+        "ETag",
+        "Last-Modified",
+        "Retry-After",
+        "X-Data-Version",
+        "X-Profile-Id",
+    ],
+)
+
+MAX_LOOKUP_IDS = 500
+MAX_DELETE_IDS = 500
+STREAM_THRESHOLD = int(os.getenv("STREAM_THRESHOLD", "1000"))
+TOKEN_CACHE = TokenCache(max_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")))
+RESPONSE_CACHE = ResponseCache(
+    max_bytes=int(os.getenv("RESPONSE_CACHE_BYTES", str(64 << 20)))
+)
+User.subscribe(RESPONSE_CACHE.invalidate)
+CHANGE_FEED = ChangeFeed(max_changes=int(os.getenv("CHANGE_FEED_SIZE", "10000")))
+User.subscribe(CHANGE_FEED.record)
+RATE_LIMITER = RateLimiter(
+    parse_limits(os.getenv("RATE_LIMITS")),
+    max_keys=int(os.getenv("RATE_LIMIT_KEYS", "100000")),
+)
+WRITE_LIMIT = ConcurrencyLimit(int(os.getenv("WRITE_CONCURRENCY", "4")))
+# Limit class of each route not in the "read" class; long-lived streams and
+# the metrics scrape are not limited
+ROUTE_LIMITS = {
+    "/login": "login",
+    "/vms/delete/<int:cluster>": "write",
+    "/vms/delete": "write",
+}
+UNLIMITED_ROUTES = {"/metrics", "/vms/changes"}
+
+
+def cache_gauges():
+    """Reports the response and token cache statistics as metric gauges"""
+    for cache, stats in (
+        ("responses", RESPONSE_CACHE.stats()),
+        ("tokens", TOKEN_CACHE.stats()),
+    ):
+        for stat, value in stats.items():
+            yield "cache_" + stat, f"Cache {stat.replace('_', ' ')}", {
+                "cache": cache
+            }, value
+
+
+METRICS.add_gauges(cache_gauges)
+METRICS.add_gauges(
+    lambda: [
+        ("rate_limit_buckets", "Rate limit buckets tracked", {}, len(RATE_LIMITER))
+    ]
+)
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+def too_many_requests(message: str, retry_after: float, limit: str):
+    """Builds a 429 response asking the client to retry after retry_after
+    seconds, rounded up to whole seconds"""
+    METRICS.inc("requests_rejected_total", limit=limit)
+    response = jsonify({"error": message})
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response, 429
+
+
+@app.before_request
+def admit():
+    """Applies the rate limits and the write concurrency cap
+
+    Each route has a token bucket per client: the username from the JWT,
+    or the client address without one and always for /login. Write routes
+    are also refused while WRITE_CONCURRENCY writes are in progress. Over
+    a limit, answers 429 with Retry-After without calling the view
+    """
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    if rule is None or rule in UNLIMITED_ROUTES or request.method == "OPTIONS":
+        return None
+    limit = ROUTE_LIMITS.get(rule, "read")
+    if limit not in RATE_LIMITER.limits and limit != "write":
+        return None
+    username = get_username_from_token() if limit != "login" else None
+    client = ("user", username) if username else ("addr", request.remote_addr)
+    retry_after = RATE_LIMITER.acquire(limit, (rule, client))
+    if retry_after:
+        return too_many_requests("Too many requests", retry_after, limit)
+    if limit == "write":
+        if not WRITE_LIMIT.try_enter():
+            return too_many_requests("Too many writes in progress", 1, "concurrency")
+        g.write_slot = True
+    return None
+
+
+@app.teardown_request
+def release_write_slot(exc):
+    if g.pop("write_slot", False):
+        WRITE_LIMIT.leave()
+
+
+@app.after_request
+def record_latency(response):
+    """Records the request's latency by route, method and status
+
+    A streamed body is still being produced when this runs, so its
+    latency is recorded once the last chunk has been sent
+    """
+    started = g.get("request_started")
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    labels = (route, request.method, response.status_code)
+    if not response.is_streamed:
+        METRICS.observe(*labels, time.perf_counter() - started)
+        return response
+
+    def timed(chunks):
+        try:
+            yield from chunks
+        finally:
+            METRICS.observe(*labels, time.perf_counter() - started)
+
+    response.response = timed(response.response)
+    return response
+
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+if PROFILE_TOKEN or PROFILE_SAMPLE_RATE:
+    RequestProfiler(
+        os.getenv(
+            "PROFILE_DIR",
+            os.path.join(tempfile.gettempdir(), "cluster_manager_profiles"),
+        ),
+        token=PROFILE_TOKEN,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        max_profiles=int(os.getenv("PROFILE_MAX_FILES", "100")),
+    ).install(app)
 
 
 @app.route("/login", methods=["POST"])
@@ -12,6 +187,8 @@ def login():
     """Authenticate user and return JWT token
 
     Expects JSON payload with 'username' and 'password'
+
+    Answers 503 with Retry-After while too many logins are being verified
     """
     json_data = request.get_json()
     username = json_data.get("username")
@@ -23,24 +200,102 @@ def login():
             jsonify({"login_status": "success", "username": username, "token": token}),
             200,
         )
+    except VerifierBusy as ex:
+        response = jsonify({"login_status": "fail", "message": str(ex)})
+        response.headers["Retry-After"] = "1"
+        return response, 503
     except RuntimeError:
         print(f"username: {username}" f"password: {password}")
         return jsonify({"login_status": "fail", "message": "Invalid credentials"}), 401
 
 
+def verify_token(token):
+    """Validates a JWT token, consulting the verified-token cache first
+
+    Returns a tuple (is_valid, payload_or_error) like VMAuth.validate_token
+    """
+    payload = TOKEN_CACHE.get(token)
+    if payload is not None:
+        return True, payload
+    valid, payload_or_error = VMAuth().validate_token(token)
+    if valid:
+        TOKEN_CACHE.put(token, payload_or_error)
+    return valid, payload_or_error
+
+
 def get_username_from_token():
     """Extract username from JWT token in Authorization header
 
-    Returns username if token is valid, else None
+    Returns username if token is valid, else None; the result is kept for
+    the rest of the request, so the token is looked up once
     """
+    if "username" in g:
+        return g.username
+    g.username = None
     token = request.headers.get("Authorization", "").replace("Bearer ", "")
-    if not token:
-        return None
-    auth = VMAuth()
-    valid, payload = auth.validate_token(token)
-    if valid and "username" in payload:
-        return payload["username"]
-    return None
+    if token:
+        valid, payload = verify_token(token)
+        if valid and "username" in payload:
+            g.username = payload["username"]
+    return g.username
+
+
+def conditional_get(per_user=False, negotiated=False):
+    """Adds ETag and Last-Modified validators derived from the data version
+
+    The version itself is sent as X-Data-Version, for use as the since
+    parameter of a later delta request.
+
+    If the request's If-None-Match (or, without it, If-Modified-Since)
+    matches the current data version, answers 304 without calling the view,
+    so the data is neither read nor serialized. Last-Modified only has whole
+    seconds, so clients that need to see changes made within the same second
+    should revalidate with the ETag.
+
+    With per_user, the ETag also depends on the authenticated username, since
+    the same URL returns a different listing for each user. With negotiated,
+    the ETag also names the response format chosen from the Accept header.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = g.data_version = User.data_version()
+            tag = f"v{version}"
+            if per_user:
+                username = get_username_from_token()
+                if not username:
+                    return view(*args, **kwargs)
+                tag += "-" + hashlib.sha256(username.encode()).hexdigest()[:16]
+            if negotiated:
+                mimetype = choose_format(request.accept_mimetypes)
+                if mimetype != JSON:
+                    tag += "-" + mimetype.rsplit("/", 1)[1]
+            modified = datetime.fromtimestamp(version // 1_000_000_000, UTC)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(tag)
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and modified <= since
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            response.headers["X-Data-Version"] = str(version)
+            response.last_modified = modified
+            response.cache_control.no_cache = True
+            if per_user:
+                response.vary.add("Authorization")
+            if negotiated:
+                response.vary.update(("Accept", "Accept-Encoding"))
+            return response
+
+        return wrapper
+
+    return decorator
 
 
 @app.route("/whoami")
@@ -69,43 +324,287 @@ def validate_token():
     token = request.json.get("token", None)
     if token is None:
         return jsonify({"token_validated": False}), 401
-    auth = VMAuth()
-    valid, payload_or_error = auth.validate_token(token)
+    valid, payload_or_error = verify_token(token)
     if valid:
         return jsonify({"token_validated": True}), 200
     else:
         return jsonify({"token_validated": False, "exception": payload_or_error}), 401
 
 
+def vm_page(owner=None):
+    """Builds a paged listing response from the query string
+
+    Returns a JSON object with 'items', 'total' and 'next_cursor', or a 400
+    error if the query parameters are invalid
+    """
+    try:
+        query = VMQuery.from_args(request.args)
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+    items, total, next_cursor = User.query_vms(query, owner=owner)
+    return jsonify({"items": items, "total": total, "next_cursor": next_cursor})
+
+
+def changes_since(owner=None):
+    """Builds a delta response from the since query parameter
+
+    Returns a JSON object with the data 'version' reached and 'changes', one
+    tombstone per VM deleted after since (only owner's, if given), or a 410
+    error with the current 'version' if the change feed no longer reaches
+    back that far and the full listing must be fetched again
+    """
+    try:
+        since = int(request.args["since"])
+    except ValueError:
+        return jsonify({"error": "since must be an integer data version"}), 400
+    version, changes = CHANGE_FEED.changes_since(since, User.data_version())
+    if changes is None:
+        return (
+            jsonify(
+                {"error": "since is too old, reload the listing", "version": version}
+            ),
+            410,
+        )
+    return jsonify({"version": version, "changes": tombstones(changes, owner)})
+
+
+def stream_json(items, cache_key=None, version=None):
+    """Streams an iterable of records as a JSON array with chunked encoding
+
+    The records are serialized as they are produced, so memory stays flat
+    and the first bytes go out before the whole listing is built. With a
+    cache_key, the streamed body is also stored in the response cache
+    """
+    chunks = stream_json_array(as_record(item) for item in items)
+    if cache_key is not None:
+        chunks = RESPONSE_CACHE.tee(cache_key, version, chunks)
+    return Response(stream_with_context(chunks), mimetype=JSON)
+
+
+def cached_response(entry, mimetype=JSON):
+    """Builds a response from a cached (body, gzipped) pair"""
+    body, gzipped = entry
+    response = Response(body, mimetype=mimetype)
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def request_data_version() -> int:
+    """Returns the data version conditional_get read for this request
+
+    The view reads its data only after that, so a body cached under this
+    version is never older than the version says, even if a delete lands
+    while the view runs; reading the version again after loading could
+    file a stale body under the newer version.
+    """
+    version = g.get("data_version")
+    return User.data_version() if version is None else version
+
+
+def cached_listing(key, records, count=None):
+    """Serves a listing from the response cache, encoding it on a miss
+
+    Takes in a cache key naming the listing, a function returning its
+    records and, if known, how many there are. The body is gzip, columnar
+    JSON or MessagePack as the client asked for; plain uncompressed JSON
+    listings of unknown or large size are streamed, filling the cache as
+    they go.
+    """
+    mimetype = choose_format(request.accept_mimetypes)
+    compress = accepts_gzip(request.accept_encodings)
+    key = (*key, mimetype, compress)
+    version = request_data_version()
+    entry = RESPONSE_CACHE.get(key, version)
+    if entry is None:
+        if mimetype == JSON and not compress:
+            if count is None or count > STREAM_THRESHOLD:
+                return stream_json(records(), cache_key=key, version=version)
+            entry = RESPONSE_CACHE.put(key, version, dumps(records()))
+        else:
+            entry = RESPONSE_CACHE.put(
+                key, version, *encode(records(), mimetype, compress)
+            )
+    return cached_response(entry, mimetype)
+
+
 @app.route("/vms_by_user")
+@conditional_get(per_user=True, negotiated=True)
 def list_of_vms():
     """Returns Cluster information for the user in the session
 
     Expects JWT token in Authorization header
 
+    Accepts the paging parameters of /vms/all, or since to return only the
+    user's VMs deleted after that data version; without any, returns the
+    user's full list
+
     """
     username = get_username_from_token()
     if not username:
         return jsonify({"error": "User not authenticated"}), 401
+    if "since" in request.args:
+        return changes_since(owner=username)
+    if request.args:
+        return vm_page(owner=username)
     user = User.load_user(username)
     if user:
-        return user.vms_user()
+        vms = user.vms_user()
+        return cached_listing(("user", username), lambda: vms, count=len(vms))
     return jsonify({"error": "User not found"}), 404
 
 
 @app.route("/vms/<int:vm_id>")
+@conditional_get()
 def get_vm(vm_id: int):
     """Returns VM information given a VM ID"""
-    vm = User.get_vm(vm_id=vm_id)
-    if vm:
-        return jsonify(vm)
+
+    def build():
+        vm = User.get_vm(vm_id=vm_id)
+        return (dumps(vm), False) if vm else None
+
+    entry = RESPONSE_CACHE.get_or_build(("vm", vm_id), request_data_version(), build)
+    if entry is not None:
+        return cached_response(entry)
     return jsonify({"error": f"VM {vm_id} not found"}), 404
 
 
+@app.route("/vms/search")
+@conditional_get()
+def search_vms():
+    """Searches VMs by ID, cluster name, owner and podbox
+
+    Accepts q (matched against whole values, their prefixes and the later
+    words of cluster names), limit, cursor and min_id / max_id to restrict
+    the vm_id range. Without q, lists the VMs in the range by vm_id
+
+    Returns the best matches first as 'items', with 'total' matches (capped,
+    with 'total_exact' false, for very broad queries) and 'next_cursor'
+    """
+    try:
+        search = SearchQuery.from_args(request.args)
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+    items, total, exact = User.search_vms(search)
+    more = search.offset + search.limit < total or not exact
+    return jsonify(
+        {
+            "items": items,
+            "total": total,
+            "total_exact": exact,
+            "next_cursor": search.next_cursor() if more and items else None,
+        }
+    )
+
+
+@app.route("/vms/stats")
+@conditional_get()
+def vm_stats():
+    """Returns counts of VMs by status, podbox, version and owner
+
+    Accepts owner, status, podbox and version filters and a comma separated
+    'by' list of facets to count; without it, counts every facet that is not
+    filtered on. For example ?podbox=PODBOX1&by=version counts the versions
+    within one podbox
+
+    Returns 'total' matching VMs, 'filters' and 'counts' per facet
+    """
+    try:
+        filters, by = parse_stats_args(request.args)
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+    return jsonify({"filters": filters, **User.fleet_stats(filters, by)})
+
+
+@app.route("/vms/lookup")
+def get_vms():
+    """Returns VM information for several VM IDs in one response
+
+    Expects an 'ids' query parameter with comma separated VM IDs and an
+    optional 'fields' parameter with comma separated field names
+
+    Returns the found VMs in request order and the IDs that were not found
+    """
+    try:
+        vm_ids = [
+            int(vm_id) for vm_id in request.args.get("ids", "").split(",") if vm_id
+        ]
+    except ValueError:
+        return jsonify({"error": "ids must be comma separated integers"}), 400
+    if not vm_ids or len(vm_ids) > MAX_LOOKUP_IDS:
+        return jsonify({"error": f"between 1 and {MAX_LOOKUP_IDS} ids required"}), 400
+    fields = None
+    if request.args.get("fields"):
+        fields = request.args["fields"].split(",")
+        unknown = set(fields) - set(VM_FIELDS)
+        if unknown:
+            return (
+                jsonify({"error": f"unknown fields: {', '.join(sorted(unknown))}"}),
+                400,
+            )
+    vms, missing = User.get_vms(vm_ids, fields=fields)
+    return jsonify({"vms": vms, "missing": missing})
+
+
 @app.route("/vms/all")
+@conditional_get(negotiated=True)
 def vm_list():
-    """Returns Cluster for every deployed cluster"""
-    return User.get_all_vms()
+    """Returns Cluster for every deployed cluster
+
+    Accepts optional limit, cursor, sort (vm_id, deployedclustername,
+    deployedclusterowner, deployedvmtimestamp), order (asc, desc), owner,
+    status, podbox, version, q (ID or name substring), deployed_after and
+    deployed_before (ISO 8601) parameters; with any of them, returns one
+    page with the total count and next cursor
+
+    With since=<data version> alone, returns only tombstones of the VMs
+    deleted after that version (see changes_since)
+
+    The full listing is gzip-compressed when the client accepts it, and is
+    sent as columnar JSON or MessagePack when the Accept header asks for it
+    """
+    if "since" in request.args:
+        return changes_since()
+    if request.args:
+        return vm_page()
+    return cached_listing(("all",), User.iter_all_vms)
+
+
+@app.route("/vms/changes")
+def vm_changes():
+    """Streams VM deletes as Server-Sent Events
+
+    Starts after the data version in the Last-Event-ID header, sent by
+    reconnecting clients, or the since parameter, else at the current
+    version. Each "delete" event has the new data version as its id and
+    'version', 'owner' and 'vm_ids' as JSON data; a "reset" event means the
+    listing must be fetched again
+    """
+    start = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        version = int(start) if start else None
+    except ValueError:
+        return jsonify({"error": "since must be an integer data version"}), 400
+    response = Response(
+        event_stream(CHANGE_FEED, User.data_version, version),
+        mimetype="text/event-stream",
+    )
+    response.cache_control.no_cache = True
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    """Returns the size, counters and hit ratio of the server-side caches"""
+    return jsonify({"responses": RESPONSE_CACHE.stats(), "tokens": TOKEN_CACHE.stats()})
+
+
+@app.route("/metrics")
+def metrics():
+    """Returns request latencies, I/O counters and cache statistics in the
+    Prometheus text format"""
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
 
 
 @app.route("/vms/delete/<int:cluster>")
@@ -127,5 +626,35 @@ def vm_cluster_delete(cluster: int):
         return jsonify({"error": "Delete failed"}), 400
 
 
+@app.route("/vms/delete", methods=["POST"])
+def vm_cluster_bulk_delete():
+    """Deletes several clusters given a list of IDs
+
+    Expects JWT token in Authorization header and JSON payload with 'vm_ids',
+    a list of 1 to MAX_DELETE_IDS integers
+
+    Returns per-ID results ("deleted", "not_found" or "forbidden") and
+    success True only if every cluster was deleted
+
+    """
+    username = get_username_from_token()
+    if not username:
+        return jsonify({"error": "User not authenticated"}), 401
+    vm_ids = (request.get_json(silent=True) or {}).get("vm_ids")
+    if not isinstance(vm_ids, list) or not all(
+        isinstance(vm_id, int) and not isinstance(vm_id, bool) for vm_id in vm_ids
+    ):
+        return jsonify({"error": "vm_ids must be a list of integers"}), 400
+    if not vm_ids or len(vm_ids) > MAX_DELETE_IDS:
+        return (
+            jsonify({"error": f"between 1 and {MAX_DELETE_IDS} vm_ids required"}),
+            400,
+        )
+    results = User.delete_vms(username=username, vm_ids=vm_ids)
+    success = all(result == "deleted" for result in results.values())
+    body = {"success": success, "results": {str(k): v for k, v in results.items()}}
+    return jsonify(body), 200 if success else 400
+
+
 if __name__ == "__main__":
     app.run()
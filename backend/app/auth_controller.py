@@ -1,59 +1,74 @@
 import jwt
-import hashlib
 import os
-import json
+import storage
+from metrics import METRICS
+from password_hasher import PasswordVerifier, VerifierBusy, hash_password
 from datetime import datetime, timedelta, UTC
 
 
 class VMAuth:
     """Authentication class"""
 
-    USERS_FILE = os.path.join(
-        os.path.dirname(__file__), "..", "mock_data", "users.json"
-    )
     JWT_SECRET = os.getenv("JWT_SECRET")
     if not JWT_SECRET:
         raise RuntimeError("JWT_SECRET environment variable not set")
     JWT_ALGORITHM = "HS256"
     JWT_EXP_DELTA_SECONDS = 3600
 
-    def __init__(self):
-        """Initialize VMAuth and load users from mock JSON file"""
-        self.users = self._load_users()
-
-    def _load_users(self):
-        """Load users from the mock JSON file
+    CREDENTIALS = storage.create_credential_store()
+    VERIFIER = PasswordVerifier(
+        workers=int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1))),
+        max_pending=int(os.getenv("PASSWORD_QUEUE", "64")),
+        timeout=float(os.getenv("PASSWORD_TIMEOUT", "5")),
+    )
 
-        Returns a list of user dictionaries with 'username' and 'password_hash' keys.
+    def __init__(self, credentials=None, verifier=None):
+        """Initialize VMAuth with the shared credential store and password
+        verifier
 
-        Complexity: O(n) where n is the number of users in the JSON file"""
-        if not os.path.exists(self.USERS_FILE):
-            return []
-        with open(self.USERS_FILE, "r") as f:
-            return json.load(f)
+        The store is loaded on first use and shared by every VMAuth
+        instance, so creating one does not read the credentials file."""
+        self.credentials = credentials or self.CREDENTIALS
+        self.verifier = verifier or self.VERIFIER
 
     @staticmethod
     def _hash_password(password):
-        """Hash the password using SHA-256
+        """Hash the password with a salted KDF (scrypt, or PBKDF2 where
+        scrypt is unavailable)
 
-        Takes in a password string and returns its SHA-256 hash
+        Takes in a password string and returns the hash in the stored format
 
-        Complexity: O(1) Hashing SHA-256 takes a fixed amount of time"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        Complexity: O(1) One KDF run, tens of milliseconds by design"""
+        return hash_password(password)
 
     def authenticate(self, username, password):
         """Authenticate user and return JWT token.
 
-        Takes in a username and password
+        Takes in a username and password. The password is checked in the
+        verifier's process pool; a legacy SHA-256 hash that matches is
+        replaced with a KDF hash in the credential store.
 
         Returns: JWT token if authentication is successful, else raises RuntimeError.
+        Raises VerifierBusy when the verifier is overloaded or times out.
 
-        Complexity: O(n) where n is the number of users in the JSON file"""
-        password_hash = self._hash_password(password)
-        for user in self.users:
-            if user["username"] == username and user["password_hash"] == password_hash:
-                return self._generate_jwt(username)
-        raise RuntimeError("Invalid credentials")
+        Complexity: O(1) Dictionary lookup in the credential store and one
+        or two KDF runs"""
+        try:
+            matches, upgraded = self.verifier.verify(
+                password, self.credentials.get(username)
+            )
+        except VerifierBusy:
+            METRICS.inc("password_verifications_total", result="busy")
+            raise
+        if not matches:
+            METRICS.inc("password_verifications_total", result="invalid")
+            raise RuntimeError("Invalid credentials")
+        if upgraded:
+            self.credentials.update(username, upgraded)
+            METRICS.inc("password_verifications_total", result="upgraded")
+        else:
+            METRICS.inc("password_verifications_total", result="valid")
+        return self._generate_jwt(username)
 
     def _generate_jwt(self, username):
         """Generate JWT token for the authenticated user
@@ -77,6 +92,8 @@ class VMAuth:
             payload = jwt.decode(
                 token, self.JWT_SECRET, algorithms=[self.JWT_ALGORITHM]
             )
+            METRICS.inc("jwt_verifications_total", result="valid")
             return True, payload
         except Exception as ex:
+            METRICS.inc("jwt_verifications_total", result="invalid")
             return False, str(ex)
@@ -0,0 +1,174 @@
+import json
+import threading
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Tuple
+
+# A delete is held as (version after it, owner, deleted vm_ids)
+Change = Tuple[int, str, Tuple[int, ...]]
+
+# How long a reader waits for a delete whose new data version it has already
+# seen to be recorded, before deciding the data changed some other way
+SETTLE_SECONDS = 0.1
+
+
+class ChangeFeed:
+    """Bounded, versioned log of the deletes made since the data was loaded
+
+    Subscribed to the repository, it records each delete under the data
+    version the delete produced, so a client holding the listing of some
+    version can ask for exactly the deletes after it. The oldest deletes are
+    dropped once more than max_changes VMs are held.
+
+    The feed is only complete between data versions it saw every change
+    between. A delete reported from a version other than the feed's latest,
+    or a reader seeing a data version the feed never recorded, means the
+    data changed in some other way (the file was reloaded, or another
+    process wrote the database); the feed then restarts empty at the new
+    version, and clients of older versions must reload the listing.
+    """
+
+    def __init__(self, max_changes: int = 10000):
+        self.max_changes = max_changes
+        self._changed = threading.Condition()
+        self._changes: Deque[Change] = deque()
+        self._size = 0
+        self._floor: Optional[int] = None
+        self._head: Optional[int] = None
+
+    def _reset(self, version: int):
+        """Drops every change and restarts at version; must hold the lock"""
+        self._changes.clear()
+        self._size = 0
+        self._floor = self._head = version
+
+    def start(self, version: int):
+        """Starts the feed at version unless it has already started, so that
+        worker processes forked afterwards share the same starting point"""
+        with self._changed:
+            if self._head is None:
+                self._reset(version)
+
+    def record(self, previous_version: int, version: int, owner: str, vm_ids):
+        """Appends a delete and wakes the readers waiting for one; the
+        signature of a repository delete listener
+
+        Complexity: O(k) where k is the number of deleted VMs"""
+        with self._changed:
+            if self._head is None:
+                self._reset(previous_version)
+            elif self._head != previous_version:
+                self._reset(version)
+                self._changed.notify_all()
+                return
+            self._changes.append((version, owner, tuple(sorted(vm_ids))))
+            self._size += len(vm_ids)
+            self._head = version
+            while self._size > self.max_changes and len(self._changes) > 1:
+                dropped, _, dropped_ids = self._changes.popleft()
+                self._size -= len(dropped_ids)
+                self._floor = dropped
+            self._changed.notify_all()
+
+    def _settle(self, current: int):
+        """Catches the feed up with the current data version, waiting
+        briefly for a delete that is still being reported; must hold the
+        lock"""
+        if self._head is None:
+            self._reset(current)
+        elif self._head < current and not self._changed.wait_for(
+            lambda: self._head >= current, SETTLE_SECONDS
+        ):
+            self._reset(current)
+
+    def changes_since(
+        self, version: int, current: int
+    ) -> Tuple[int, Optional[List[Change]]]:
+        """Returns the deletes made after version, oldest first
+
+        Takes in the client's data version and the current one. Returns the
+        version the client is at after applying the deletes, and the
+        deletes, or None if the feed does not reach back to version and the
+        client must reload.
+
+        Complexity: O(k) where k is the number of returned deletes"""
+        with self._changed:
+            self._settle(current)
+            if not self._floor <= version <= self._head:
+                return self._head, None
+            changes = []
+            for change in reversed(self._changes):
+                if change[0] <= version:
+                    break
+                changes.append(change)
+            changes.reverse()
+            return self._head, changes
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """Waits until a delete after version is recorded or timeout seconds
+        pass; returns True if one was"""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self._head is not None and self._head != version, timeout
+            )
+
+    def stats(self) -> dict:
+        """Returns the retained deletes, VMs and version range"""
+        with self._changed:
+            return {
+                "deletes": len(self._changes),
+                "vms": self._size,
+                "oldest_version": self._floor,
+                "latest_version": self._head,
+            }
+
+
+def tombstones(changes: List[Change], owner: Optional[str] = None) -> List[dict]:
+    """Flattens deletes into one tombstone per deleted VM, optionally only
+    those of one owner"""
+    return [
+        {"version": version, "op": "delete", "vm_id": vm_id, "owner": changed_owner}
+        for version, changed_owner, vm_ids in changes
+        if owner is None or changed_owner == owner
+        for vm_id in vm_ids
+    ]
+
+
+def event_stream(
+    feed: ChangeFeed,
+    current_version,
+    version: Optional[int] = None,
+    poll_seconds: float = 1.0,
+    heartbeat_seconds: float = 15.0,
+) -> Iterator[str]:
+    """Yields the feed's deletes as Server-Sent Events, forever
+
+    Starts after version, or at the current data version without one. Each
+    delete is a "delete" event whose id is its data version, so a client
+    reconnecting with Last-Event-ID resumes where it left off; if the feed
+    cannot serve that far back, a "reset" event carries the version to
+    reload at. current_version is called every poll_seconds, which in a
+    forked worker also replays the deletes made by other workers into the
+    feed, and a comment line is sent after heartbeat_seconds of silence to
+    keep proxies from closing the connection.
+    """
+    if version is None:
+        version = current_version()
+    # Sent at once so the client sees the stream open, and sets how soon it
+    # reconnects after the connection drops
+    yield "retry: 3000\n\n"
+    idle = 0.0
+    while True:
+        version, changes = feed.changes_since(version, current_version())
+        if changes is None:
+            yield f"id: {version}\nevent: reset\ndata: {json.dumps({'version': version})}\n\n"
+            changes = []
+        for changed, owner, vm_ids in changes:
+            data = json.dumps({"version": changed, "owner": owner, "vm_ids": vm_ids})
+            yield f"id: {changed}\nevent: delete\ndata: {data}\n\n"
+        if changes:
+            idle = 0.0
+        elif idle >= heartbeat_seconds:
+            idle = 0.0
+            yield ": keepalive\n\n"
+        if not feed.wait(version, poll_seconds):
+            idle += poll_seconds
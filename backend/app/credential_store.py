@@ -0,0 +1,98 @@
+import json
+import threading
+from functools import partial
+from typing import Callable, Dict, Hashable, Optional
+from journal import write_json_atomic
+from metrics import count_read
+from vm_repository import VMRepository
+
+
+class CredentialStore:
+    """Shared, hashed username -> password hash index
+
+    Credentials are loaded once and kept in a dict. Before each lookup the
+    store reads a stamp of the credentials (by default the backing file's
+    mtime, inode and size); if it changed the dict is rebuilt and swapped in
+    as a single reference assignment under a lock.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        loader: Optional[Callable[[], list]] = None,
+        saver: Optional[Callable[[str, str], None]] = None,
+        stamp: Optional[Callable[[], Optional[Hashable]]] = None,
+    ):
+        """Takes in the path to watch, an optional loader returning a list
+        of user dictionaries with 'username' and 'password_hash' keys, an
+        optional saver storing one user's new hash and an optional stamp
+        returning a value that changes whenever the credentials do, or None
+        if there are none; by default the path is read and rewritten as a
+        JSON list and stamped with VMRepository._stamp"""
+        self.path = path
+        self.loader = loader or self._load_json
+        self.saver = saver or self._save_json
+        self.stamp = stamp or partial(VMRepository._stamp, path)
+        self._lock = threading.Lock()
+        self._stamp: Optional[Hashable] = None
+        self._hashes: Optional[Dict[str, str]] = None
+
+    def _load_json(self) -> list:
+        """Reads the credentials list from the JSON file
+
+        Complexity: O(n) where n is the number of users in the JSON file"""
+        with open(self.path, "r") as f:
+            users = json.load(f)
+            count_read(self.path, f.tell(), len(users))
+        return users
+
+    def _save_json(self, username: str, password_hash: str):
+        """Rewrites the JSON file with username's hash replaced
+
+        Another process rewriting the file at the same moment may undo the
+        change; the user then keeps the old hash until the next upgrade.
+
+        Complexity: O(n) where n is the number of users in the JSON file"""
+        users = self._load_json()
+        for user in users:
+            if user["username"] == username:
+                user["password_hash"] = password_hash
+        write_json_atomic(self.path, users)
+
+    def _current(self) -> Dict[str, str]:
+        """Returns the username index, reloading it if the stamp changed
+
+        Complexity: O(1) when the stamp is unchanged, O(n) on reload"""
+        stamp = self.stamp()
+        hashes = self._hashes
+        if hashes is not None and stamp == self._stamp:
+            return hashes
+        with self._lock:
+            if self._hashes is None or stamp != self._stamp:
+                users = self.loader() if stamp is not None else []
+                self._hashes = {u["username"]: u["password_hash"] for u in users}
+                self._stamp = stamp
+            return self._hashes
+
+    def get(self, username: str) -> Optional[str]:
+        """Returns the stored password hash for username, or None
+
+        Complexity: O(1) Dictionary lookup"""
+        return self._current().get(username)
+
+    def update(self, username: str, password_hash: str):
+        """Stores a new password hash for username
+
+        The change is written through the saver and applied to the loaded
+        index in place, without reloading every credential
+
+        Complexity: O(1) plus the saver, O(n) for the JSON file"""
+        hashes = self._current()
+        with self._lock:
+            self.saver(username, password_hash)
+            if self._hashes is hashes:
+                hashes[username] = password_hash
+                self._stamp = self.stamp()
+
+    def __len__(self) -> int:
+        return len(self._current())
@@ -0,0 +1,123 @@
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from vm_model import VM
+
+# Facet name -> VM field; owner is the cluster's deployedclusterowner
+STAT_FIELDS = {
+    "owner": "deployedclusterowner",
+    "status": "deployedvmstatus",
+    "podbox": "podbox",
+    "version": "version",
+}
+FACETS = tuple(STAT_FIELDS)
+
+
+def parse_stats_args(args) -> Tuple[Dict[str, str], List[str]]:
+    """Reads facet filters and the comma separated 'by' facets from request
+    arguments; without 'by', every unfiltered facet is counted
+
+    Raises ValueError for unknown facets
+
+    Complexity: O(1)"""
+    filters = {name: args[name] for name in FACETS if args.get(name)}
+    by = [name for name in args.get("by", "").split(",") if name]
+    unknown = [name for name in by if name not in STAT_FIELDS]
+    if unknown:
+        raise ValueError(f"by must name facets among {', '.join(FACETS)}")
+    return filters, by or [name for name in FACETS if name not in filters]
+
+
+class FleetStats:
+    """Counts of VMs by status, podbox, version and owner, kept current
+
+    Counts every distinct combination of the four facet values once at
+    load. A query filtered on some facets and grouped by another is served
+    from a table mapping the filter values to a Counter of the grouped
+    facet; each table is derived from the combinations the first time its
+    shape is asked for, and every table is decremented in place on delete.
+    A query therefore costs a dictionary lookup plus the size of its
+    answer, however many VMs there are.
+    """
+
+    def __init__(self, vms: Iterable[VM]):
+        self._lock = threading.Lock()
+        fields = [STAT_FIELDS[name] for name in FACETS]
+        self._combos: Counter = Counter(
+            tuple(getattr(vm, field) for field in fields) for vm in vms
+        )
+        self._tables: Dict[Tuple[Tuple[int, ...], Optional[int]], dict] = {}
+
+    @staticmethod
+    def _combo(vm: VM) -> Tuple[str, ...]:
+        return tuple(getattr(vm, STAT_FIELDS[name]) for name in FACETS)
+
+    def _table(self, filtered: Tuple[int, ...], grouped: Optional[int]) -> dict:
+        """Returns the table of counts for one query shape, deriving it from
+        the combinations on first use
+
+        Maps the filtered facets' values to a Counter of the grouped facet's
+        values, or with grouped None to the number of VMs
+
+        Complexity: O(1) once built, O(c) to build where c is the number of
+        distinct combinations"""
+        shape = (filtered, grouped)
+        table = self._tables.get(shape)
+        if table is None:
+            table = {}
+            for combo, count in self._combos.items():
+                key = tuple(combo[i] for i in filtered)
+                if grouped is None:
+                    table[key] = table.get(key, 0) + count
+                else:
+                    table.setdefault(key, Counter())[combo[grouped]] += count
+            self._tables[shape] = table
+        return table
+
+    def remove(self, vm: VM):
+        """Decrements every count the VM contributed to
+
+        Complexity: O(t) where t is the number of query shapes asked for so
+        far, at most 80: each facet grouped under each subset of filters,
+        plus the 16 totals"""
+        combo = self._combo(vm)
+        with self._lock:
+            if combo not in self._combos:
+                return
+            if self._combos[combo] == 1:
+                del self._combos[combo]
+            else:
+                self._combos[combo] -= 1
+            for (filtered, grouped), table in self._tables.items():
+                key = tuple(combo[i] for i in filtered)
+                if grouped is None:
+                    table[key] -= 1
+                    if not table[key]:
+                        del table[key]
+                    continue
+                counts = table[key]
+                counts[combo[grouped]] -= 1
+                if not counts[combo[grouped]]:
+                    del counts[combo[grouped]]
+                    if not counts:
+                        del table[key]
+
+    def counts(
+        self, filters: Dict[str, str], by: Iterable[str]
+    ) -> Tuple[int, Dict[str, Dict[str, int]]]:
+        """Counts the VMs matching every filter, grouped by each facet in by
+
+        Returns: (number of matching VMs, {facet: {value: count}}), each
+        facet's values from most to least common
+
+        Complexity: O(f + v) where f is the number of facets and v the
+        number of distinct values returned"""
+        filtered = tuple(FACETS.index(name) for name in FACETS if name in filters)
+        key = tuple(filters[FACETS[i]] for i in filtered)
+        with self._lock:
+            total = self._table(filtered, None).get(key, 0)
+            grouped = {}
+            for name in by:
+                counts = self._table(filtered, FACETS.index(name)).get(key, Counter())
+                grouped[name] = dict(counts.most_common())
+        return total, grouped
@@ -0,0 +1,114 @@
+import os
+import json
+import threading
+from typing import Callable, List, Set, Tuple
+from metrics import count_read, count_write
+
+Entry = Tuple[str, Set[int]]
+
+
+def write_json_atomic(path: str, data):
+    """Replaces a JSON file so readers see either the old or the new contents
+
+    Writes to a temporary file in the same directory, fsyncs it and renames
+    it over path, then fsyncs the directory so the rename survives a crash
+
+    Complexity: O(n) where n is the size of the encoded data"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    count_write(path, size)
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def _fsync_dir(path: str):
+    """Fsyncs the directory holding path, so a rename into it is durable"""
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class DeleteJournal:
+    """Append-only log of VM deletes not yet folded into the data files
+
+    Each delete is one JSON line {"owner": ..., "vm_ids": [...]}, appended
+    and fsync'd before the delete is acknowledged. The fsync runs outside
+    the lock, so concurrent deletes share disk flushes. A line torn by a
+    crash mid-write is ignored on reading. The lock may be replaced with a
+    cross-process one when several workers share the journal.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, owner: str, vm_ids: Set[int]):
+        """Durably records that owner deleted vm_ids
+
+        Complexity: O(m) where m is the number of vm_ids, plus one fsync"""
+        line = json.dumps({"owner": owner, "vm_ids": sorted(vm_ids)}) + "\n"
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode())
+            except OSError:
+                os.close(fd)
+                raise
+        count_write(self.path, len(line))
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _read(self) -> List[Entry]:
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+                size = f.tell()
+        except FileNotFoundError:
+            return []
+        count_read(self.path, size, len(lines))
+        entries = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            entries.append((record["owner"], set(record["vm_ids"])))
+        return entries
+
+    def entries(self) -> List[Entry]:
+        """Returns every recorded (owner, vm_ids) delete, oldest first
+
+        Complexity: O(k) where k is the size of the journal"""
+        with self.lock:
+            return self._read()
+
+    def retain(self, keep: Callable[[Entry], bool]):
+        """Replaces the journal with one holding only the entries keep accepts
+
+        The entries are written to a temporary file that is renamed over
+        the journal, so a crash mid-rewrite leaves the old journal intact
+        rather than a truncated one that has lost pending deletes
+
+        Complexity: O(k) where k is the size of the journal"""
+        with self.lock:
+            entries = [entry for entry in self._read() if keep(entry)]
+            if not os.path.exists(self.path):
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                for owner, vm_ids in entries:
+                    f.write(json.dumps({"owner": owner, "vm_ids": sorted(vm_ids)}))
+                    f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+                count_write(self.path, f.tell())
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
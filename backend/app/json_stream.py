@@ -0,0 +1,101 @@
+import re
+import json
+from typing import IO, Iterable, Iterator
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(fp: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """Yields the elements of a top-level JSON array one at a time
+
+    Reads the file in chunks and decodes one element at a time, so the whole
+    file text is never held in memory at once. An element that does not fit
+    in the buffer is retried only after the buffer has doubled, so a large
+    element is decoded a logarithmic number of times over text that sums to
+    about twice its size, rather than once per chunk.
+
+    Complexity: O(n) where n is the size of the file"""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        # Read at least as much as is already buffered past pos, so retrying
+        # a partial element costs no more than the text read since the last try
+        chunk = fp.read(max(chunk_size, len(buf) - pos))
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError("expected a JSON array")
+    pos += 1
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError("unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        if not first:
+            if buf[pos] != ",":
+                raise ValueError(f"expected ',' at offset {pos}")
+            pos += 1
+            skip_whitespace()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            after = WHITESPACE.match(buf, end).end()
+            if not eof and (after == len(buf) or buf[after] not in ",]"):
+                # A number or literal may continue in the next chunk, so only
+                # accept the element once the delimiter after it is buffered
+                fill()
+                continue
+            break
+        pos = end
+        first = False
+        yield item
+
+
+def stream_json_array(items: Iterable, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Serializes an iterable as a JSON array, yielding byte chunks
+
+    Each element is encoded as it is produced and chunks of roughly
+    chunk_size bytes are yielded, so the full body is never built in memory.
+
+    Complexity: O(n) where n is the number of elements"""
+    encoder = json.JSONEncoder(separators=(",", ":"))
+    parts = ["["]
+    size = 1
+    first = True
+    for item in items:
+        encoded = encoder.encode(item)
+        if not first:
+            parts.append(",")
+        parts.append(encoded)
+        size += len(encoded) + 1
+        first = False
+        if size >= chunk_size:
+            yield "".join(parts).encode()
+            parts = []
+            size = 0
+    parts.append("]")
+    yield "".join(parts).encode()
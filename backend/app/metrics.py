@@ -0,0 +1,172 @@
+import os
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+PREFIX = "cluster_manager_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+INF_BUCKET = 'le="+Inf"'
+COUNTERS = {
+    "file_reads_total": "Data files read from disk",
+    "file_read_bytes_total": "Bytes of data files read from disk",
+    "file_writes_total": "Data files written to disk",
+    "file_write_bytes_total": "Bytes of data files written to disk",
+    "records_parsed_total": "Records parsed from data files",
+    "jwt_verifications_total": "JWT signature verifications by result",
+    "password_verifications_total": "Password verifications at login by result",
+    "requests_rejected_total": "Requests answered 429 by the limit that refused them",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+Gauge = Tuple[str, str, Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Request latency histograms and I/O counters of this process
+
+    Latencies are kept per route, method and status in fixed buckets, so an
+    observation is one bisect and a few additions under a lock, and no
+    samples are stored. Counters are named in COUNTERS and labelled freely.
+    Gauge sources registered with add_gauges are only called when the
+    metrics are rendered. Each worker process keeps its own values.
+    """
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._latencies: Dict[Labels, List[float]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauge_sources: List[Callable[[], Iterable[Gauge]]] = []
+
+    def observe(self, route: str, method: str, status: int, seconds: float):
+        """Records the latency of one request
+
+        Complexity: O(log b) where b is the number of buckets"""
+        key = (("route", route), ("method", method), ("status", str(status)))
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts = self._latencies.get(key)
+            if counts is None:
+                # One count per bucket and one above the last, then the sum
+                # and the total count
+                counts = self._latencies[key] = [0] * (len(self.buckets) + 3)
+            counts[slot] += 1
+            counts[-2] += seconds
+            counts[-1] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Adds amount to the counter name with the given labels
+
+        Complexity: O(l log l) where l is the number of labels"""
+        if name not in COUNTERS:
+            raise KeyError(f"Unknown counter {name}")
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_gauges(self, source: Callable[[], Iterable[Gauge]]):
+        """Registers a function returning (name, help, labels, value) gauges"""
+        self._gauge_sources.append(source)
+
+    def value(self, name: str, **labels) -> float:
+        """Returns the current value of a counter, 0 if never incremented"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def clear(self):
+        """Drops every latency observation and counter"""
+        with self._lock:
+            self._latencies.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format
+
+        Gauges with the same name from any source are grouped into one family
+
+        Complexity: O(r * b + c) where r is the number of route, method and
+        status combinations seen, b the number of buckets and c the number
+        of counters"""
+        with self._lock:
+            latencies = {key: list(counts) for key, counts in self._latencies.items()}
+            counters = dict(self._counters)
+        name = f"{PREFIX}request_duration_seconds"
+        lines = [
+            f"# HELP {name} Time from receiving a request to sending its last byte",
+            f"# TYPE {name} histogram",
+        ]
+        bounds = [f'le="{bound}"' for bound in self.buckets]
+        for labels, counts in sorted(latencies.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, INF_BUCKET)} {counts[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(counts[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {counts[-1]}")
+        for counter, description in COUNTERS.items():
+            lines.append(f"# HELP {PREFIX}{counter} {description}")
+            lines.append(f"# TYPE {PREFIX}{counter} counter")
+            for (key, labels), value in sorted(counters.items()):
+                if key == counter:
+                    lines.append(f"{PREFIX}{counter}{_labels(labels)} {_number(value)}")
+        gauges: Dict[str, Tuple[str, List[str]]] = {}
+        for source in self._gauge_sources:
+            for gauge, description, labels, value in source():
+                samples = gauges.setdefault(gauge, (description, []))[1]
+                labels = tuple(sorted(labels.items()))
+                samples.append(f"{PREFIX}{gauge}{_labels(labels)} {_number(value)}")
+        for gauge, (description, samples) in gauges.items():
+            lines.append(f"# HELP {PREFIX}{gauge} {description}")
+            lines.append(f"# TYPE {PREFIX}{gauge} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def count_read(path: str, size: int, records: int = 0):
+    """Counts one read of a data file, its size and the records parsed from it"""
+    name = os.path.basename(path)
+    METRICS.inc("file_reads_total", file=name)
+    METRICS.inc("file_read_bytes_total", size, file=name)
+    if records:
+        METRICS.inc("records_parsed_total", records, file=name)
+
+
+def count_write(path: str, size: int):
+    """Counts one write of a data file and the bytes written"""
+    name = os.path.basename(path)
+    METRICS.inc("file_writes_total", file=name)
+    METRICS.inc("file_write_bytes_total", size, file=name)
@@ -0,0 +1,190 @@
+import os
+import hmac
+import base64
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+# Hashes are stored as "$"-separated fields starting with the scheme, so the
+# cost parameters travel with each hash and can be raised later:
+#   scrypt$<n>$<r>$<p>$<salt>$<key>
+#   pbkdf2_sha256$<iterations>$<salt>$<key>
+# with the salt and key in unpadded base64. Hashes from before the KDF are a
+# bare SHA-256 hex digest.
+SCRYPT_PARAMS = (2**14, 8, 1)
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+KEY_BYTES = 32
+# scrypt needs OpenSSL 1.1 or later; PBKDF2 is always available
+SCHEME = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+LEGACY_LENGTH = 64
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _derive(scheme: str, params: Tuple[int, ...], password: str, salt: bytes) -> bytes:
+    """Runs the KDF; takes tens of milliseconds by design"""
+    if scheme == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES
+        )
+    (iterations,) = params
+    return hashlib.pbkdf2_hmac(
+        "sha256", password.encode(), salt, iterations, dklen=KEY_BYTES
+    )
+
+
+def _current_params() -> Tuple[int, ...]:
+    return SCRYPT_PARAMS if SCHEME == "scrypt" else (PBKDF2_ITERATIONS,)
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    """Hashes a password with the current KDF and a random salt"""
+    salt = salt or os.urandom(SALT_BYTES)
+    params = _current_params()
+    key = _derive(SCHEME, params, password, salt)
+    return "$".join((SCHEME, *map(str, params), _b64(salt), _b64(key)))
+
+
+def needs_upgrade(stored: str) -> bool:
+    """Returns True if stored is a legacy hash or was made with another KDF
+    or weaker parameters than the current ones"""
+    fields = stored.split("$")
+    return fields[0] != SCHEME or tuple(map(int, fields[1:-2])) != _current_params()
+
+
+def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Checks a password against a stored hash of any supported format
+
+    Every call runs the KDF at least once, so a missing, malformed or legacy
+    hash takes as long to reject as a current one, and unknown usernames
+    cannot be told apart from known ones by timing.
+
+    Returns: (whether the password matches, a new hash to store in place of
+    a matching hash that needs_upgrade, else None)
+
+    Complexity: one or two KDF runs"""
+    matches = derived = False
+    fields = (stored or "").split("$")
+    if len(fields) == 1 and len(fields[0]) == LEGACY_LENGTH:
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        matches = hmac.compare_digest(digest, fields[0])
+    elif fields[0] in ("scrypt", "pbkdf2_sha256") and len(fields) > 3:
+        try:
+            params = tuple(map(int, fields[1:-2]))
+            salt, key = _unb64(fields[-2]), _unb64(fields[-1])
+            matches = hmac.compare_digest(
+                _derive(fields[0], params, password, salt), key
+            )
+            derived = True
+        except ValueError:
+            pass
+    if matches and needs_upgrade(stored):
+        return True, hash_password(password)
+    if not derived:
+        hash_password(password, salt=bytes(SALT_BYTES))
+    return matches, None
+
+
+class VerifierBusy(Exception):
+    """Raised when too many password verifications are already waiting"""
+
+
+class VerifierTimeout(VerifierBusy):
+    """Raised when a password verification did not finish in time"""
+
+
+class PasswordVerifier:
+    """Runs password verifications in a bounded pool of worker processes
+
+    The KDF is deliberately slow, so it runs outside the request threads:
+    at most `workers` verifications run at once, in worker processes, and
+    at most max_pending may be running or queued;
+    further requests are refused with VerifierBusy instead of piling up
+    behind them. A caller waits at most timeout seconds, queueing included,
+    before VerifierTimeout. With workers=0, verifications run inline in the
+    calling thread.
+
+    The pool is started on first use in each process, so server workers
+    forked from a preloaded master each get their own.
+
+    Like any multiprocessing pool that does not fork, each worker process
+    runs the program's __main__ module again, under the name __mp_main__,
+    before it takes work. Entry points that use a verifier must therefore
+    start their server only under if __name__ == "__main__"; otherwise each
+    worker starts a server of its own instead of verifying, the pool breaks
+    and every login is refused with VerifierBusy.
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = 64, timeout: float = 5.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of verifications running or queued"""
+        return self._pending
+
+    def _executor(self) -> ProcessPoolExecutor:
+        """Returns this process's pool, starting it if needed; must hold the
+        lock"""
+        if self._pool is None or self._pool_pid != os.getpid():
+            # Forking a threaded server is unsafe, so workers come from a
+            # fork server that has preloaded this module; each one still
+            # re-imports the server's __main__ as __mp_main__ (see above)
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+
+    def verify(
+        self, password: str, stored: Optional[str]
+    ) -> Tuple[bool, Optional[str]]:
+        """Verifies password against stored in the pool; see verify_password
+
+        Raises VerifierBusy if max_pending verifications are outstanding and
+        VerifierTimeout if the result takes longer than timeout"""
+        if not self.workers:
+            return verify_password(password, stored)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise VerifierBusy("Too many password verifications in progress")
+            try:
+                future = self._executor().submit(verify_password, password, stored)
+            except BrokenProcessPool:
+                self._pool = None
+                raise VerifierBusy("Password verification pool restarting")
+            self._pending += 1
+        future.add_done_callback(self._done)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise VerifierTimeout("Password verification timed out")
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                self._pool = None
+            raise VerifierBusy("Password verification pool restarting")
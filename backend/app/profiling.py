@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import hmac
+import time
+import cProfile
+import itertools
+import threading
+from collections import Counter
+from typing import Optional
+from flask import Flask, g, request
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval
+
+    Each sample is the thread's current frames joined root first with ";",
+    the collapsed stack format read by flamegraph tools.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        """Stops sampling and returns the sampled stacks with their counts"""
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+class RequestProfiler:
+    """Profiles selected requests and keeps their profiles in a directory
+
+    A request is profiled if its X-Profile header matches the configured
+    token, or if it is one of every sample_rate requests. A profiled request
+    runs under cProfile and a stack sampler from before its view is called
+    until the last byte of its body is produced, and leaves two files named
+    after the response's X-Profile-Id header: <id>.pstats, readable with
+    the pstats module or snakeviz, and <id>.collapsed, one "stack count"
+    line per sampled stack for flamegraph.pl or speedscope. Only the newest
+    max_profiles profiles are kept.
+
+    One request per process is profiled at a time; requests arriving while
+    a profile runs are served unprofiled. Without install() no hook is
+    registered and requests pay nothing.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        token: Optional[str] = None,
+        sample_rate: int = 0,
+        max_profiles: int = 100,
+        interval: float = 0.001,
+    ):
+        if max_profiles < 1:
+            raise ValueError("max_profiles must be at least 1")
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.interval = interval
+        self._requests = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def install(self, app: Flask):
+        """Registers the hooks that profile requests on app"""
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._abandon)
+
+    def _wanted(self) -> bool:
+        """Returns True if the current request asked for, or was sampled for,
+        a profile"""
+        header = request.headers.get(PROFILE_HEADER)
+        if self.token and header and hmac.compare_digest(header, self.token):
+            return True
+        return self.sample_rate > 0 and next(self._requests) % self.sample_rate == 0
+
+    def _start(self):
+        if not self._wanted() or not self._busy.acquire(blocking=False):
+            return
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        profile = cProfile.Profile()
+        sampler.start()
+        profile.enable()
+        g.request_profile = (profile, sampler)
+
+    def _finish(self, response):
+        running = g.pop("request_profile", None)
+        if running is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        profile_id = f"{time.time_ns()}-{os.getpid()}-{request.method}-{name}"
+        response.headers[PROFILE_ID_HEADER] = profile_id
+        if not response.is_streamed:
+            self._write(profile_id, *running)
+            return response
+
+        def profiled(chunks):
+            try:
+                yield from chunks
+            finally:
+                self._write(profile_id, *running)
+
+        response.response = profiled(response.response)
+        return response
+
+    def _abandon(self, exc):
+        """Saves a profile whose response was never finished, for example
+        because another after_request hook raised"""
+        running = g.pop("request_profile", None)
+        if running is not None:
+            self._write(
+                f"{time.time_ns()}-{os.getpid()}-{request.method}-aborted", *running
+            )
+
+    def _write(self, profile_id: str, profile: cProfile.Profile, sampler: StackSampler):
+        """Stops profiling, writes both profile files and drops the oldest"""
+        try:
+            profile.disable()
+            stacks = sampler.stop()
+            path = os.path.join(self.directory, profile_id)
+            profile.dump_stats(path + ".pstats")
+            with open(path + ".collapsed", "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._rotate()
+        finally:
+            self._busy.release()
+
+    def _rotate(self):
+        """Deletes the oldest profiles beyond max_profiles
+
+        Only files named like the profiles written here count; other .pstats
+        files in the directory are left alone
+
+        Complexity: O(p log p) where p is the number of files in the directory"""
+        profiles = []
+        for filename in os.listdir(self.directory):
+            profile_id, extension = os.path.splitext(filename)
+            started = profile_id.split("-", 1)[0]
+            if extension == ".pstats" and started.isdigit():
+                profiles.append((int(started), profile_id))
+        profiles.sort()
+        for _, profile_id in profiles[: -self.max_profiles]:
+            for suffix in (".pstats", ".collapsed"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,149 @@
+from collections.abc import MutableMapping, ValuesView
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+
+
+class Tombstones:
+    """Append-only record of the keys removed from a mapping and its copies
+
+    Each key remembers its position in the record. A mapping that has seen
+    the first r removals hides the keys at positions below r, so copies
+    share one record and a copy is just a count: removing a key from the
+    newest copy appends it without changing what older copies hide.
+    """
+
+    def __init__(self, positions: Optional[Dict[Hashable, int]] = None):
+        self._positions: Dict[Hashable, int] = positions if positions else {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def hides(self, key, removed: int) -> bool:
+        """Returns True if key is among the first removed keys
+
+        Complexity: O(1)"""
+        position = self._positions.get(key)
+        return position is not None and position < removed
+
+    def fork(self, removed: int) -> "Tombstones":
+        """Returns a new record holding only the first removed keys, for a
+        copy that removes keys after a newer copy already did
+
+        Complexity: O(removed)"""
+        return Tombstones(
+            {key: pos for key, pos in self._positions.items() if pos < removed}
+        )
+
+    def append(self, key, removed: int) -> bool:
+        """Records key as removal number removed, if no other copy has
+        recorded one there yet
+
+        Returns: False if the record already holds more than removed keys
+
+        Complexity: O(1)"""
+        if removed != len(self._positions):
+            return False
+        self._positions[key] = removed
+        return True
+
+
+class PrunedMapping(MutableMapping):
+    """Read-only mapping that supports deletes and O(1) copies
+
+    Subclasses locate keys in the underlying data: _locate returns a handle
+    for a key, or None if it is absent, _value turns a handle into its value
+    and _handles iterates over (key, handle) pairs in order, so iterating
+    the keys never builds values. Deleting a key only appends it to the
+    Tombstones shared with every copy, so copy() can share them and removing
+    k keys from a copy costs O(k) rather than copying every entry.
+    """
+
+    def __init__(self, tombstones: Optional[Tombstones] = None, removed: int = 0):
+        self._tombstones = tombstones if tombstones is not None else Tombstones()
+        self._removed = removed
+
+    def _locate(self, key):
+        raise NotImplementedError
+
+    def _value(self, handle):
+        raise NotImplementedError
+
+    def _handles(self) -> Iterator[Tuple[Hashable, object]]:
+        raise NotImplementedError
+
+    def _size(self) -> int:
+        raise NotImplementedError
+
+    def _handle(self, key):
+        if self._tombstones.hides(key, self._removed):
+            return None
+        return self._locate(key)
+
+    def __getitem__(self, key):
+        handle = self._handle(key)
+        if handle is None:
+            raise KeyError(key)
+        return self._value(handle)
+
+    def __contains__(self, key) -> bool:
+        return self._handle(key) is not None
+
+    def __iter__(self) -> Iterator:
+        hides = self._tombstones.hides
+        removed = self._removed
+        return (key for key, _ in self._handles() if not hides(key, removed))
+
+    def __len__(self) -> int:
+        return self._size() - self._removed
+
+    def __setitem__(self, key, value):
+        raise TypeError(f"{type(self).__name__} only supports deletes")
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if not self._tombstones.append(key, self._removed):
+            # A newer copy removed other keys after this one's; stop sharing
+            self._tombstones = self._tombstones.fork(self._removed)
+            self._tombstones.append(key, self._removed)
+        self._removed += 1
+
+    def values(self):
+        return _PrunedValues(self)
+
+
+class _PrunedValues(ValuesView):
+    """Values of a PrunedMapping, read without a lookup per key"""
+
+    def __iter__(self):
+        mapping = self._mapping
+        hides = mapping._tombstones.hides
+        removed = mapping._removed
+        value = mapping._value
+        for key, handle in mapping._handles():
+            if not hides(key, removed):
+                yield value(handle)
+
+
+class PrunedDict(PrunedMapping):
+    """PrunedMapping over a dict, which is never modified"""
+
+    def __init__(
+        self, data: dict, tombstones: Optional[Tombstones] = None, removed: int = 0
+    ):
+        super().__init__(tombstones, removed)
+        self._data = data
+
+    def _locate(self, key):
+        return key if key in self._data else None
+
+    def _value(self, key):
+        return self._data[key]
+
+    def _handles(self) -> Iterator[Tuple[Hashable, object]]:
+        return ((key, key) for key in self._data)
+
+    def _size(self) -> int:
+        return len(self._data)
+
+    def copy(self):
+        return PrunedDict(self._data, self._tombstones, self._removed)
@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# Requests per second refilled and the burst allowed, per client and route,
+# for each class of route
+DEFAULT_LIMITS = {
+    "login": (1.0, 10),
+    "write": (2.0, 20),
+    "read": (50.0, 200),
+}
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[float, int]]:
+    """Parses a RATE_LIMITS value such as "read=50/200,login=1/10" into
+    {class: (rate, burst)}, starting from DEFAULT_LIMITS
+
+    "off" disables every limit and a rate of 0 disables one class. Raises
+    ValueError for malformed values"""
+    limits = dict(DEFAULT_LIMITS)
+    if not spec:
+        return limits
+    if spec.strip() == "off":
+        return {}
+    for item in spec.split(","):
+        try:
+            name, value = item.split("=")
+            rate, _, burst = value.partition("/")
+            rate = float(rate)
+            burst = int(burst) if burst else max(1, int(rate))
+        except ValueError:
+            raise ValueError(
+                f"invalid rate limit {item.strip()!r}, expected class=rate/burst"
+            )
+        if rate <= 0:
+            limits.pop(name.strip(), None)
+        else:
+            limits[name.strip()] = (rate, burst)
+    return limits
+
+
+class RateLimiter:
+    """Token buckets per (route, client) key, for threaded servers
+
+    A bucket holds up to burst tokens and refills at rate per second; each
+    admitted request takes one. A bucket is only a [tokens, last update]
+    pair, refilled lazily when its key is next seen, so idle clients cost
+    nothing but their entry. Entries live in shards, each an LRU dict with
+    its own lock, so concurrent requests for different clients rarely wait
+    on each other; the least recently seen keys are dropped past max_keys,
+    which only forgets buckets that have mostly refilled anyway.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, int]],
+        max_keys: int = 100_000,
+        shards: int = 16,
+        clock=time.monotonic,
+    ):
+        self.limits = limits
+        self.clock = clock
+        self._shard_size = max(1, max_keys // shards)
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+
+    def acquire(self, limit: str, key: Hashable) -> float:
+        """Takes a token from key's bucket under the named limit
+
+        Returns: 0 if the request is admitted, else the seconds until the
+        bucket holds a token again; unknown limits admit everything
+
+        Complexity: O(1)"""
+        rule = self.limits.get(limit)
+        if rule is None:
+            return 0.0
+        rate, burst = rule
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            now = self.clock()
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [float(burst), now]
+                if len(buckets) > self._shard_size:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+    def clear(self):
+        """Forgets every bucket"""
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+    def __len__(self) -> int:
+        """Number of buckets tracked"""
+        return sum(len(buckets) for _, buckets in self._shards)
+
+
+class ConcurrencyLimit:
+    """Caps how many requests of a kind run at once, without queueing
+
+    try_enter never blocks: a request over the cap is turned away at once,
+    so write requests cannot pile up threads behind a slow rewrite. A limit
+    of 0 admits everything.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+    def try_enter(self) -> bool:
+        """Takes a slot if one is free; every True must be paired with leave()"""
+        return self._slots is None or self._slots.acquire(blocking=False)
+
+    def leave(self):
+        if self._slots is not None:
+            self._slots.release()
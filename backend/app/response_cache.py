@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+Entry = Tuple[bytes, bool]
+
+
+def _group(key: tuple) -> tuple:
+    """Returns the invalidation group of a cache key
+
+    Keys start with "all", ("user", username) or ("vm", vm_id); anything
+    after that names the encoding of the same data."""
+    return key[:1] if key[0] == "all" else key[:2]
+
+
+class ResponseCache:
+    """Byte-level LRU cache of ready-to-send response bodies
+
+    Holds encoded bodies for the fleet listing ("all", ...), each user's
+    listing ("user", username, ...) and each single VM ("vm", vm_id, ...),
+    all built from one data version. A lookup at any other version empties
+    the cache, since the data changed under it in some unknown way; a
+    delete reported through invalidate() instead drops only the fleet
+    listing, the owner's listings and the deleted VMs' entries.
+
+    The total size of the bodies is capped at max_bytes, evicting the least
+    recently used entries first, and bodies larger than max_entry_bytes are
+    never stored. All operations take a single lock.
+    """
+
+    def __init__(
+        self, max_bytes: int = 64 << 20, max_entry_bytes: Optional[int] = None
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self._size = 0
+        self._entries: "OrderedDict[tuple, Entry]" = OrderedDict()
+        self._groups: Dict[tuple, set] = {}
+
+    def _reset(self, version):
+        """Empties the cache for a new data version; must hold the lock"""
+        self._entries.clear()
+        self._groups.clear()
+        self._size = 0
+        self._version = version
+
+    def _sync(self, version):
+        """Empties the cache if it was built for a different data version
+
+        Must be called with the lock held"""
+        if version != self._version:
+            self._reset(version)
+
+    def _discard(self, key: tuple):
+        """Removes one entry; must be called with the lock held"""
+        body, _ = self._entries.pop(key)
+        self._size -= len(body)
+        keys = self._groups[_group(key)]
+        keys.discard(key)
+        if not keys:
+            del self._groups[_group(key)]
+
+    def get(self, key: tuple, version) -> Optional[Entry]:
+        """Returns the cached (body, gzipped) pair for key, or None on a miss
+
+        Complexity: O(1) Dictionary lookup and LRU reordering"""
+        with self._lock:
+            self._sync(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, version, body: bytes, gzipped: bool = False) -> Entry:
+        """Stores a body built from the given data version and returns it
+
+        The body is not stored if the data changed while it was being built
+        or if it is larger than max_entry_bytes
+
+        Complexity: O(1) plus one step per evicted entry"""
+        entry = (body, gzipped)
+        if len(body) > self.max_entry_bytes:
+            return entry
+        with self._lock:
+            if version != self._version:
+                return entry
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = entry
+            self._groups.setdefault(_group(key), set()).add(key)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def get_or_build(
+        self, key: tuple, version, build: Callable[[], Optional[Entry]]
+    ) -> Optional[Entry]:
+        """Returns the cached body for key, building and storing it on a miss
+
+        build returns a (body, gzipped) pair, or None if there is nothing to
+        cache
+
+        Complexity: O(1) on a hit"""
+        entry = self.get(key, version)
+        if entry is not None:
+            return entry
+        built = build()
+        if built is None:
+            return None
+        return self.put(key, version, *built)
+
+    def tee(self, key: tuple, version, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yields chunks unchanged and stores their concatenation when done
+
+        Lets a streamed body fill the cache without being built in memory
+        first; collection stops as soon as it exceeds max_entry_bytes
+
+        Complexity: O(n) where n is the size of the body"""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            self.put(key, version, b"".join(parts))
+
+    def invalidate(self, previous_version, version, owner: str, vm_ids: Iterable[int]):
+        """Drops the entries affected by deleting vm_ids from owner
+
+        Takes in the data versions before and after the delete. If the cache
+        holds the version before the delete, only the fleet listing, the
+        owner's listings and the deleted VMs' entries are dropped and the
+        rest is carried over to the new version; otherwise it is emptied.
+
+        Complexity: O(k) where k is the number of dropped entries"""
+        with self._lock:
+            if self._version != previous_version:
+                self._reset(version)
+                return
+            groups = [("all",), ("user", owner)]
+            groups.extend(("vm", vm_id) for vm_id in vm_ids)
+            for group in groups:
+                for key in list(self._groups.get(group, ())):
+                    self._discard(key)
+                    self.invalidations += 1
+            self._version = version
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        with self._lock:
+            self._reset(None)
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def stats(self) -> dict:
+        """Returns the current size, counters and hit ratio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,79 @@
+import gzip
+import json
+from typing import Iterable, Tuple
+from vm_model import VM_FIELDS
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR = "application/vnd.cluster-manager.columnar+json"
+MSGPACK = "application/msgpack"
+MSGPACK_ALIASES = (MSGPACK, "application/x-msgpack")
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+def choose_format(accept) -> str:
+    """Picks the response mimetype from a request's Accept header
+
+    Takes in werkzeug's MIMEAccept; MessagePack is only offered when the
+    msgpack package is installed. Plain JSON wins ties and is the default.
+
+    Complexity: O(1)"""
+    offered = [JSON, COLUMNAR]
+    if msgpack is not None:
+        offered.extend(MSGPACK_ALIASES)
+    best = accept.best_match(offered, default=JSON)
+    return MSGPACK if best in MSGPACK_ALIASES else best
+
+
+def accepts_gzip(accept_encodings) -> bool:
+    """Returns True if the request's Accept-Encoding allows gzip"""
+    return accept_encodings["gzip"] > 0
+
+
+def as_record(item) -> dict:
+    """Returns a VM dictionary for either a VM dictionary or a VM object"""
+    return item if isinstance(item, dict) else item.to_dict()
+
+
+def dumps(obj) -> bytes:
+    """Serializes obj as compact JSON, converting VM objects on the way
+
+    Complexity: O(n) where n is the size of the encoded body"""
+    return json.dumps(obj, separators=(",", ":"), default=as_record).encode()
+
+
+def to_columns(records: Iterable) -> dict:
+    """Converts VM records to a column-oriented layout with keys listed once
+
+    Takes in VM dictionaries or VM objects
+
+    Returns {"columns": [...], "rows": [[...], ...]}
+
+    Complexity: O(n) where n is the number of records"""
+    rows = []
+    for item in records:
+        record = as_record(item)
+        rows.append([record.get(name) for name in VM_FIELDS])
+    return {"columns": list(VM_FIELDS), "rows": rows}
+
+
+def encode(records: Iterable, mimetype: str, compress: bool) -> Tuple[bytes, bool]:
+    """Serializes records in the negotiated format, gzipping if worthwhile
+
+    Returns: (body, whether the body is gzip-compressed)
+
+    Complexity: O(n) where n is the size of the encoded body"""
+    if mimetype == COLUMNAR:
+        body = dumps(to_columns(records))
+    elif mimetype == MSGPACK:
+        body = msgpack.packb(to_columns(records))
+    else:
+        body = dumps(list(records))
+    if compress and len(body) >= GZIP_MIN_SIZE:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), True
+    return body, False
@@ -0,0 +1,253 @@
+import re
+import threading
+from bisect import bisect_left
+from operator import attrgetter
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from vm_model import VM
+from vm_query import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, encode_cursor
+
+# Matches are counted up to this many, so a one-letter query matching the
+# whole fleet still costs no more than a few pages
+COUNT_LIMIT = 1000
+WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+@dataclass
+class SearchQuery:
+    """Parsed search request"""
+
+    q: str = ""
+    offset: int = 0
+    limit: int = DEFAULT_LIMIT
+    id_range: Optional[Tuple[int, int]] = None
+
+    @staticmethod
+    def from_args(args) -> "SearchQuery":
+        """Builds a search from request arguments
+
+        Accepts q, limit, cursor, min_id and max_id. Raises ValueError for
+        malformed values, or a cursor issued for a different q.
+
+        Complexity: O(1)"""
+        q = args.get("q", "").strip()
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        offset = 0
+        if args.get("cursor"):
+            cursor_q, offset = decode_cursor(args["cursor"])
+            if cursor_q != q or offset < 0:
+                raise ValueError("cursor does not match q")
+        id_range = None
+        if args.get("min_id") or args.get("max_id"):
+            id_range = (int(args.get("min_id", 0)), int(args.get("max_id", 2**63)))
+        return SearchQuery(q=q, offset=offset, limit=limit, id_range=id_range)
+
+    def next_cursor(self) -> str:
+        """Returns the cursor of the page after this one"""
+        return encode_cursor((self.q, self.offset + self.limit))
+
+
+def _lower(value: str) -> str:
+    """Lowercases value, returning value itself if it already is, so the
+    index shares the VM's string instead of holding a copy"""
+    lowered = value.lower()
+    return value if lowered == value else lowered
+
+
+class _Terms:
+    """Sorted distinct terms, each with the sorted vm_ids containing it
+
+    A term held by a single VM maps to its bare vm_id rather than a list,
+    since most cluster names are unique."""
+
+    def __init__(self):
+        self.sorted: List[str] = []
+        self.postings: Dict[str, Union[int, List[int]]] = {}
+
+    def add(self, term: str, vm_id: int):
+        """Adds vm_id under term; vm_ids must be added in increasing order
+
+        Complexity: O(1)"""
+        postings = self.postings.get(term)
+        if postings is None:
+            self.postings[term] = vm_id
+        elif type(postings) is int:
+            if postings != vm_id:
+                self.postings[term] = [postings, vm_id]
+        elif postings[-1] != vm_id:
+            postings.append(vm_id)
+
+    def freeze(self):
+        """Sorts the terms once every VM has been added"""
+        self.sorted = sorted(self.postings)
+
+    def ids(self, term: str) -> Sequence[int]:
+        """Returns the sorted vm_ids holding term"""
+        postings = self.postings.get(term, ())
+        return (postings,) if type(postings) is int else postings
+
+    def discard(self, term: str, vm_id: int):
+        """Removes vm_id from term, dropping the term once nothing has it
+
+        Complexity: O(log t + p) where t is the number of terms and p the
+        number of VMs with the term"""
+        postings = self.postings.get(term)
+        if type(postings) is list:
+            pos = bisect_left(postings, vm_id)
+            if pos < len(postings) and postings[pos] == vm_id:
+                del postings[pos]
+            if len(postings) > 1:
+                return
+            if postings:
+                self.postings[term] = postings[0]
+                return
+        elif postings != vm_id:
+            return
+        del self.postings[term]
+        pos = bisect_left(self.sorted, term)
+        if pos < len(self.sorted) and self.sorted[pos] == term:
+            del self.sorted[pos]
+
+    def with_prefix(self, prefix: str) -> Iterator[str]:
+        """Yields the terms starting with prefix in sorted order
+
+        Complexity: O(log t) to find the first, then O(1) per term"""
+        terms = self.sorted
+        for pos in range(bisect_left(terms, prefix), len(terms)):
+            if not terms[pos].startswith(prefix):
+                return
+            yield terms[pos]
+
+
+class SearchIndex:
+    """Ranked search over vm_ids, cluster names, owners and podboxes
+
+    Keeps the vm_ids in a sorted list and, for the text fields, two sorted
+    term tables with postings: one of whole lowercased field values and one
+    of the words after the first in each cluster name, so "prod" finds
+    "web-prod-1". A query is matched by bisecting these tables, never by
+    scanning the VMs, and results come out in rank order:
+
+    0. vm_id equal to the query, or a field equal to it
+    1. vm_id starting with the query, or a field starting with it
+    2. a later word of a cluster name starting with it
+
+    Within a rank, vm_ids come shortest first, values alphabetically (so a
+    value precedes its longer extensions), and VMs sharing a value by
+    vm_id. Deleted VMs are removed in place.
+    """
+
+    def __init__(self, vms: Iterable[VM]):
+        self._lock = threading.Lock()
+        vms = sorted(vms, key=attrgetter("vm_id"))
+        self._ids: List[int] = [vm.vm_id for vm in vms]
+        self._values = _Terms()
+        self._words = _Terms()
+        add_value = self._values.add
+        add_word = self._words.add
+        for vm in vms:
+            for value, words in self._terms(vm):
+                add_value(value, vm.vm_id)
+                for word in words:
+                    add_word(word, vm.vm_id)
+        self._values.freeze()
+        self._words.freeze()
+
+    @staticmethod
+    def _terms(vm: VM) -> Tuple[Tuple[str, List[str]], ...]:
+        """Returns each searchable field value with its later words"""
+        name = _lower(vm.deployedclustername)
+        return (
+            (name, [word for word in WORD_SPLIT.split(name)[1:] if word]),
+            (_lower(vm.deployedclusterowner), []),
+            (_lower(vm.podbox), []),
+        )
+
+    def remove(self, vm: VM):
+        """Drops a VM from every table
+
+        Complexity: O(log n + p) where p is the number of VMs sharing one of
+        its values"""
+        with self._lock:
+            pos = bisect_left(self._ids, vm.vm_id)
+            if pos == len(self._ids) or self._ids[pos] != vm.vm_id:
+                return
+            del self._ids[pos]
+            for value, words in self._terms(vm):
+                self._values.discard(value, vm.vm_id)
+                for word in words:
+                    self._words.discard(word, vm.vm_id)
+
+    def _id_prefix(self, digits: str) -> Iterator[int]:
+        """Yields the vm_ids whose decimal form starts with, but is longer
+        than, digits, shortest first; each length is one bisected range of
+        the sorted ids"""
+        if digits.startswith("0"):
+            return
+        base = int(digits)
+        width = 10
+        ids = self._ids
+        while ids and base * width <= ids[-1]:
+            low, high = base * width, (base + 1) * width
+            pos = bisect_left(ids, low)
+            while pos < len(ids) and ids[pos] < high:
+                yield ids[pos]
+                pos += 1
+            width *= 10
+
+    def _ranked(self, q: str) -> Iterator[Sequence[int]]:
+        """Yields runs of matching vm_ids in rank order, possibly repeated"""
+        if q.isdigit():
+            pos = bisect_left(self._ids, int(q))
+            if pos < len(self._ids) and self._ids[pos] == int(q):
+                yield (self._ids[pos],)
+        yield self._values.ids(q)
+        if q.isdigit():
+            yield self._id_prefix(q)
+        for value in self._values.with_prefix(q):
+            if value != q:
+                yield self._values.ids(value)
+        for word in self._words.with_prefix(q):
+            yield self._words.ids(word)
+
+    def search(
+        self,
+        q: str,
+        offset: int = 0,
+        limit: int = 50,
+        id_range: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[List[int], int, bool]:
+        """Returns one page of matching vm_ids
+
+        An empty q matches every VM in vm_id order. With id_range, only
+        vm_ids from its first to its last value inclusive match.
+
+        Returns: (vm_ids on the page, number of matches, whether that number
+        is exact; it stops at COUNT_LIMIT or the end of the page, whichever
+        is larger)
+
+        Complexity: O(log n + offset + limit + COUNT_LIMIT)"""
+        q = q.strip().lower()
+        counted = max(COUNT_LIMIT, offset + limit)
+        low, high = id_range or (None, None)
+        seen = set()
+        page = []
+        with self._lock:
+            if q:
+                runs = self._ranked(q)
+            else:
+                start = bisect_left(self._ids, low) if id_range else 0
+                stop = start + counted + 1
+                runs = [self._ids[start:stop]]
+            for run in runs:
+                for vm_id in run:
+                    if vm_id in seen or (id_range and not low <= vm_id <= high):
+                        continue
+                    if len(seen) == counted:
+                        return page, counted, False
+                    seen.add(vm_id)
+                    if len(seen) > offset and len(page) < limit:
+                        page.append(vm_id)
+        return page, len(seen), True
@@ -0,0 +1,109 @@
+"""Production entry point running the API in pre-forked worker processes
+
+The master loads and indexes the user, VM and credential data once, then
+forks the workers, which inherit those structures copy-on-write. All
+workers accept connections from one listening socket. Deletes are
+coordinated through a SharedGeneration, so a VM deleted by one worker
+disappears from every other worker's in-memory index without re-reading
+the data file. The master restarts workers that exit and stops them all on
+SIGINT or SIGTERM.
+
+Run from the backend/app directory:
+
+    python serve.py --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+import os
+import gc
+import sys
+import signal
+import socket
+import argparse
+from werkzeug.serving import make_server
+from app import CHANGE_FEED, app
+from auth_controller import VMAuth
+from shared_generation import SharedGeneration
+from user_model import REPOSITORY
+from vm_query import VMQuery
+
+DEFAULT_WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+def preload():
+    """Loads every shared structure in the master before forking
+
+    Builds the repository index, the query and search indexes, the fleet
+    statistics and the credential index, switches the repository to cross-process change
+    tracking and starts the change feed at the loaded version, so every
+    worker serves deltas from the same point, then freezes the garbage
+    collector's view of them so collections in the workers do not touch, and
+    therefore copy, the shared pages"""
+    REPOSITORY.query_vms(VMQuery(limit=1))
+    REPOSITORY.search_vms("", limit=1)
+    REPOSITORY.fleet_stats({}, ())
+    len(VMAuth.CREDENTIALS)
+    REPOSITORY.share(SharedGeneration())
+    CHANGE_FEED.start(REPOSITORY.version)
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(sock: socket.socket, host: str, port: int):
+    """Serves requests on the inherited listening socket until killed"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+def spawn(sock: socket.socket, host: str, port: int) -> int:
+    """Forks one worker and returns its pid"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock, host, port)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    preload()
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.set_inheritable(True)
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(args.workers):
+        workers.add(spawn(sock, args.host, args.port))
+    print(
+        f"Serving on http://{args.host}:{args.port} with {args.workers} workers",
+        file=sys.stderr,
+    )
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            workers.add(spawn(sock, args.host, args.port))
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
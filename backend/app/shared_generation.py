@@ -0,0 +1,95 @@
+import ctypes
+import multiprocessing
+from typing import Iterable, Optional, Set, Tuple
+
+DELETE_LOG_SIZE = 65536
+
+
+class SharedGeneration:
+    """Change counter and recent-deletion log shared by forked workers
+
+    Lives in anonymous shared memory created before the workers are forked,
+    so every worker reads and writes the same values. Each delete bumps the
+    generation, records the new data version and appends the deleted vm_ids
+    to a fixed-size ring, letting the other workers replay it in memory
+    instead of re-reading the data file. The stamp of the last compacted
+    data file tells them a rewrite carried no other changes. The lock is a
+    cross-process RLock that also serializes deletes and compactions, so no
+    worker ever rewrites the data file from a stale index.
+    """
+
+    def __init__(self, capacity: int = DELETE_LOG_SIZE, version: int = 0):
+        ctx = multiprocessing.get_context("fork")
+        self.capacity = capacity
+        self.lock = ctx.RLock()
+        self._generation = ctx.RawValue(ctypes.c_uint64, 0)
+        self._version = ctx.RawValue(ctypes.c_int64, version)
+        self._count = ctx.RawValue(ctypes.c_uint64, 0)
+        self._log_ids = ctx.RawArray(ctypes.c_int64, capacity)
+        self._log_generations = ctx.RawArray(ctypes.c_uint64, capacity)
+        self._compacted_stamp = ctx.RawArray(ctypes.c_int64, 3)
+
+    @property
+    def generation(self) -> int:
+        """Number of deletes published so far
+
+        Complexity: O(1) A single shared memory read"""
+        return self._generation.value
+
+    @property
+    def version(self) -> int:
+        """Data version published by the latest delete, or the initial version"""
+        return self._version.value
+
+    @property
+    def compacted_stamp(self) -> Optional[Tuple[int, int, int]]:
+        """File stamp written by the latest compaction in any worker"""
+        stamp = tuple(self._compacted_stamp)
+        return stamp if any(stamp) else None
+
+    def record_compaction(self, stamp: Tuple[int, int, int]):
+        """Records the stamp of a data file rewritten without data changes, so
+        other workers adopt it instead of re-reading the file"""
+        with self.lock:
+            self._compacted_stamp[:] = stamp
+
+    def publish(self, vm_ids: Iterable[int], version: int) -> int:
+        """Records a delete and returns the new generation
+
+        Complexity: O(m) where m is the number of deleted vm_ids"""
+        with self.lock:
+            generation = self._generation.value + 1
+            count = self._count.value
+            for vm_id in vm_ids:
+                slot = count % self.capacity
+                self._log_ids[slot] = vm_id
+                self._log_generations[slot] = generation
+                count += 1
+            self._count.value = count
+            self._version.value = version
+            self._generation.value = generation
+            return generation
+
+    def changes_since(self, generation: int) -> Optional[Tuple[int, int, Set[int]]]:
+        """Returns the vm_ids deleted after the given generation
+
+        Returns: (current generation, current version, set of vm_ids), or None
+        if the ring no longer holds every delete since that generation
+
+        Complexity: O(k) where k is the number of vm_ids deleted since"""
+        with self.lock:
+            current = self._generation.value
+            vm_ids = set()
+            count = self._count.value
+            oldest = max(0, count - self.capacity)
+            position = count - 1
+            while position >= oldest:
+                slot = position % self.capacity
+                if self._log_generations[slot] <= generation:
+                    break
+                vm_ids.add(self._log_ids[slot])
+                position -= 1
+            else:
+                if oldest > 0:
+                    return None
+            return current, self._version.value, vm_ids
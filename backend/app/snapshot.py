@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+from pruned import PrunedMapping, Tombstones
+from vm_model import INTERNED_FIELDS, VM
+
+MAGIC = b"CMSNAP01"
+PREFIX = struct.Struct("<8sQ")
+FORMAT_VERSION = 1
+# VM fields stored as offsets into a UTF-8 blob rather than dictionary codes
+TEXT_FIELDS = ("deployedclustername", "deployedvmtimestamp")
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot is corrupt, stale or from another format"""
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write_snapshot(
+    path: str,
+    source_stamp: Tuple[int, int, int],
+    users: Dict[str, dict],
+    vms_by_owner: Mapping[str, Sequence[VM]],
+):
+    """Writes the users and their VMs as a columnar snapshot of the data file
+    identified by source_stamp
+
+    The file starts with a JSON header holding the user records, the
+    distinct values of each dictionary-encoded field and the position of
+    every column. Rows follow users in order, and each column is a packed
+    native array: vm_id and deployed_at as 64-bit integers, the owning user
+    and each field in INTERNED_FIELDS as 32-bit codes, each TEXT_FIELDS
+    field as 64-bit offsets into a UTF-8 blob, and the vm_ids in sorted
+    order with their rows for lookups by vm_id. The file is replaced
+    atomically, so readers see either the old or the new snapshot.
+
+    Raises ValueError if a vm_id is not an integer or a text field holds
+    something other than a string
+
+    Complexity: O(n log n) where n is the total number of VMs"""
+    columns: Dict[str, array] = {
+        "vm_id": array("q"),
+        "deployed_at": array("q"),
+        "user": array("I"),
+    }
+    codes: Dict[str, Dict[object, int]] = {name: {} for name in INTERNED_FIELDS}
+    for name in INTERNED_FIELDS:
+        columns[name] = array("I")
+    blobs = {name: bytearray() for name in TEXT_FIELDS}
+    for name in TEXT_FIELDS:
+        columns[name + ".offsets"] = array("Q", [0])
+    user_rows = []
+    for user_index, username in enumerate(users):
+        start = len(columns["vm_id"])
+        for vm in vms_by_owner[username]:
+            if type(vm.vm_id) is not int:
+                raise ValueError(f"vm_id {vm.vm_id!r} is not an integer")
+            columns["vm_id"].append(vm.vm_id)
+            columns["deployed_at"].append(vm.deployed_at)
+            columns["user"].append(user_index)
+            for name in INTERNED_FIELDS:
+                value = getattr(vm, name)
+                columns[name].append(codes[name].setdefault(value, len(codes[name])))
+            for name in TEXT_FIELDS:
+                value = getattr(vm, name)
+                if type(value) is not str:
+                    raise ValueError(f"{name} of VM {vm.vm_id} is not a string")
+                blobs[name] += value.encode()
+                columns[name + ".offsets"].append(len(blobs[name]))
+        user_rows.append((start, len(columns["vm_id"])))
+    ids = columns["vm_id"]
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    columns["by_id.ids"] = array("q", (ids[row] for row in order))
+    columns["by_id.rows"] = array("I", order)
+    for name in TEXT_FIELDS:
+        columns[name + ".data"] = array("B", bytes(blobs[name]))
+
+    layout = {}
+    offset = 0
+    for name, column in columns.items():
+        size = len(column) * column.itemsize
+        layout[name] = (offset, size, column.typecode)
+        offset = _align(offset + size)
+    header = json.dumps(
+        {
+            "format": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "source": list(source_stamp),
+            "rows": len(ids),
+            "users": list(users.values()),
+            "user_rows": user_rows,
+            "dictionaries": {name: list(values) for name, values in codes.items()},
+            "columns": layout,
+            "data_size": offset,
+        }
+    ).encode()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(PREFIX.pack(MAGIC, len(header)))
+            f.write(header)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            for name, column in columns.items():
+                column.tofile(f)
+                f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot written by write_snapshot
+
+    Opening one reads only the header; the columns stay in the page cache
+    and are shared by every process mapping the same file, including
+    workers forked after it was opened. A VM object is built from its row
+    the first time it is asked for and cached.
+    """
+
+    def __init__(self, path: str, source_stamp: Tuple[int, int, int]):
+        """Maps the snapshot at path
+
+        Raises OSError if it cannot be read and SnapshotError if it is
+        corrupt or was not written from the data file at source_stamp"""
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as ex:
+                raise SnapshotError(f"{path} is empty") from ex
+        try:
+            magic, header_size = PREFIX.unpack_from(self._map)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot")
+            start, stop = PREFIX.size, PREFIX.size + header_size
+            header = json.loads(self._map[start:stop])
+        except (struct.error, ValueError) as ex:
+            raise SnapshotError(f"{path} has an unreadable header") from ex
+        if header["format"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise SnapshotError(f"{path} was written in another format")
+        if tuple(header["source"]) != tuple(source_stamp):
+            raise SnapshotError(f"{path} is older than its data file")
+        data_start = _align(PREFIX.size + header_size)
+        if len(self._map) != data_start + header["data_size"]:
+            raise SnapshotError(f"{path} is truncated")
+        view = memoryview(self._map)
+        self._columns = {}
+        for name, (offset, size, typecode) in header["columns"].items():
+            start = data_start + offset
+            stop = start + size
+            self._columns[name] = view[start:stop].cast(typecode)
+        self.rows: int = header["rows"]
+        self.users: List[dict] = header["users"]
+        self.usernames: List[str] = [user["username"] for user in self.users]
+        self.user_rows = {
+            username: tuple(rows)
+            for username, rows in zip(self.usernames, header["user_rows"])
+        }
+        self._values = {
+            name: [sys.intern(v) if type(v) is str else v for v in values]
+            for name, values in header["dictionaries"].items()
+        }
+        self._vms: Dict[int, VM] = {}
+        self._owner_vms: Dict[str, Tuple[VM, ...]] = {}
+
+    def column(self, name: str) -> memoryview:
+        """Returns one column as a memoryview of integers"""
+        return self._columns[name]
+
+    def row_of(self, vm_id: int) -> Optional[int]:
+        """Returns the row holding vm_id, or None
+
+        Complexity: O(log n) Binary search of the sorted vm_id column"""
+        ids = self._columns["by_id.ids"]
+        pos = bisect_left(ids, vm_id)
+        if pos == len(ids) or ids[pos] != vm_id:
+            return None
+        return self._columns["by_id.rows"][pos]
+
+    def owner(self, row: int) -> str:
+        """Returns the username of the user the row belongs to"""
+        return self.usernames[self._columns["user"][row]]
+
+    def _text(self, name: str, row: int) -> str:
+        offsets = self._columns[name + ".offsets"]
+        start, stop = offsets[row], offsets[row + 1]
+        return bytes(self._columns[name + ".data"][start:stop]).decode()
+
+    def vm(self, row: int) -> VM:
+        """Returns the VM of a row, building it on first access
+
+        Complexity: O(1)"""
+        vm = self._vms.get(row)
+        if vm is None:
+            fields = {
+                name: self._values[name][self._columns[name][row]]
+                for name in INTERNED_FIELDS
+            }
+            for name in TEXT_FIELDS:
+                fields[name] = self._text(name, row)
+            vm = self._vms.setdefault(
+                row, VM(vm_id=self._columns["vm_id"][row], **fields)
+            )
+        return vm
+
+    def user_vms(self, username: str) -> Tuple[VM, ...]:
+        """Returns the VMs of a user in file order, building them on first
+        access
+
+        Raises KeyError for unknown usernames
+
+        Complexity: O(k) where k is the number of the user's VMs"""
+        vms = self._owner_vms.get(username)
+        if vms is None:
+            start, stop = self.user_rows[username]
+            vms = self._owner_vms.setdefault(
+                username, tuple(self.vm(row) for row in range(start, stop))
+            )
+        return vms
+
+
+class SnapshotRows(PrunedMapping):
+    """vm_id -> VM mapping over a snapshot, standing in for a dict
+
+    Values are built from the snapshot on access. Deleting a key only
+    appends it to the Tombstones shared with every copy, and copy() shares
+    the snapshot, so removing k VMs from a copy costs O(k) instead of
+    copying every entry. Keys iterate in file order.
+    """
+
+    def __init__(
+        self,
+        snapshot: Snapshot,
+        tombstones: Optional[Tombstones] = None,
+        removed: int = 0,
+    ):
+        super().__init__(tombstones, removed)
+        self._snapshot = snapshot
+
+    def _locate(self, vm_id) -> Optional[int]:
+        if type(vm_id) is not int:
+            return None
+        return self._snapshot.row_of(vm_id)
+
+    def _value(self, row: int):
+        return self._snapshot.vm(row)
+
+    def _handles(self) -> Iterator[Tuple[int, int]]:
+        return (
+            (vm_id, row) for row, vm_id in enumerate(self._snapshot.column("vm_id"))
+        )
+
+    def _size(self) -> int:
+        return self._snapshot.rows
+
+    def copy(self):
+        return type(self)(self._snapshot, self._tombstones, self._removed)
+
+
+class SnapshotOwners(SnapshotRows):
+    """vm_id -> owning username mapping over a snapshot; builds no VMs"""
+
+    def _value(self, row: int) -> str:
+        return self._snapshot.owner(row)
+
+
+class SnapshotUserVMs(MutableMapping):
+    """username -> tuple of VMs mapping over a snapshot, standing in for a
+    dict
+
+    A user's VMs are built on first access. Assigning a new tuple for a
+    user overrides the snapshot's in this mapping and its copies only.
+    """
+
+    def __init__(self, snapshot: Snapshot, replaced: Optional[dict] = None):
+        self._snapshot = snapshot
+        self._replaced = replaced if replaced is not None else {}
+
+    def __getitem__(self, username):
+        if username in self._replaced:
+            return self._replaced[username]
+        return self._snapshot.user_vms(username)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snapshot.usernames)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.usernames)
+
+    def __setitem__(self, username, vms):
+        if username not in self._snapshot.user_rows:
+            raise KeyError(username)
+        self._replaced[username] = vms
+
+    def __delitem__(self, username):
+        raise TypeError(f"{type(self).__name__} does not support deleting users")
+
+    def copy(self):
+        return type(self)(self._snapshot, dict(self._replaced))
@@ -0,0 +1,481 @@
+import os
+import json
+import sqlite3
+import argparse
+import weakref
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from vm_model import VM, VM_FIELDS, parse_timestamp
+from fleet_stats import FleetStats
+from search_index import SearchIndex
+from vm_query import FILTER_FIELDS, VMQuery, encode_cursor
+from vm_repository import DELETED, NOT_FOUND, FORBIDDEN, next_version
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    authtype TEXT,
+    email TEXT,
+    fullname TEXT,
+    id INTEGER,
+    spusername TEXT,
+    status TEXT,
+    userpass TEXT
+);
+CREATE TABLE IF NOT EXISTS vms (
+    vm_id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL REFERENCES users(username),
+    deployedclustername TEXT,
+    deployedclusterdescr TEXT,
+    clusterdescr TEXT,
+    podbox TEXT,
+    version TEXT,
+    deployedvmstatus TEXT,
+    deployedvmtimestamp TEXT,
+    deployedclusterowner TEXT,
+    deployed_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS vms_owner ON vms(owner);
+CREATE INDEX IF NOT EXISTS vms_podbox ON vms(podbox);
+CREATE INDEX IF NOT EXISTS vms_status ON vms(deployedvmstatus);
+CREATE INDEX IF NOT EXISTS vms_timestamp ON vms(deployedvmtimestamp);
+CREATE TABLE IF NOT EXISTS fleet_vms (
+    vm_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS credentials (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('version', 0);
+INSERT OR IGNORE INTO meta VALUES ('credentials', 0);
+"""
+
+USER_COLUMNS = (
+    "username",
+    "authtype",
+    "email",
+    "fullname",
+    "id",
+    "spusername",
+    "status",
+    "userpass",
+)
+SQL_CHUNK = 500
+VM_SELECT = "SELECT " + ", ".join(VM_FIELDS) + " FROM vms"
+
+
+class SQLiteRepository:
+    """SQLite storage backend for users, VMs and credentials
+
+    Exposes the same lookup and delete interface as VMRepository, backed by
+    indexed tables instead of the JSON files. Each thread gets its own
+    connection, and deletes run as a single transaction over both the user
+    VM table and the fleet-wide table.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._listeners: List[Callable] = []
+        self._derived: Dict[str, Tuple[int, object]] = {}
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            self._add_deployed_at(conn)
+        ref = weakref.ref(self)
+        os.register_at_fork(
+            after_in_child=lambda: ref() is not None and ref()._forget_connections()
+        )
+
+    @staticmethod
+    def _add_deployed_at(conn: sqlite3.Connection):
+        """Adds and fills the indexed deployed_at column (VM.deployed_at) in
+        databases imported before it existed
+
+        Complexity: O(1) once added, else O(n log n) for n VMs"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(vms)")]
+        if "deployed_at" not in columns:
+            conn.execute("ALTER TABLE vms ADD COLUMN deployed_at INTEGER")
+            conn.executemany(
+                "UPDATE vms SET deployed_at = ? WHERE vm_id = ?",
+                [
+                    (parse_timestamp(timestamp), vm_id)
+                    for vm_id, timestamp in conn.execute(
+                        "SELECT vm_id, deployedvmtimestamp FROM vms"
+                    )
+                ],
+            )
+        conn.execute("CREATE INDEX IF NOT EXISTS vms_deployed_at ON vms(deployed_at)")
+
+    def _forget_connections(self):
+        """Drops connections inherited from the parent process after a fork
+
+        SQLite connections must not be used across fork(), so the child opens
+        its own on first use"""
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the calling thread's connection, opening it on first use
+
+        Complexity: O(1)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def subscribe(self, listener: Callable):
+        """Registers a listener called after every successful delete
+
+        The listener is called with the data versions before and after the
+        delete, the owner's username and the set of deleted vm_ids, once the
+        transaction has committed"""
+        self._listeners.append(listener)
+
+    def share(self, shared):
+        """No-op; forked workers already share SQLite's committed state, and
+        inherited connections are dropped after fork"""
+
+    def reload(self):
+        """Drops the in-memory search index and fleet statistics; lookups
+        always read the committed state"""
+        self._derived = {}
+
+    @property
+    def version(self) -> int:
+        """Data version, bumped by every import and every delete
+
+        Complexity: O(1) Primary key lookup"""
+        return (
+            self._connection()
+            .execute("SELECT value FROM meta WHERE key = 'version'")
+            .fetchone()[0]
+        )
+
+    def _bump_version(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """Advances the data version inside the caller's transaction
+
+        Returns: (previous version, new version)"""
+        current = conn.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()[0]
+        version = next_version(current)
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+        return current, version
+
+    def get_user(self, username: str) -> Optional[Tuple[dict, Tuple[VM, ...]]]:
+        """Returns the user record and its VMs for a username
+
+        Complexity: O(log n + k) Primary key lookup plus an owner index scan"""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT " + ", ".join(USER_COLUMNS) + " FROM users WHERE username = ?",
+            (username,),
+        ).fetchone()
+        if row is None:
+            return None
+        vms = conn.execute(
+            VM_SELECT + " WHERE owner = ? ORDER BY rowid", (username,)
+        ).fetchall()
+        return dict(zip(USER_COLUMNS, row)), tuple(VM(*vm) for vm in vms)
+
+    def get_vm(self, vm_id: int) -> Optional[VM]:
+        """Returns the VM with the given vm_id
+
+        Complexity: O(log n) Primary key lookup"""
+        row = (
+            self._connection()
+            .execute(VM_SELECT + " WHERE vm_id = ?", (vm_id,))
+            .fetchone()
+        )
+        return VM(*row) if row else None
+
+    def get_vms(self, vm_ids: List[int]) -> Dict[int, VM]:
+        """Returns the VMs found for the given vm_ids, keyed by vm_id
+
+        Complexity: O(m log n) where m is the number of requested IDs"""
+        conn = self._connection()
+        found = {}
+        ids = list(vm_ids)
+        for start in range(0, len(ids), SQL_CHUNK):
+            stop = start + SQL_CHUNK
+            chunk = ids[start:stop]
+            rows = conn.execute(
+                VM_SELECT + " WHERE vm_id IN (" + ", ".join("?" * len(chunk)) + ")",
+                chunk,
+            ).fetchall()
+            found.update((row[0], VM(*row)) for row in rows)
+        return found
+
+    def all_vms(self) -> List[VM]:
+        """Returns every VM across all users
+
+        Complexity: O(n) where n is the total number of VMs"""
+        return list(self.iter_vms())
+
+    def iter_vms(self) -> Iterator[VM]:
+        """Yields every VM across all users, fetching rows as they are consumed
+
+        Complexity: O(n) where n is the total number of VMs"""
+        for row in self._connection().execute(VM_SELECT + " ORDER BY rowid"):
+            yield VM(*row)
+
+    def query_vms(
+        self, query: VMQuery, owner: Optional[str] = None
+    ) -> Tuple[List[VM], int, Optional[str]]:
+        """Returns one page of VMs, optionally restricted to a single owner
+
+        Returns: (VMs on the page, total matching VMs, cursor for the next page)
+
+        Complexity: O(log n + limit) on the sort index without filters,
+        O(log n + k log k) with filters or a time range where k is the
+        number of matching VMs"""
+        filters = dict(query.filters)
+        if owner is not None:
+            filters["owner"] = owner
+        where = [f"{FILTER_FIELDS[name]} = ?" for name in filters]
+        params = list(filters.values())
+        if query.deployed_after is not None:
+            where.append("deployed_at >= ?")
+            params.append(query.deployed_after)
+        if query.deployed_before is not None:
+            where.append("deployed_at < ?")
+            params.append(query.deployed_before)
+        if query.q:
+            where.append(
+                "(instr(CAST(vm_id AS TEXT), ?) > 0"
+                " OR instr(lower(deployedclustername), ?) > 0)"
+            )
+            params += [query.q.lower()] * 2
+        conn = self._connection()
+        where_sql = " WHERE " + " AND ".join(where) if where else ""
+        total = conn.execute("SELECT COUNT(*) FROM vms" + where_sql, params).fetchone()[
+            0
+        ]
+        direction, op = ("ASC", ">") if query.order == "asc" else ("DESC", "<")
+        if query.cursor is not None:
+            where.append(f"({query.sort}, vm_id) {op} (?, ?)")
+            params += list(query.cursor)
+        where_sql = " WHERE " + " AND ".join(where) if where else ""
+        rows = conn.execute(
+            VM_SELECT
+            + where_sql
+            + f" ORDER BY {query.sort} {direction}, vm_id {direction} LIMIT ?",
+            params + [query.limit + 1],
+        ).fetchall()
+        page = [VM(*row) for row in rows[: query.limit]]
+        next_cursor = None
+        if len(rows) > query.limit:
+            last = page[-1]
+            next_cursor = encode_cursor((getattr(last, query.sort), last.vm_id))
+        return page, total, next_cursor
+
+    def _derive(self, name: str, build: Callable[[Iterable[VM]], object]):
+        """Returns an in-memory structure built from every VM, rebuilding it
+        when the data version moved for any reason other than a delete made
+        through this repository, which updates it in place
+
+        Complexity: O(1) when current, else the cost of build over n VMs"""
+        version = self.version
+        derived = self._derived.get(name)
+        if derived is None or derived[0] != version:
+            with self._write_lock:
+                derived = self._derived.get(name)
+                if derived is None or derived[0] != version:
+                    derived = self._derived[name] = (version, build(self.iter_vms()))
+        return derived[1]
+
+    def fleet_stats(
+        self, filters: Dict[str, str], by: Iterable[str]
+    ) -> Tuple[int, Dict[str, Dict[str, int]]]:
+        """Counts the VMs matching the facet filters, grouped by each facet
+        in by, from in-memory FleetStats kept like the search index
+
+        Returns: (number of matching VMs, {facet: {value: count}})
+
+        Complexity: O(f + v) where f is the number of facets and v the number
+        of values returned, plus O(n) after a change made by another process"""
+        return self._derive("stats", FleetStats).counts(filters, by)
+
+    def search_vms(
+        self,
+        q: str,
+        offset: int = 0,
+        limit: int = 50,
+        id_range: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[List[VM], int, bool]:
+        """Returns one page of VMs matching a search, best matches first
+
+        Searches an in-memory SearchIndex built from the table. Deletes made
+        through this repository update it in place; any other change to the
+        data version rebuilds it.
+
+        Returns: (VMs on the page, number of matches, whether it is exact)
+
+        Complexity: O(log n + offset + limit + COUNT_LIMIT), plus O(n log n)
+        after a change made by another process"""
+        search = self._derive("search", SearchIndex)
+        vm_ids, total, exact = search.search(q, offset, limit, id_range)
+        found = self.get_vms(vm_ids)
+        return [found[vm_id] for vm_id in vm_ids if vm_id in found], total, exact
+
+    def delete_vm(self, username: str, vm_id: int) -> bool:
+        """Deletes a VM owned by username in a single transaction
+
+        Returns: True if VM was deleted, else False
+
+        Complexity: O(log n) Indexed deletes"""
+        return self.delete_vms(username, [vm_id])[vm_id] == DELETED
+
+    def delete_vms(self, username: str, vm_ids: List[int]) -> Dict[int, str]:
+        """Deletes every listed VM owned by username in a single transaction
+
+        Returns: dict mapping each vm_id to DELETED, NOT_FOUND or FORBIDDEN
+
+        Complexity: O(m log n) where m is the number of requested IDs"""
+        conn = self._connection()
+        results = {}
+        versions = None
+        with self._write_lock:
+            with conn:
+                for vm_id in vm_ids:
+                    row = conn.execute(
+                        "SELECT owner FROM vms WHERE vm_id = ?", (vm_id,)
+                    ).fetchone()
+                    if row is None:
+                        results[vm_id] = NOT_FOUND
+                    elif row[0] != username:
+                        results[vm_id] = FORBIDDEN
+                    else:
+                        results[vm_id] = DELETED
+                doomed = [
+                    (vm_id,) for vm_id, result in results.items() if result == DELETED
+                ]
+                derived = self._derived
+                gone = self.get_vms([vm_id for vm_id, in doomed]) if derived else {}
+                conn.executemany("DELETE FROM vms WHERE vm_id = ?", doomed)
+                conn.executemany("DELETE FROM fleet_vms WHERE vm_id = ?", doomed)
+                if doomed:
+                    versions = self._bump_version(conn)
+            if versions is not None:
+                self._derived = {
+                    name: (versions[1], structure)
+                    for name, (version, structure) in derived.items()
+                    if version == versions[0]
+                }
+                for _, structure in self._derived.values():
+                    for vm in gone.values():
+                        structure.remove(vm)
+                for listener in self._listeners:
+                    listener(*versions, username, {vm_id for vm_id, in doomed})
+        return results
+
+    def load_credentials(self) -> list:
+        """Returns a list of user dictionaries with 'username' and 'password_hash' keys
+
+        Complexity: O(n) where n is the number of credentials"""
+        rows = (
+            self._connection()
+            .execute("SELECT username, password_hash FROM credentials")
+            .fetchall()
+        )
+        return [{"username": u, "password_hash": h} for u, h in rows]
+
+    def credentials_version(self) -> int:
+        """Credentials version, bumped by every import and password hash
+        change but not by VM deletes
+
+        Complexity: O(1) Primary key lookup"""
+        return (
+            self._connection()
+            .execute("SELECT value FROM meta WHERE key = 'credentials'")
+            .fetchone()[0]
+        )
+
+    @staticmethod
+    def _bump_credentials(conn: sqlite3.Connection):
+        """Advances the credentials version inside the caller's transaction"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'credentials'")
+
+    def save_credential(self, username: str, password_hash: str):
+        """Replaces the stored password hash of username
+
+        Complexity: O(log n) Primary key update"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE credentials SET password_hash = ? WHERE username = ?",
+                (password_hash, username),
+            )
+            self._bump_credentials(conn)
+
+    def import_json(self, users_data_file: str, vms_all_file: str, users_file: str):
+        """One-shot import of the mock JSON files, replacing any existing rows
+
+        Complexity: O(n) where n is the total number of records imported"""
+        with open(users_data_file, "r") as f:
+            users_data = json.load(f)
+        vms_all = []
+        if os.path.exists(vms_all_file):
+            with open(vms_all_file, "r") as f:
+                vms_all = json.load(f)
+        credentials = []
+        if os.path.exists(users_file):
+            with open(users_file, "r") as f:
+                credentials = json.load(f)
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM vms")
+            conn.execute("DELETE FROM users")
+            conn.execute("DELETE FROM fleet_vms")
+            conn.execute("DELETE FROM credentials")
+            conn.executemany(
+                "INSERT INTO users VALUES (" + ", ".join("?" * len(USER_COLUMNS)) + ")",
+                [tuple(user.get(c) for c in USER_COLUMNS) for user in users_data],
+            )
+            conn.executemany(
+                "INSERT INTO vms (owner, "
+                + ", ".join(VM_FIELDS)
+                + ", deployed_at) VALUES ("
+                + ", ".join("?" * (len(VM_FIELDS) + 2))
+                + ")",
+                [
+                    (user["username"],)
+                    + tuple(vm.get(c) for c in VM_FIELDS)
+                    + (parse_timestamp(vm.get("deployedvmtimestamp")),)
+                    for user in users_data
+                    for vm in user.get("vms", [])
+                ],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO fleet_vms VALUES (?, ?)",
+                [(vm["vm_id"], json.dumps(vm)) for vm in vms_all],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO credentials VALUES (?, ?)",
+                [(c["username"], c["password_hash"]) for c in credentials],
+            )
+            self._bump_version(conn)
+            self._bump_credentials(conn)
+
+
+if __name__ == "__main__":
+    from storage import MOCK_DATA_DIR, SQLITE_PATH
+
+    parser = argparse.ArgumentParser(
+        description="Import the mock JSON data files into an SQLite database"
+    )
+    parser.add_argument("--db", default=SQLITE_PATH)
+    parser.add_argument("--data-dir", default=MOCK_DATA_DIR)
+    args = parser.parse_args()
+    SQLiteRepository(args.db).import_json(
+        os.path.join(args.data_dir, "users_data.json"),
+        os.path.join(args.data_dir, "vms_all.json"),
+        os.path.join(args.data_dir, "users.json"),
+    )
+    print(f"Imported {args.data_dir} into {args.db}")
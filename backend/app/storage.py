@@ -0,0 +1,45 @@
+import os
+from vm_repository import VMRepository
+from sqlite_repository import SQLiteRepository
+from credential_store import CredentialStore
+
+MOCK_DATA_DIR = os.getenv(
+    "DATA_DIR", os.path.join(os.path.dirname(__file__), "..", "mock_data")
+)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH", os.path.join(MOCK_DATA_DIR, "cluster_manager.db")
+)
+
+
+def create_repository():
+    """Create the storage backend selected by the STORAGE_BACKEND variable
+
+    Returns a VMRepository over the JSON files in DATA_DIR (by default the
+    mock data; "json", the default) or a SQLiteRepository over SQLITE_PATH
+    ("sqlite")."""
+    if STORAGE_BACKEND == "json":
+        return VMRepository(
+            os.path.join(MOCK_DATA_DIR, "users_data.json"),
+            os.path.join(MOCK_DATA_DIR, "vms_all.json"),
+        )
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteRepository(SQLITE_PATH)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+
+
+def create_credential_store() -> CredentialStore:
+    """Create the credential store for the backend selected by STORAGE_BACKEND
+
+    The store watches users.json ("json") or the credentials table of the
+    SQLite database ("sqlite") and reloads when it changes, and writes
+    upgraded password hashes back to it."""
+    if STORAGE_BACKEND == "sqlite":
+        repository = SQLiteRepository(SQLITE_PATH)
+        return CredentialStore(
+            SQLITE_PATH,
+            loader=repository.load_credentials,
+            saver=repository.save_credential,
+            stamp=repository.credentials_version,
+        )
+    return CredentialStore(os.path.join(MOCK_DATA_DIR, "users.json"))
@@ -0,0 +1,76 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenCache:
+    """Bounded LRU cache of already-verified JWT payloads
+
+    Entries are keyed by the SHA-256 digest of the token so raw tokens are
+    never kept in memory, and each entry is dropped once the token's 'exp'
+    claim has passed. Tokens without an 'exp' claim are not cached. All
+    operations take a single lock, so the cache is safe to share between
+    the threads of a multi-threaded WSGI server.
+    """
+
+    def __init__(self, max_size: int = 10000, clock=time.time):
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Returns the cached payload for a token, or None if absent or expired
+
+        Complexity: O(1) Dictionary lookup and LRU reordering"""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: dict):
+        """Caches the payload of a verified token until its 'exp' claim
+
+        Complexity: O(1) Dictionary insert and, if full, one LRU eviction"""
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or exp <= self.clock():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the current size, hit/miss counters and hit ratio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
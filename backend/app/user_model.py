@@ -1,8 +1,9 @@
-import os
-import json
 from dataclasses import dataclass, field
-from typing import List, Optional
-from vm_model import VM
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from vm_model import VM, VM_FIELDS
+from vm_query import VMQuery
+from search_index import SearchQuery
+from storage import create_repository
 
 
 @dataclass
@@ -17,51 +18,66 @@ class User:
     status: str
     username: str
     userpass: Optional[str]
-    vms: List[VM] = field(default_factory=list)
+    vms: Sequence[VM] = field(default_factory=tuple)
 
     @staticmethod
     def load_user(user_id: str) -> Optional["User"]:
-        """Load user data from mock JSON file
+        """Load user data from the in-memory repository
 
         Takes in a user_id (username) string
 
-        Returns: User object if user exists, else return None
+        Returns: User object if user exists, else return None. The user's vms
+        are the repository's shared, immutable tuple rather than copies
 
-        Complexity: O(n) where n is the number of users in the JSON file
+        Complexity: O(1) Dictionary lookup on the username index
 
         """
-        users_file = os.path.join(
-            os.path.dirname(__file__), "..", "mock_data", "users_data.json"
-        )
-        if not os.path.exists(users_file):
+        found = REPOSITORY.get_user(user_id)
+        if found is None:
             return None
-        with open(users_file, "r") as f:
-            users_data = json.load(f)
-        for user_dict in users_data:
-            if user_dict["username"] == user_id:
-                user_dict["vms"] = [VM(**vm) for vm in user_dict.get("vms", [])]
-                return User(**user_dict)
-        return None
+        record, vms = found
+        return User(**record, vms=vms)
 
     @staticmethod
     def get_all_vms() -> list:
-        """Get all VMs from all users in the mock JSON file
+        """Get all VMs from all users in the repository
 
         Returns: list of all VM dictionaries
 
         Complexity: O(n) where n is the total number of VMs across all users.
         """
-        users_file = os.path.join(
-            os.path.dirname(__file__), "..", "mock_data", "users_data.json"
-        )
-        if not os.path.exists(users_file):
-            return []
-        with open(users_file, "r") as f:
-            users_data = json.load(f)
-        all_vms = []
-        for user in users_data:
-            all_vms.extend(user.get("vms", []))
-        return all_vms
+        return [vm.to_dict() for vm in REPOSITORY.all_vms()]
+
+    @staticmethod
+    def iter_all_vms() -> Iterator[dict]:
+        """Yield all VMs from all users one at a time
+
+        Returns: generator of VM dictionaries, for streaming responses
+
+        Complexity: O(n) where n is the total number of VMs across all users.
+        """
+        for vm in REPOSITORY.iter_vms():
+            yield vm.to_dict()
+
+    @staticmethod
+    def data_version() -> int:
+        """Returns the repository's data version
+
+        The version changes whenever the data is reloaded or a VM is deleted,
+        so it can be used to validate cached responses without loading them
+
+        Complexity: O(1)"""
+        return REPOSITORY.version
+
+    @staticmethod
+    def subscribe(listener: Callable):
+        """Registers a listener called after VMs are deleted
+
+        The listener receives the data versions before and after the
+        delete, the owner's username and the set of deleted vm_ids
+
+        Complexity: O(1)"""
+        REPOSITORY.subscribe(listener)
 
     def whoami(self):
         """Returns the username of the user
@@ -70,59 +86,117 @@ class User:
         return self.username
 
     def vms_user(self):
-        """Returns the list of VM objects associated with the user
+        """Returns the sequence of VM objects associated with the user
 
         Complexity: O(1) Retrieving an attribute takes a fixed amount of time"""
         return self.vms
 
     @staticmethod
-    def get_vm(vm_id: int) -> Optional[VM]:
-        """Get a VM by vm_id from all users in the mock JSON file
+    def get_vm(vm_id: int) -> Optional[dict]:
+        """Get a VM by vm_id from the repository
 
         Takes in a vm_id integer and returns the VM dictionary if found
 
-        Complexity: O(n) where n is the total number of VMs across all users."""
-        all_vms = User.get_all_vms()
-        for vm in all_vms:
-            if vm["vm_id"] == vm_id:
-                return vm
-        return None
+        Complexity: O(1) Dictionary lookup on the vm_id index"""
+        vm = REPOSITORY.get_vm(vm_id)
+        if vm is None:
+            return None
+        return vm.to_dict()
+
+    @staticmethod
+    def get_vms(
+        vm_ids: List[int], fields: Optional[List[str]] = None
+    ) -> Tuple[List[dict], List[int]]:
+        """Get several VMs by vm_id in a single pass over the repository
+
+        Takes in a list of vm_id integers and an optional list of field names;
+        when given, each VM dictionary holds only vm_id and those fields
+
+        Returns: (list of VM dictionaries in request order, list of missing IDs)
+
+        Complexity: O(m) where m is the number of requested IDs"""
+        found = REPOSITORY.get_vms(vm_ids)
+        names = VM_FIELDS if fields is None else ("vm_id", *fields)
+        vms = []
+        missing = []
+        for vm_id in vm_ids:
+            vm = found.get(vm_id)
+            if vm is None:
+                missing.append(vm_id)
+            else:
+                vms.append({name: getattr(vm, name) for name in names})
+        return vms, missing
+
+    @staticmethod
+    def query_vms(
+        query: VMQuery, owner: Optional[str] = None
+    ) -> Tuple[List[dict], int, Optional[str]]:
+        """Get one sorted, filtered page of VMs from the repository
+
+        Takes in a VMQuery and an optional owner username to restrict the
+        listing to that user's VMs
+
+        Returns: (list of VM dictionaries, total matching VMs, next page cursor)
+
+        Complexity: O(log n + limit) without filters, O(log n + k log k)
+        with filters or a time range where k is the number of VMs matching
+        them"""
+        page, total, next_cursor = REPOSITORY.query_vms(query, owner=owner)
+        return [vm.to_dict() for vm in page], total, next_cursor
+
+    @staticmethod
+    def search_vms(search: SearchQuery) -> Tuple[List[dict], int, bool]:
+        """Search VMs by ID, cluster name, owner and podbox, best matches first
+
+        Takes in a SearchQuery
+
+        Returns: (list of VM dictionaries, number of matches, whether that
+        number is exact or was capped)
+
+        Complexity: O(log n + offset + limit + COUNT_LIMIT)"""
+        page, total, exact = REPOSITORY.search_vms(
+            search.q, search.offset, search.limit, search.id_range
+        )
+        return [vm.to_dict() for vm in page], total, exact
+
+    @staticmethod
+    def fleet_stats(filters: Dict[str, str], by: List[str]) -> dict:
+        """Count VMs by status, podbox, version and owner
+
+        Takes in facet filters (facet name -> value) and the facets to group
+        the matching VMs by
+
+        Returns: a dictionary with 'total' matching VMs and 'counts', mapping
+        each facet in by to {value: count}
+
+        Complexity: O(f + v) where f is the number of facets and v the number
+        of values returned, independent of the number of VMs"""
+        total, counts = REPOSITORY.fleet_stats(filters, by)
+        return {"total": total, "counts": counts}
 
     @staticmethod
     def delete_vm(username: str, vm_id: int) -> bool:
         """Deletes a VM by vm_id for a specific user and from vms_all.json
 
-        Takes in a username string and vm_id integer
+        Takes in a username string and vm_id integer. The delete is durable
+        once this returns; the data files are rewritten in the background
 
         Returns: True if VM was deleted, else False
 
-        Complexity: O(n) where n is the number of users in the JSON file"""
-        users_file = os.path.join(
-            os.path.dirname(__file__), "..", "mock_data", "users_data.json"
-        )
-        vms_all_file = os.path.join(
-            os.path.dirname(__file__), "..", "mock_data", "vms_all.json"
-        )
-        if not os.path.exists(users_file):
-            return False
-        with open(users_file, "r") as f:
-            users_data = json.load(f)
-        deleted = False
-        for user in users_data:
-            if user["username"] == username:
-                vms = user.get("vms", [])
-                new_vms = [vm for vm in vms if vm.get("vm_id") != vm_id]
-                if len(new_vms) != len(vms):
-                    user["vms"] = new_vms
-                    deleted = True
-                break
-        if deleted:
-            with open(users_file, "w") as f:
-                json.dump(users_data, f, indent=2)
-            if os.path.exists(vms_all_file):
-                with open(vms_all_file, "r") as f:
-                    vms_all = json.load(f)
-                vms_all = [vm for vm in vms_all if vm.get("vm_id") != vm_id]
-                with open(vms_all_file, "w") as f:
-                    json.dump(vms_all, f, indent=2)
-        return deleted
+        Complexity: O(n) where n is the total number of VMs"""
+        return REPOSITORY.delete_vm(username, vm_id)
+
+    @staticmethod
+    def delete_vms(username: str, vm_ids: List[int]) -> Dict[int, str]:
+        """Deletes several VMs for a specific user in one pass
+
+        Takes in a username string and a list of vm_id integers
+
+        Returns: dict mapping each vm_id to "deleted", "not_found" or "forbidden"
+
+        Complexity: O(n + m) where n is the total number of VMs and m the
+        number of requested IDs"""
+        return REPOSITORY.delete_vms(username, vm_ids)
+
+
+REPOSITORY = create_repository()
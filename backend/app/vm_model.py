@@ -1,9 +1,45 @@
-from dataclasses import dataclass
+import sys
+from datetime import datetime, timezone
+from dataclasses import dataclass, field, fields
 
+# Fields whose values repeat across many VMs; each distinct value is stored once
+INTERNED_FIELDS = (
+    "deployedclusterdescr",
+    "clusterdescr",
+    "podbox",
+    "version",
+    "deployedvmstatus",
+    "deployedclusterowner",
+)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-@dataclass
+
+def parse_timestamp(value) -> int:
+    """Converts an ISO 8601 timestamp to microseconds since the Unix epoch
+
+    Naive timestamps are taken as UTC; missing or unparsable values map to 0
+    so they sort before every real timestamp.
+
+    Complexity: O(1)"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return 0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    delta = parsed - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+@dataclass(slots=True)
 class VM:
-    """VM dataclass"""
+    """VM dataclass
+
+    Slotted, so a VM carries no per-instance __dict__. Low-cardinality string
+    fields are interned on construction so every VM shares one copy of each
+    distinct value, and the deployment timestamp is parsed once into
+    deployed_at (microseconds since the epoch) for ordering and range checks.
+    """
 
     vm_id: int
     deployedclustername: str
@@ -13,4 +49,21 @@ class VM:
     version: str
     deployedvmstatus: str
     deployedvmtimestamp: str
-    deployedclusterowner: str
\ No newline at end of file
+    deployedclusterowner: str
+    deployed_at: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        for name in INTERNED_FIELDS:
+            value = getattr(self, name)
+            if type(value) is str:
+                setattr(self, name, sys.intern(value))
+        self.deployed_at = parse_timestamp(self.deployedvmtimestamp)
+
+    def to_dict(self) -> dict:
+        """Returns the VM as a plain dictionary
+
+        Complexity: O(1) A fixed number of fields is copied"""
+        return {name: getattr(self, name) for name in VM_FIELDS}
+
+
+VM_FIELDS = tuple(f.name for f in fields(VM) if f.init)
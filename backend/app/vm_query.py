@@ -0,0 +1,245 @@
+import json
+import base64
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from vm_model import VM, parse_timestamp
+
+SORT_KEYS = (
+    "vm_id",
+    "deployedclustername",
+    "deployedclusterowner",
+    "deployedvmtimestamp",
+)
+FILTER_FIELDS = {
+    "owner": "owner",
+    "status": "deployedvmstatus",
+    "podbox": "podbox",
+    "version": "version",
+}
+# Bounds on VM.deployed_at: deployed_after is inclusive, deployed_before is not
+TIME_BOUNDS = ("deployed_after", "deployed_before")
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+def parse_time_bound(name: str, value: str) -> int:
+    """Parses an ISO 8601 query bound into microseconds since the epoch, as
+    VM.deployed_at; raises ValueError if it is not a timestamp"""
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp")
+    return parse_timestamp(value)
+
+
+@dataclass
+class VMQuery:
+    """Parsed page request for a VM listing"""
+
+    limit: int = DEFAULT_LIMIT
+    cursor: Optional[Tuple] = None
+    sort: str = "vm_id"
+    order: str = "asc"
+    filters: Dict[str, str] = field(default_factory=dict)
+    q: Optional[str] = None
+    deployed_after: Optional[int] = None
+    deployed_before: Optional[int] = None
+
+    @property
+    def time_range(self) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        """(deployed_after, deployed_before), or None if neither is set"""
+        if self.deployed_after is None and self.deployed_before is None:
+            return None
+        return self.deployed_after, self.deployed_before
+
+    @staticmethod
+    def from_args(args) -> "VMQuery":
+        """Builds a query from request arguments
+
+        Accepts limit, cursor, sort, order, owner, status, podbox, version, q,
+        and deployed_after and deployed_before as ISO 8601 timestamps.
+        Raises ValueError for malformed values.
+
+        Complexity: O(1)"""
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        sort = args.get("sort", "vm_id")
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        order = args.get("order", "asc")
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be asc or desc")
+        cursor = decode_cursor(args["cursor"]) if args.get("cursor") else None
+        if cursor is not None and not isinstance(
+            cursor[0], int if sort == "vm_id" else str
+        ):
+            raise ValueError("cursor does not match sort key")
+        filters = {name: args[name] for name in FILTER_FIELDS if args.get(name)}
+        bounds = {
+            name: parse_time_bound(name, args[name])
+            for name in TIME_BOUNDS
+            if args.get(name)
+        }
+        return VMQuery(
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            order=order,
+            filters=filters,
+            q=args.get("q") or None,
+            **bounds,
+        )
+
+
+def encode_cursor(key: Tuple) -> str:
+    """Encodes a (sort value, vm_id) key as an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """Decodes a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        value, vm_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(vm_id, int):
+        raise ValueError("invalid cursor")
+    return value, vm_id
+
+
+class QueryIndex:
+    """Presorted and faceted indexes over a set of VMs
+
+    Keeps, for every sort key, a list of (value, vm_id) keys in sorted order,
+    for every filter field, a map of value -> set of vm_ids, and a time index
+    of (deployed_at, vm_id) keys in sorted order. Unfiltered pages are a
+    bisect plus a slice; filtered pages intersect the facet sets with the
+    time range, found by bisecting the time index, and sort only the
+    matching VMs.
+    """
+
+    def __init__(self, vms: Iterable[VM], owners: Dict[int, str]):
+        self._lock = threading.Lock()
+        self._vms: Dict[int, VM] = {}
+        self._owners: Dict[int, str] = {}
+        self._sorted: Dict[str, List[Tuple]] = {key: [] for key in SORT_KEYS}
+        self._facets: Dict[str, Dict[str, set]] = {name: {} for name in FILTER_FIELDS}
+        for vm in vms:
+            self._vms[vm.vm_id] = vm
+            self._owners[vm.vm_id] = owners[vm.vm_id]
+            for name in FILTER_FIELDS:
+                self._facets[name].setdefault(self._facet_value(vm, name), set()).add(
+                    vm.vm_id
+                )
+        for key in SORT_KEYS:
+            self._sorted[key] = sorted(
+                self._sort_key(vm, key) for vm in self._vms.values()
+            )
+        self._by_time: List[Tuple[int, int]] = sorted(
+            (vm.deployed_at, vm.vm_id) for vm in self._vms.values()
+        )
+
+    def _facet_value(self, vm: VM, name: str) -> str:
+        if name == "owner":
+            return self._owners[vm.vm_id]
+        return getattr(vm, FILTER_FIELDS[name])
+
+    @staticmethod
+    def _sort_key(vm: VM, key: str) -> Tuple:
+        return getattr(vm, key), vm.vm_id
+
+    def remove(self, vm_id: int):
+        """Drops a VM from every index
+
+        Complexity: O(log n) to locate the VM in each sorted list, plus the
+        list shift"""
+        with self._lock:
+            vm = self._vms.pop(vm_id, None)
+            if vm is None:
+                return
+            for key in SORT_KEYS:
+                keys = self._sorted[key]
+                pos = bisect_left(keys, self._sort_key(vm, key))
+                if pos < len(keys) and keys[pos][1] == vm_id:
+                    del keys[pos]
+            pos = bisect_left(self._by_time, (vm.deployed_at, vm_id))
+            if pos < len(self._by_time) and self._by_time[pos][1] == vm_id:
+                del self._by_time[pos]
+            for name in FILTER_FIELDS:
+                self._facets[name].get(self._facet_value(vm, name), set()).discard(
+                    vm_id
+                )
+            del self._owners[vm_id]
+
+    def _in_time_range(self, ids: Optional[set], after, before) -> set:
+        """Narrows ids, or every VM if None, to those deployed in [after, before)
+
+        Complexity: O(log n + min(len(ids), r)) where r is the number of VMs
+        in the range"""
+        keys = self._by_time
+        start = bisect_left(keys, (after,)) if after is not None else 0
+        stop = bisect_left(keys, (before,)) if before is not None else len(keys)
+        if ids is not None and len(ids) < stop - start:
+            low = after if after is not None else float("-inf")
+            high = before if before is not None else float("inf")
+            return {
+                vm_id for vm_id in ids if low <= self._vms[vm_id].deployed_at < high
+            }
+        in_range = {vm_id for _, vm_id in keys[start:stop]}
+        return in_range if ids is None else in_range & ids
+
+    def _matches_text(self, vm: VM, q: str) -> bool:
+        q = q.lower()
+        return q in str(vm.vm_id) or q in vm.deployedclustername.lower()
+
+    def query(self, query: VMQuery) -> Tuple[List[VM], int, Optional[str]]:
+        """Runs a page request
+
+        Returns: (VMs on the page, total matching VMs, cursor for the next page)
+
+        Complexity: O(log n + limit) without filters, O(log n + k log k)
+        with facet filters or a time range, where k is the number of VMs
+        matching them"""
+        with self._lock:
+            if query.filters or query.time_range:
+                ids = None
+                if query.filters:
+                    sets = []
+                    for name, value in query.filters.items():
+                        sets.append(self._facets[name].get(value, set()))
+                    sets.sort(key=len)
+                    ids = set(sets[0]).intersection(*sets[1:])
+                if query.time_range:
+                    ids = self._in_time_range(ids, *query.time_range)
+                candidates = [self._vms[vm_id] for vm_id in ids]
+                if query.q:
+                    candidates = [
+                        vm for vm in candidates if self._matches_text(vm, query.q)
+                    ]
+                keys = sorted(self._sort_key(vm, query.sort) for vm in candidates)
+            elif query.q:
+                keys = [
+                    k
+                    for k in self._sorted[query.sort]
+                    if self._matches_text(self._vms[k[1]], query.q)
+                ]
+            else:
+                keys = self._sorted[query.sort]
+            total = len(keys)
+            if query.order == "asc":
+                start = bisect_right(keys, query.cursor) if query.cursor else 0
+                stop = start + query.limit
+                page_keys = keys[start:stop]
+                has_more = stop < total
+            else:
+                end = bisect_left(keys, query.cursor) if query.cursor else total
+                begin = max(0, end - query.limit)
+                page_keys = keys[begin:end][::-1]
+                has_more = begin > 0
+            page = [self._vms[vm_id] for _, vm_id in page_keys]
+        next_cursor = encode_cursor(page_keys[-1]) if has_more and page_keys else None
+        return page, total, next_cursor
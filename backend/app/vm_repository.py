@@ -0,0 +1,614 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from fleet_stats import FleetStats
+from journal import DeleteJournal, write_json_atomic
+from metrics import count_read
+from pruned import PrunedDict
+from json_stream import iter_json_array
+from search_index import SearchIndex
+from shared_generation import SharedGeneration
+from snapshot import (
+    Snapshot,
+    SnapshotError,
+    SnapshotOwners,
+    SnapshotRows,
+    SnapshotUserVMs,
+    write_snapshot,
+)
+from vm_model import VM
+from vm_query import QueryIndex, VMQuery
+
+DELETED = "deleted"
+NOT_FOUND = "not_found"
+FORBIDDEN = "forbidden"
+COMPACT_DELAY = 0.05
+LOGGER = logging.getLogger(__name__)
+
+
+def next_version(previous: int = 0) -> int:
+    """Returns a data version greater than previous
+
+    Versions are nanosecond timestamps bumped past the previous value, so
+    they keep increasing within a process and do not repeat across restarts.
+
+    Complexity: O(1)"""
+    return max(previous + 1, time.time_ns())
+
+
+class _Index:
+    """Immutable set of lookup tables built from one read of users_data.json
+
+    The vm_id tables are PrunedDicts, or mappings over a Snapshot of the
+    file that build VMs on access; both share their data between copies, so
+    copy() is O(1) and del only records the removed key.
+    """
+
+    def __init__(self, stamp, users, vms, vms_by_owner, owners, version, generation=0):
+        self.stamp = stamp
+        self.version = version
+        self.generation = generation
+        self.users: Dict[str, dict] = users
+        self.vms: Dict[int, VM] = vms
+        self.vms_by_owner: Dict[str, Tuple[VM, ...]] = vms_by_owner
+        self.owners: Dict[int, str] = owners
+        self.query_index: Optional[QueryIndex] = None
+        self.search_index: Optional[SearchIndex] = None
+        self.fleet_stats: Optional[FleetStats] = None
+
+
+class VMRepository:
+    """Process-resident, indexed view of the mock user and VM data files
+
+    The users file is parsed once and kept in memory with hash indexes for
+    vm_id -> VM, username -> user record and owner -> VMs. Every lookup
+    stats the file first; if its mtime, inode or size changed the whole
+    index is rebuilt and swapped in as a single reference assignment, so
+    readers never see a half-built index.
+
+    Deletes are appended to a DeleteJournal and fsync'd, then applied to
+    the in-memory index; only deletes for the same user wait on each other.
+    A background compactor folds the journal into atomic rewrites of both
+    data files after compact_delay seconds, so a burst of deletes costs one
+    rewrite. Journaled deletes are replayed whenever the file is loaded.
+
+    Once share() is called, forked workers coordinate through a
+    SharedGeneration: a delete in one worker is replayed in memory by the
+    others on their next lookup, instead of re-reading the file.
+
+    Unless snapshot_file is "", each parse of the users file and each
+    compaction also writes a columnar Snapshot of it (by default next to it,
+    with a .snapshot suffix). Loads map an up to date snapshot instead of
+    parsing the JSON, so they cost O(u) for u users rather than O(n), and
+    VMs are only built as they are looked up.
+    """
+
+    def __init__(
+        self,
+        users_file: str,
+        vms_all_file: str,
+        journal_file: Optional[str] = None,
+        compact_delay: float = COMPACT_DELAY,
+        snapshot_file: Optional[str] = None,
+    ):
+        self.users_file = users_file
+        self.vms_all_file = vms_all_file
+        self.journal = DeleteJournal(journal_file or f"{users_file}.journal")
+        self.snapshot_file = (
+            f"{users_file}.snapshot" if snapshot_file is None else snapshot_file
+        )
+        self.compact_delay = compact_delay
+        self._lock = threading.RLock()
+        self._index: Optional[_Index] = None
+        self._listeners: List[Callable] = []
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._user_locks_guard = threading.Lock()
+        self._compactor_pid: Optional[int] = None
+        self._dirty = threading.Event()
+        self.shared: Optional[SharedGeneration] = None
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+        """Returns an (mtime_ns, inode, size) tuple identifying the file version
+
+        Complexity: O(1) A single stat() call"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_ino, st.st_size
+
+    def _build_index(self, stamp, users_data: Iterable[dict]) -> _Index:
+        """Builds the lookup tables from the user records of the users file
+
+        Complexity: O(n) where n is the total number of VMs across all users"""
+        users = {}
+        vms = {}
+        vms_by_owner = {}
+        owners = {}
+        for user_dict in users_data:
+            owner_vms = tuple(VM(**vm) for vm in user_dict.get("vms", []))
+            record = dict(user_dict)
+            record.pop("vms", None)
+            users[record["username"]] = record
+            vms_by_owner[record["username"]] = owner_vms
+            for vm in owner_vms:
+                vms[vm.vm_id] = vm
+                owners[vm.vm_id] = record["username"]
+        previous = self._index.version if self._index is not None else 0
+        return _Index(
+            stamp,
+            users,
+            PrunedDict(vms),
+            vms_by_owner,
+            PrunedDict(owners),
+            next_version(previous),
+        )
+
+    def _current(self) -> Optional[_Index]:
+        """Returns an up to date index, reloading it if the file changed on disk
+
+        Complexity: O(1) when the file is unchanged, O(k) to replay k VMs
+        deleted by another worker, O(n) on reload"""
+        if not os.path.exists(self.users_file):
+            return None
+        stamp = self._stamp(self.users_file)
+        index = self._index
+        if index is not None and index.stamp == stamp and not self._behind(index):
+            return index
+        with self._lock, self._shared_lock():
+            index = self._index
+            stamp = self._stamp(self.users_file)
+            if index is None or index.stamp != stamp or self._behind(index):
+                index = self._catch_up(index, stamp) or self._load(stamp)
+                self._index = index
+            return index
+
+    def _shared_lock(self):
+        """Returns the cross-process lock in shared mode, else a no-op context"""
+        return self.shared.lock if self.shared is not None else nullcontext()
+
+    def _behind(self, index: _Index) -> bool:
+        """Returns True if another worker published deletes the index lacks
+
+        Complexity: O(1) A single shared memory read"""
+        return self.shared is not None and index.generation != self.shared.generation
+
+    def _open_snapshot(self, stamp) -> Optional[_Index]:
+        """Builds an index over the snapshot of the users file, if there is
+        one written from this version of it
+
+        Complexity: O(u) where u is the number of users"""
+        if not self.snapshot_file:
+            return None
+        try:
+            snapshot = Snapshot(self.snapshot_file, stamp)
+        except FileNotFoundError:
+            return None
+        except (OSError, SnapshotError) as ex:
+            LOGGER.warning("Ignoring snapshot: %s", ex)
+            return None
+        count_read(self.snapshot_file, os.path.getsize(self.snapshot_file))
+        previous = self._index.version if self._index is not None else 0
+        return _Index(
+            stamp,
+            {record["username"]: record for record in snapshot.users},
+            SnapshotRows(snapshot),
+            SnapshotUserVMs(snapshot),
+            SnapshotOwners(snapshot),
+            next_version(previous),
+        )
+
+    def _write_snapshot(self, stamp, index: _Index):
+        """Writes a snapshot of the index as read from the users file at
+        stamp; failures only cost the next load a JSON parse
+
+        Complexity: O(n log n) where n is the total number of VMs"""
+        if not self.snapshot_file or stamp is None:
+            return
+        try:
+            write_snapshot(self.snapshot_file, stamp, index.users, index.vms_by_owner)
+        except (OSError, ValueError):
+            LOGGER.exception("Writing snapshot %s failed", self.snapshot_file)
+
+    def _load(self, stamp) -> _Index:
+        """Maps the snapshot of the users file, or parses the file into a new
+        index and snapshots it, then replays the journal
+
+        Complexity: O(u + k) from an up to date snapshot, where u is the
+        number of users and k the size of the journal, else O(n + k) where
+        n is the total number of VMs"""
+        index = self._open_snapshot(stamp)
+        if index is None:
+            with open(self.users_file, "r") as f:
+                index = self._build_index(stamp, iter_json_array(f))
+                count_read(self.users_file, f.tell(), len(index.vms))
+            self._write_snapshot(stamp, index)
+        pending = {}
+        entries = self.journal.entries()
+        for owner, vm_ids in entries:
+            for vm_id in vm_ids:
+                if index.owners.get(vm_id) == owner:
+                    pending.setdefault(owner, set()).add(vm_id)
+        if pending:
+            index = self._without(index, pending, stamp, index.version)
+        if entries:
+            # Even entries already folded into the users file may be missing
+            # from vms_all.json, if a compaction was cut short between the two
+            self._schedule_compaction()
+        if self.shared is not None:
+            index.generation = self.shared.generation
+        return index
+
+    def _catch_up(self, index: Optional[_Index], stamp) -> Optional[_Index]:
+        """Replays deletes published by other workers onto the index
+
+        Returns: the updated index, or None if the file changed for a reason
+        other than a compaction or the deletion log no longer reaches back
+        far enough
+
+        Complexity: O(u + k) where k is the number of VMs deleted since and
+        u the number of users"""
+        if self.shared is None or index is None:
+            return None
+        if stamp != index.stamp and stamp != self.shared.compacted_stamp:
+            return None
+        changes = self.shared.changes_since(index.generation)
+        if changes is None:
+            return None
+        generation, version, vm_ids = changes
+        if generation == index.generation:
+            version = index.version
+        by_owner = {}
+        for vm_id in vm_ids:
+            if vm_id in index.owners:
+                by_owner.setdefault(index.owners[vm_id], set()).add(vm_id)
+        updated = self._without(index, by_owner, stamp, version)
+        updated.generation = generation
+        previous = index.version
+        for owner, doomed in by_owner.items():
+            self._notify(previous, version, owner, doomed)
+            previous = version
+        return updated
+
+    def share(self, shared: SharedGeneration):
+        """Switches to cross-process change tracking before forking workers
+
+        Loads the index so forked workers inherit it, and starts the shared
+        data version from the loaded one"""
+        with self._lock:
+            index = self._current()
+            self.shared = shared
+            self.journal.lock = shared.lock
+            if index is not None:
+                shared.publish((), index.version)
+                index.generation = shared.generation
+
+    @property
+    def version(self) -> int:
+        """Data version, bumped by every reload and every delete
+
+        Complexity: O(1) when the file is unchanged"""
+        index = self._current()
+        return index.version if index is not None else 0
+
+    def subscribe(self, listener: Callable):
+        """Registers a listener called after every successful delete
+
+        The listener is called with the data versions before and after the
+        delete, the owner's username and the set of deleted vm_ids, while
+        deletes are still serialized"""
+        self._listeners.append(listener)
+
+    def reload(self):
+        """Drops the in-memory index so the next lookup re-reads the file"""
+        with self._lock:
+            self._index = None
+
+    def get_user(self, username: str) -> Optional[Tuple[dict, Tuple[VM, ...]]]:
+        """Returns the user record and its VMs for a username
+
+        The VMs are the index's own immutable tuple, not a copy
+
+        Complexity: O(1) Dictionary lookup"""
+        index = self._current()
+        if index is None or username not in index.users:
+            return None
+        return index.users[username], index.vms_by_owner[username]
+
+    def get_vm(self, vm_id: int) -> Optional[VM]:
+        """Returns the VM with the given vm_id
+
+        Complexity: O(1) Dictionary lookup"""
+        index = self._current()
+        if index is None:
+            return None
+        return index.vms.get(vm_id)
+
+    def get_vms(self, vm_ids: List[int]) -> Dict[int, VM]:
+        """Returns the VMs found for the given vm_ids, keyed by vm_id
+
+        Complexity: O(m) where m is the number of requested IDs"""
+        index = self._current()
+        if index is None:
+            return {}
+        return {vm_id: index.vms[vm_id] for vm_id in vm_ids if vm_id in index.vms}
+
+    def all_vms(self) -> List[VM]:
+        """Returns every VM across all users, in file order
+
+        Complexity: O(n) where n is the total number of VMs"""
+        return list(self.iter_vms())
+
+    def iter_vms(self) -> Iterator[VM]:
+        """Yields every VM across all users, in file order, without building a list
+
+        Complexity: O(n) where n is the total number of VMs"""
+        index = self._current()
+        if index is None:
+            return
+        for owner_vms in index.vms_by_owner.values():
+            yield from owner_vms
+
+    def query_vms(
+        self, query: VMQuery, owner: Optional[str] = None
+    ) -> Tuple[List[VM], int, Optional[str]]:
+        """Returns one page of VMs, optionally restricted to a single owner
+
+        Returns: (VMs on the page, total matching VMs, cursor for the next page)
+
+        Complexity: O(log n + limit) without filters, O(log n + k log k)
+        with filters or a time range where k is the number of VMs matching
+        them; the query index is built once per loaded file in O(n log n)"""
+        index = self._current()
+        if index is None:
+            return [], 0, None
+        if owner is not None:
+            query = replace(query, filters={**query.filters, "owner": owner})
+        query_index = index.query_index
+        if query_index is None:
+            with self._lock:
+                if index.query_index is None:
+                    index.query_index = QueryIndex(index.vms.values(), index.owners)
+                query_index = index.query_index
+        return query_index.query(query)
+
+    def search_vms(
+        self,
+        q: str,
+        offset: int = 0,
+        limit: int = 50,
+        id_range: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[List[VM], int, bool]:
+        """Returns one page of VMs matching a search, best matches first
+
+        Returns: (VMs on the page, number of matches, whether it is exact)
+
+        Complexity: O(log n + offset + limit + COUNT_LIMIT); the search
+        index is built once per loaded file in O(n log n)"""
+        index = self._current()
+        if index is None:
+            return [], 0, True
+        search_index = index.search_index
+        if search_index is None:
+            with self._lock:
+                if index.search_index is None:
+                    index.search_index = SearchIndex(index.vms.values())
+                search_index = index.search_index
+        vm_ids, total, exact = search_index.search(q, offset, limit, id_range)
+        vms = index.vms
+        return [vms[vm_id] for vm_id in vm_ids if vm_id in vms], total, exact
+
+    def fleet_stats(
+        self, filters: Dict[str, str], by: Iterable[str]
+    ) -> Tuple[int, Dict[str, Dict[str, int]]]:
+        """Counts the VMs matching the facet filters, grouped by each facet
+        in by
+
+        Returns: (number of matching VMs, {facet: {value: count}})
+
+        Complexity: O(f + v) where f is the number of facets and v the number
+        of values returned; the counts are built once per loaded file in O(n)"""
+        index = self._current()
+        if index is None:
+            return 0, {name: {} for name in by}
+        stats = index.fleet_stats
+        if stats is None:
+            with self._lock:
+                if index.fleet_stats is None:
+                    index.fleet_stats = FleetStats(index.vms.values())
+                stats = index.fleet_stats
+        return stats.counts(filters, by)
+
+    def delete_vm(self, username: str, vm_id: int) -> bool:
+        """Deletes a VM owned by username
+
+        Returns: True if VM was deleted, else False
+
+        Complexity: O(u + v) where u is the number of users and v the
+        number of the user's VMs; the data files are rewritten later"""
+        return self.delete_vms(username, [vm_id])[vm_id] == DELETED
+
+    def _user_lock(self, username: str) -> threading.Lock:
+        """Returns the lock serializing deletes for one user"""
+        with self._user_locks_guard:
+            return self._user_locks.setdefault(username, threading.Lock())
+
+    def delete_vms(self, username: str, vm_ids: List[int]) -> Dict[int, str]:
+        """Deletes every listed VM owned by username
+
+        The delete is journaled and fsync'd before the in-memory index is
+        updated, and the data files are rewritten by the compactor
+
+        Returns: dict mapping each vm_id to DELETED, NOT_FOUND or FORBIDDEN
+
+        Complexity: O(u + v + m) where u is the number of users, v the
+        number of the user's VMs and m the number of requested IDs"""
+        results = {}
+        with self._user_lock(username):
+            index = self._current()
+            for vm_id in vm_ids:
+                owner = index.owners.get(vm_id) if index is not None else None
+                if owner is None:
+                    results[vm_id] = NOT_FOUND
+                elif owner != username:
+                    results[vm_id] = FORBIDDEN
+                else:
+                    results[vm_id] = DELETED
+            doomed = {vm_id for vm_id, result in results.items() if result == DELETED}
+            if not doomed:
+                return results
+            self.journal.append(username, doomed)
+            with self._lock, self._shared_lock():
+                index = self._current()
+                # Another worker may have deleted some of them meanwhile
+                gone = {
+                    vm_id
+                    for vm_id in doomed
+                    if index is None or vm_id not in index.owners
+                }
+                for vm_id in gone:
+                    results[vm_id] = NOT_FOUND
+                doomed -= gone
+                if doomed:
+                    new_index = self._without(
+                        index,
+                        {username: doomed},
+                        index.stamp,
+                        next_version(index.version),
+                    )
+                    if self.shared is not None:
+                        new_index.generation = self.shared.publish(
+                            doomed, new_index.version
+                        )
+                    self._index = new_index
+                    self._notify(index.version, new_index.version, username, doomed)
+        self._schedule_compaction()
+        return results
+
+    @staticmethod
+    def _without(
+        index: _Index, doomed_by_owner: Dict[str, set], stamp, version
+    ) -> _Index:
+        """Returns a copy of the index without the given VMs of each owner
+
+        The query and search indexes and the fleet statistics are updated in
+        place and carried over
+
+        Complexity: O(u + k + v) where u is the number of users, k the number
+        of VMs removed and v the number of VMs their owners had, O(1) if
+        nothing is removed"""
+        vms = index.vms
+        owners = index.owners
+        vms_by_owner = index.vms_by_owner
+        if doomed_by_owner:
+            vms = vms.copy()
+            owners = owners.copy()
+            vms_by_owner = vms_by_owner.copy()
+            for owner, doomed in doomed_by_owner.items():
+                for vm_id in doomed:
+                    del vms[vm_id]
+                    del owners[vm_id]
+                vms_by_owner[owner] = tuple(
+                    vm for vm in index.vms_by_owner[owner] if vm.vm_id not in doomed
+                )
+        new_index = _Index(
+            stamp, index.users, vms, vms_by_owner, owners, version, index.generation
+        )
+        if index.query_index is not None:
+            for doomed in doomed_by_owner.values():
+                for vm_id in doomed:
+                    index.query_index.remove(vm_id)
+            new_index.query_index = index.query_index
+        for name in ("search_index", "fleet_stats"):
+            derived = getattr(index, name)
+            if derived is not None:
+                for doomed in doomed_by_owner.values():
+                    for vm_id in doomed:
+                        derived.remove(index.vms[vm_id])
+                setattr(new_index, name, derived)
+        return new_index
+
+    def _notify(self, previous_version: int, version: int, owner: str, doomed: set):
+        """Calls every delete listener"""
+        for listener in self._listeners:
+            listener(previous_version, version, owner, doomed)
+
+    def _schedule_compaction(self):
+        """Wakes the compactor thread, starting it in this process if needed"""
+        with self._user_locks_guard:
+            if self._compactor_pid != os.getpid():
+                self._compactor_pid = os.getpid()
+                self._dirty = threading.Event()
+                threading.Thread(
+                    target=self._compact_loop, name="vm-compactor", daemon=True
+                ).start()
+            self._dirty.set()
+
+    def _compact_loop(self):
+        """Compacts the journal once per burst of deletes"""
+        while True:
+            self._dirty.wait()
+            time.sleep(self.compact_delay)
+            self._dirty.clear()
+            try:
+                self.flush()
+            except OSError:
+                LOGGER.exception("Compacting %s failed", self.journal.path)
+
+    def flush(self):
+        """Folds every journaled delete into atomic rewrites of both data files
+
+        Journal entries for deletes still being applied are kept for the next
+        compaction
+
+        Complexity: O(n + k) where n is the total number of VMs and k the
+        size of the journal"""
+        with self._lock, self._shared_lock():
+            index = self._current()
+            if index is None:
+                return
+            live = index.owners.keys()
+            applied = [
+                vm_ids for _, vm_ids in self.journal.entries() if not vm_ids & live
+            ]
+            if not applied:
+                return
+            self._write_users(index.users, index.vms_by_owner)
+            self._remove_from_vms_all(set().union(*applied))
+            stamp = self._stamp(self.users_file)
+            self._write_snapshot(stamp, index)
+            self._index = self._without(index, {}, stamp, index.version)
+            if self.shared is not None:
+                self.shared.record_compaction(stamp)
+            self.journal.retain(lambda entry: bool(entry[1] & live))
+
+    def _write_users(
+        self, users: Dict[str, dict], vms_by_owner: Dict[str, Tuple[VM, ...]]
+    ):
+        """Serializes the in-memory users and VMs back to the users file
+
+        Complexity: O(n) where n is the total number of VMs"""
+        users_data = []
+        for username, record in users.items():
+            user_dict = dict(record)
+            user_dict["vms"] = [vm.to_dict() for vm in vms_by_owner[username]]
+            users_data.append(user_dict)
+        write_json_atomic(self.users_file, users_data)
+
+    def _remove_from_vms_all(self, vm_ids: set):
+        """Removes the given vm_ids from the fleet-wide vms_all file
+
+        Complexity: O(m) where m is the number of entries in vms_all.json"""
+        if not os.path.exists(self.vms_all_file):
+            return
+        with open(self.vms_all_file, "r") as f:
+            vms_all = json.load(f)
+            count_read(self.vms_all_file, f.tell(), len(vms_all))
+        vms_all = [vm for vm in vms_all if vm.get("vm_id") not in vm_ids]
+        write_json_atomic(self.vms_all_file, vms_all)
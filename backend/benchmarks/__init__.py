@@ -0,0 +1,12 @@
+"""Benchmarks for the backend at fleet scale
+
+Run the modules from the backend directory, e.g.
+python -m benchmarks.run --vms 100000 --users 1000
+"""
+
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
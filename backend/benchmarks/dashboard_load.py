@@ -0,0 +1,437 @@
+"""Replays dashboard traffic against a running server from many simulated users
+
+Starts serve.py on a synthetic fleet (or targets --url), then runs simulated
+users in threads, each over its own keep-alive connection. A user logs in
+once, then reloads the dashboard in a loop, making the same requests as
+App.jsx, Dashboard.jsx and routeData.jsx: validate the stored token, whoami,
+then the first page of the user's VMs from /vms_by_user, sorted by vm_id
+(revalidated with If-None-Match, as the browser does). Every --delete-every
+page loads a user deletes --delete-batch of its own VMs.
+
+With --flow listing the dashboard downloads the full /vms_by_user and
+/vms/all listings and looks up the details of the first page of rows, as it
+did before it paged on the server. With --flow legacy the rows are then
+fetched with four GET /vms/<id> calls per row instead, and deletes loop over
+GET /vms/delete/<id>.
+
+Reports throughput, p50/p95/p99 latency and error rate per route for each
+number of simulated users. With --ramp the number doubles from the first
+--clients value until throughput stops growing by --min-gain or the error
+rate passes --max-error-rate, and the level with the best throughput is
+reported as the saturation point.
+
+    python -m benchmarks.dashboard_load --vms 10000 --users 100 --clients 1 8 32
+    python -m benchmarks.dashboard_load --ramp --clients 1 --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+from . import APP_DIR, fleet
+from .login_load import percentile
+from .run import prepare
+
+# Rows on one dashboard page and the fields the dashboard shows for each
+PAGE_ROWS = 10
+ROW_FIELDS = "podbox,version,deployedvmtimestamp,deployedclusterowner,deployedvmstatus"
+
+
+class Recorder:
+    """Thread-safe latency and status samples per route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+        self.page_loads = 0
+
+    def record(self, route: str, status: int, elapsed_ms: float):
+        """Records one request; status 0 stands for a connection error"""
+        with self._lock:
+            self.latencies.setdefault(route, []).append(elapsed_ms)
+            statuses = self.statuses.setdefault(route, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def page_loaded(self):
+        with self._lock:
+            self.page_loads += 1
+
+
+def summarize(recorder: Recorder, clients: int, seconds: float) -> dict:
+    """Builds the per-route and overall figures of one level
+
+    A request is an error if it failed to connect or got a status of 400 or
+    more; 304 counts as success"""
+    routes = {}
+    requests = errors = 0
+    for route, latencies in sorted(recorder.latencies.items()):
+        statuses = recorder.statuses[route]
+        failed = sum(n for status, n in statuses.items() if not 0 < status < 400)
+        routes[route] = {
+            "requests": len(latencies),
+            "per_second": len(latencies) / seconds,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "error_rate": failed / len(latencies),
+            "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        }
+        requests += len(latencies)
+        errors += failed
+    return {
+        "clients": clients,
+        "seconds": seconds,
+        "requests_per_second": requests / seconds,
+        "page_loads_per_second": recorder.page_loads / seconds,
+        "error_rate": errors / requests if requests else 0.0,
+        "routes": routes,
+    }
+
+
+class SimulatedUser:
+    """One dashboard user with its own connection, token and ETag cache"""
+
+    def __init__(self, url: str, name: str, recorder: Recorder, args, seed: int):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.name = name
+        self.recorder = recorder
+        self.args = args
+        self.rng = random.Random(seed)
+        self.conn: Optional[http.client.HTTPConnection] = None
+        self.token: Optional[str] = None
+        self.etags: Dict[str, Tuple[str, object]] = {}
+        self.deleted: set = set()
+
+    def request(
+        self,
+        method: str,
+        route: str,
+        path: str,
+        body=None,
+        auth=False,
+        revalidate=False,
+    ) -> Tuple[int, object]:
+        """Sends one request and records it under route
+
+        Returns: (status, decoded JSON body or None); status 0 if the
+        request failed to connect"""
+        headers = {"Accept-Encoding": "identity"}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        if auth and self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        cached = self.etags.get(path) if revalidate else None
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.recorder.record(route, 0, (time.perf_counter() - start) * 1000)
+            self.conn.close()
+            self.conn = None
+            return 0, None
+        self.recorder.record(
+            route, response.status, (time.perf_counter() - start) * 1000
+        )
+        if response.status == 304 and cached:
+            return 200, cached[1]
+        try:
+            payload = json.loads(data) if data else None
+        except ValueError:
+            payload = None
+        etag = response.getheader("ETag")
+        if revalidate and etag and response.status == 200:
+            self.etags[path] = (etag, payload)
+        return response.status, payload
+
+    def login(self) -> bool:
+        status, payload = self.request(
+            "POST",
+            "POST /login",
+            "/login",
+            {"username": self.name, "password": fleet.password(self.name)},
+        )
+        self.token = payload.get("token") if status == 200 else None
+        return self.token is not None
+
+    def load_dashboard(self, page_load: int):
+        """Makes the requests of one dashboard load, then deletes if due"""
+        if self.token is None and not self.login():
+            return
+        status, _ = self.request(
+            "POST", "POST /validate", "/validate", {"token": self.token}
+        )
+        if status == 401:
+            self.token = None
+            return
+        self.request("GET", "GET /whoami", "/whoami", auth=True)
+        if self.args.flow == "dashboard":
+            query = urlencode({"sort": "vm_id", "order": "asc", "limit": PAGE_ROWS})
+            _, page = self.request(
+                "GET",
+                "GET /vms_by_user?page",
+                f"/vms_by_user?{query}",
+                auth=True,
+                revalidate=True,
+            )
+            own = [
+                vm["vm_id"]
+                for vm in (page or {}).get("items", ())
+                if vm["vm_id"] not in self.deleted
+            ]
+            rows = []
+        else:
+            _, own = self.request(
+                "GET", "GET /vms_by_user", "/vms_by_user", auth=True, revalidate=True
+            )
+            self.request("GET", "GET /vms/all", "/vms/all", revalidate=True)
+            own = [vm["vm_id"] for vm in own or () if vm["vm_id"] not in self.deleted]
+            rows = own[:PAGE_ROWS]
+        if self.args.flow == "legacy":
+            for vm_id in rows:
+                for _ in range(4):
+                    self.request("GET", "GET /vms/<id>", f"/vms/{vm_id}")
+        elif rows:
+            query = urlencode({"ids": ",".join(map(str, rows)), "fields": ROW_FIELDS})
+            self.request("GET", "GET /vms/lookup", f"/vms/lookup?{query}")
+        self.recorder.page_loaded()
+        if self.args.delete_every and (page_load + 1) % self.args.delete_every == 0:
+            doomed = self.rng.sample(own, min(len(own), self.args.delete_batch))
+            self.deleted.update(doomed)
+            if self.args.flow == "legacy":
+                for vm_id in doomed:
+                    self.request(
+                        "GET", "GET /vms/delete/<id>", f"/vms/delete/{vm_id}", auth=True
+                    )
+            elif doomed:
+                self.request(
+                    "POST",
+                    "POST /vms/delete",
+                    "/vms/delete",
+                    {"vm_ids": doomed},
+                    auth=True,
+                )
+
+    def run(self, stop: threading.Event):
+        page_load = 0
+        while not stop.is_set():
+            self.load_dashboard(page_load)
+            page_load += 1
+            if self.args.think:
+                stop.wait(self.rng.expovariate(1 / self.args.think))
+        if self.conn is not None:
+            self.conn.close()
+
+
+def ramp(start: int, limit: int):
+    """Yields start, doubling it while it stays within limit"""
+    while start <= limit:
+        yield start
+        start *= 2
+
+
+def run_level(url: str, users: List[str], clients: int, args) -> dict:
+    """Runs clients simulated users for args.seconds
+
+    Complexity: O(page loads) requests"""
+    recorder = Recorder()
+    stop = threading.Event()
+    simulated = [
+        SimulatedUser(url, users[n % len(users)], recorder, args, args.seed + n)
+        for n in range(clients)
+    ]
+    threads = [threading.Thread(target=user.run, args=(stop,)) for user in simulated]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder, clients, time.perf_counter() - started)
+
+
+def saturation(
+    levels: List[dict], min_gain: float, max_error_rate: float
+) -> Tuple[bool, Optional[dict]]:
+    """Decides whether a ramp should stop after the last level
+
+    Returns: (whether throughput stopped growing by min_gain or the error
+    rate passed max_error_rate, the level with the best throughput among
+    those within max_error_rate, or None)"""
+    healthy = [level for level in levels if level["error_rate"] <= max_error_rate]
+    best = max(healthy, key=lambda level: level["requests_per_second"], default=None)
+    last = levels[-1]
+    if last["error_rate"] > max_error_rate:
+        return True, best
+    if len(levels) > 1:
+        previous = levels[-2]["requests_per_second"]
+        if last["requests_per_second"] < previous * (1 + min_gain):
+            return True, best
+    return False, best
+
+
+def format_level(level: dict) -> str:
+    """Renders one level as an aligned text table, one row per route"""
+    header = (
+        f"{'route':<22} {'requests':>8} {'req/s':>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    )
+    lines = [
+        f"{level['clients']} users: {level['requests_per_second']:.1f} req/s, "
+        f"{level['page_loads_per_second']:.1f} page loads/s, "
+        f"{level['error_rate']:.2%} errors",
+        header,
+        "-" * len(header),
+    ]
+    for route, row in level["routes"].items():
+        lines.append(
+            f"{route:<22} {row['requests']:>8} {row['per_second']:>8.1f} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+            f"{row['error_rate']:>7.2%}"
+        )
+    return "\n".join(lines)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, log_path: str) -> Tuple[subprocess.Popen, str]:
+    """Starts serve.py with the environment set up by prepare, logging to
+    log_path, and waits until it accepts connections
+
+    The server runs in its own process group, so stop_server also stops the
+    processes it started, such as the password verifier pools"""
+    port = free_port()
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "serve.py",
+                "--port",
+                str(port),
+                "--workers",
+                str(workers),
+            ],
+            cwd=APP_DIR,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited, see {log_path}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError(f"serve.py did not start listening, see {log_path}")
+
+
+def stop_server(server: subprocess.Popen):
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay dashboard traffic from concurrent simulated users"
+    )
+    parser.add_argument("--vms", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument(
+        "--data", help="directory holding (or receiving) the fleet files"
+    )
+    parser.add_argument("--url", help="target a server already running on this fleet")
+    parser.add_argument("--workers", type=int, default=2, help="serve.py workers")
+    parser.add_argument(
+        "--flow", choices=("dashboard", "listing", "legacy"), default="dashboard"
+    )
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument(
+        "--think", type=float, default=0.0, help="mean seconds between page loads"
+    )
+    parser.add_argument("--delete-every", type=int, default=20)
+    parser.add_argument("--delete-batch", type=int, default=2)
+    parser.add_argument(
+        "--ramp",
+        action="store_true",
+        help="double the users from the first --clients value until saturation",
+    )
+    parser.add_argument("--max-clients", type=int, default=1024)
+    parser.add_argument("--min-gain", type=float, default=0.05)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="also write the results here as JSON")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        data_dir = prepare(args)
+        log_path = os.path.join(data_dir, "server.log")
+        server, url = start_server(args.workers, log_path)
+        print(f"  serving {data_dir} at {url}, logging to {log_path}", file=sys.stderr)
+    users = [fleet.username(u) for u in range(args.users)]
+    levels = []
+    best = None
+    try:
+        steps = ramp(args.clients[0], args.max_clients) if args.ramp else args.clients
+        for clients in steps:
+            levels.append(run_level(url, users, clients, args))
+            print(format_level(levels[-1]) + "\n")
+            saturated, best = saturation(levels, args.min_gain, args.max_error_rate)
+            if args.ramp and saturated:
+                break
+    finally:
+        if server is not None:
+            stop_server(server)
+    if args.ramp and best is not None:
+        print(
+            f"Saturation: {best['requests_per_second']:.1f} req/s "
+            f"at {best['clients']} users"
+        )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(
+                {
+                    "meta": vars(args),
+                    "levels": levels,
+                    "saturation": best["clients"] if args.ramp and best else None,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Generates synthetic data files for a fleet of a given size
+
+Writes users_data.json, vms_all.json and users.json in the layout of
+backend/mock_data. Values repeat the way production data does: a few dozen
+podboxes, a handful of versions and statuses, and unique cluster names and
+timestamps. Every user's password is "password-<username>".
+
+    python -m benchmarks.fleet --vms 100000 --users 1000 --out /tmp/fleet
+"""
+
+import os
+import argparse
+import hashlib
+from datetime import datetime, timedelta
+from typing import Iterator, List
+from . import APP_DIR  # noqa: F401  (puts the app modules on sys.path)
+from json_stream import stream_json_array
+
+PODBOXES = [f"PODBOX{n}" for n in range(1, 33)]
+VERSIONS = ["1.1.1", "1.2.0", "2.0.0", "2.1.3"]
+STATUSES = ["INSTALLED", "RUNNING", "STOPPED", "FAILED"]
+START = datetime(2025, 1, 1)
+
+
+def username(user_index: int) -> str:
+    return f"user{user_index:06d}"
+
+
+def password(name: str) -> str:
+    return f"password-{name}"
+
+
+def vm_ids_for(user_index: int, vms: int, users: int) -> range:
+    """Returns the vm_ids owned by a user; VMs are split evenly by ID range"""
+    per_user, extra = divmod(vms, users)
+    start = user_index * per_user + min(user_index, extra)
+    return range(start + 1, start + 1 + per_user + (user_index < extra))
+
+
+def owner_of(vm_id: int, vms: int, users: int) -> str:
+    """Returns the username owning vm_id; the inverse of vm_ids_for"""
+    per_user, extra = divmod(vms, users)
+    offset = vm_id - 1
+    boundary = extra * (per_user + 1)
+    if offset < boundary:
+        return username(offset // (per_user + 1))
+    return username(extra + (offset - boundary) // per_user)
+
+
+def vm_record(vm_id: int, owner: str) -> dict:
+    """Returns the users_data.json record for one synthetic VM
+
+    String values are built fresh per record, as json.load would produce
+    them, so repeated values are only shared if the model interns them."""
+    podbox = PODBOXES[vm_id % len(PODBOXES)]
+    return {
+        "vm_id": vm_id,
+        "deployedclustername": f"{owner}_{vm_id}",
+        "deployedclusterdescr": "".join(["This is ", "a mock"]),
+        "clusterdescr": "".join([podbox, " (Automation)"]),
+        "podbox": "".join([podbox]),
+        "version": "".join([VERSIONS[vm_id % len(VERSIONS)]]),
+        "deployedvmstatus": "".join([STATUSES[vm_id % len(STATUSES)]]),
+        "deployedvmtimestamp": (START + timedelta(seconds=vm_id * 37)).isoformat(),
+        "deployedclusterowner": "".join([owner]),
+    }
+
+
+def user_record(user_index: int, vms: int, users: int) -> dict:
+    name = username(user_index)
+    return {
+        "authtype": "employee",
+        "email": f"{name}@example.com",
+        "fullname": f"User {user_index}",
+        "id": user_index + 1,
+        "spusername": None,
+        "status": "active",
+        "username": name,
+        "userpass": None,
+        "vms": [vm_record(vm_id, name) for vm_id in vm_ids_for(user_index, vms, users)],
+    }
+
+
+def fleet_record(vm_id: int, owner: str) -> dict:
+    """Returns the vms_all.json record for one synthetic VM"""
+    record = vm_record(vm_id, owner)
+    return {
+        "deliveredclusterdescr": record["deployedclusterdescr"],
+        "deliveredclustername": record["deployedclustername"],
+        "vm_id": vm_id,
+        "clusterdescr": record["clusterdescr"],
+        "podbox": record["podbox"],
+        "version": record["version"],
+        "deployedvmstatus": record["deployedvmstatus"],
+        "deployedvmtimestamp": record["deployedvmtimestamp"],
+    }
+
+
+def _write(path: str, items: Iterator):
+    with open(path, "wb") as f:
+        for chunk in stream_json_array(items):
+            f.write(chunk)
+
+
+def generate(out_dir: str, vms: int, users: int) -> List[str]:
+    """Writes the three data files into out_dir and returns their paths
+
+    Records are streamed to disk, so memory stays flat at any fleet size
+
+    Complexity: O(vms + users)"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [
+        os.path.join(out_dir, name)
+        for name in ("users_data.json", "vms_all.json", "users.json")
+    ]
+    _write(paths[0], (user_record(u, vms, users) for u in range(users)))
+    _write(
+        paths[1],
+        (
+            fleet_record(vm_id, username(u))
+            for u in range(users)
+            for vm_id in vm_ids_for(u, vms, users)
+        ),
+    )
+    _write(
+        paths[2],
+        (
+            {
+                "username": username(u),
+                "password_hash": hashlib.sha256(
+                    password(username(u)).encode()
+                ).hexdigest(),
+            }
+            for u in range(users)
+        ),
+    )
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic fleet")
+    parser.add_argument("--vms", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args(argv)
+    for path in generate(args.out, args.vms, args.users):
+        print(f"{path}: {os.path.getsize(path) / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Timing, allocation and regression helpers shared by the benchmarks"""
+
+import gc
+import json
+import time
+import statistics
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List
+
+# Metrics compared against the baseline, with the absolute change below
+# which a slowdown is treated as noise
+REGRESSION_METRICS = {"p50_ms": 0.05, "p90_ms": 0.1, "alloc_bytes": 4096}
+
+
+@dataclass
+class Result:
+    """Latency percentiles and allocations of one benchmark"""
+
+    name: str
+    samples: int
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    alloc_bytes: int
+
+
+class Calls:
+    """Hands out increasing call numbers, so each call can use fresh inputs"""
+
+    def __init__(self):
+        self.count = 0
+
+    def next(self) -> int:
+        self.count += 1
+        return self.count - 1
+
+
+def measure(
+    name: str,
+    fn: Callable[[int], object],
+    repeat: int,
+    warmup: int = 3,
+    alloc_calls: int = 3,
+) -> Result:
+    """Times repeat calls of fn and measures the memory one call allocates
+
+    fn is called with a distinct call number every time. alloc_bytes is the
+    largest peak of traced memory above the starting point over alloc_calls
+    further calls, made with tracemalloc running so they are not timed.
+
+    Complexity: O(repeat) calls of fn"""
+    calls = Calls()
+    for _ in range(warmup):
+        fn(calls.next())
+    gc.collect()
+    samples = []
+    for _ in range(repeat):
+        call = calls.next()
+        start = time.perf_counter()
+        fn(call)
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    alloc = 0
+    for _ in range(alloc_calls):
+        call = calls.next()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(call)
+        alloc = max(alloc, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return Result(
+        name=name,
+        samples=len(samples),
+        mean_ms=statistics.fmean(samples),
+        p50_ms=cuts[49],
+        p90_ms=cuts[89],
+        p99_ms=cuts[98],
+        max_ms=max(samples),
+        alloc_bytes=alloc,
+    )
+
+
+def write_results(path: str, meta: dict, results: List[Result]):
+    """Writes a run's settings and results as JSON"""
+    with open(path, "w") as f:
+        json.dump(
+            {"meta": meta, "results": {r.name: asdict(r) for r in results}},
+            f,
+            indent=2,
+        )
+
+
+def load_results(path: str) -> dict:
+    """Reads a run written by write_results"""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def regressions(results: List[Result], baseline: dict, threshold: float) -> List[str]:
+    """Lists every metric more than threshold (a fraction) worse than baseline
+
+    Benchmarks missing from the baseline are skipped, and changes smaller
+    than the metric's noise floor in REGRESSION_METRICS never count
+
+    Complexity: O(r) where r is the number of results"""
+    found = []
+    previous: Dict[str, dict] = baseline.get("results", {})
+    for result in results:
+        before = previous.get(result.name)
+        if before is None:
+            continue
+        for metric, floor in REGRESSION_METRICS.items():
+            old = before[metric]
+            new = getattr(result, metric)
+            if new > old * (1 + threshold) and new - old > floor:
+                found.append(
+                    f"{result.name} {metric}: {old:.3f} -> {new:.3f}"
+                    f" (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)"
+                )
+    return found
+
+
+def format_table(results: List[Result]) -> str:
+    """Renders results as a fixed-width text table"""
+    lines = [
+        f"{'benchmark':<32} {'n':>5} {'p50 ms':>9} {'p90 ms':>9} "
+        f"{'p99 ms':>9} {'max ms':>9} {'alloc KiB':>10}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.name:<32} {r.samples:>5} {r.p50_ms:>9.3f} {r.p90_ms:>9.3f} "
+            f"{r.p99_ms:>9.3f} {r.max_ms:>9.3f} {r.alloc_bytes / 1024:>10.1f}"
+        )
+    return "\n".join(lines)
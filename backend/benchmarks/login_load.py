@@ -0,0 +1,167 @@
+"""Measures login throughput and its effect on other routes under concurrency
+
+Logs in from a number of concurrent client threads for a fixed time at each
+concurrency level, while one more thread keeps requesting random VMs, and
+reports logins per second, login latency percentiles, the logins refused
+with 503 and the latency of the VM requests beside them. Every user logs in
+once first, so the legacy SHA-256 hashes of a generated fleet are upgraded
+before timing starts.
+
+    python -m benchmarks.login_load --users 100 --concurrency 1 4 16
+    python -m benchmarks.login_load --password-workers 0   # KDF inline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import threading
+from typing import List
+from . import fleet
+from .run import prepare
+
+
+def percentile(samples: List[float], pct: int) -> float:
+    """Returns the pct-th percentile of samples, 0 if there are none"""
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def run_level(
+    app, users: List[str], vms: int, concurrency: int, seconds: float, seed: int
+) -> dict:
+    """Logs in from concurrency threads for seconds while probing GET /vms/<id>
+
+    Complexity: O(logins) requests"""
+    stop = threading.Event()
+    latencies: List[float] = []
+    probes: List[float] = []
+    statuses: dict = {}
+    lock = threading.Lock()
+
+    def login(worker: int):
+        client = app.test_client()
+        rng = random.Random(seed + worker)
+        while not stop.is_set():
+            name = rng.choice(users)
+            start = time.perf_counter()
+            response = client.post(
+                "/login", json={"username": name, "password": fleet.password(name)}
+            )
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                statuses[response.status_code] = (
+                    statuses.get(response.status_code, 0) + 1
+                )
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+
+    def probe():
+        client = app.test_client()
+        rng = random.Random(seed)
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get(f"/vms/{rng.randint(1, vms)}").get_data()
+            probes.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=login, args=(w,)) for w in range(concurrency)]
+    threads.append(threading.Thread(target=probe))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "logins_per_second": statuses.get(200, 0) / elapsed,
+        "login_p50_ms": percentile(latencies, 50),
+        "login_p99_ms": percentile(latencies, 99),
+        "refused": statuses.get(503, 0),
+        "failed": sum(
+            count for status, count in statuses.items() if status not in (200, 503)
+        ),
+        "probe_p50_ms": percentile(probes, 50),
+        "probe_p99_ms": percentile(probes, 99),
+    }
+
+
+def format_rows(rows: List[dict]) -> str:
+    """Renders the results of every level as an aligned text table"""
+    header = (
+        f"{'clients':>7} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'503s':>6} {'errors':>6} {'vm p50':>8} {'vm p99':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['concurrency']:>7} {row['logins_per_second']:>9.1f} "
+            f"{row['login_p50_ms']:>8.1f} {row['login_p99_ms']:>8.1f} "
+            f"{row['refused']:>6} {row['failed']:>6} "
+            f"{row['probe_p50_ms']:>8.2f} {row['probe_p99_ms']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark login throughput under concurrent load"
+    )
+    parser.add_argument("--vms", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument(
+        "--data", help="directory holding (or receiving) the fleet files"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument(
+        "--password-workers",
+        type=int,
+        help="processes verifying passwords (PASSWORD_WORKERS); 0 runs the KDF inline",
+    )
+    parser.add_argument(
+        "--queue", type=int, help="PASSWORD_QUEUE, the pending login limit"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="also write the results here as JSON")
+    args = parser.parse_args(argv)
+
+    if args.password_workers is not None:
+        os.environ["PASSWORD_WORKERS"] = str(args.password_workers)
+    if args.queue is not None:
+        os.environ["PASSWORD_QUEUE"] = str(args.queue)
+    prepare(args)
+    from app import app
+
+    users = [fleet.username(u) for u in range(args.users)]
+    client = app.test_client()
+    for name in users:
+        response = client.post(
+            "/login", json={"username": name, "password": fleet.password(name)}
+        )
+        assert response.status_code == 200, (name, response.status_code)
+    print(f"  {len(users)} users logged in once", file=sys.stderr)
+
+    rows = []
+    for concurrency in args.concurrency:
+        rows.append(
+            run_level(app, users, args.vms, concurrency, args.seconds, args.seed)
+        )
+        print(f"  {concurrency} clients done", file=sys.stderr)
+    print(format_rows(rows))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": vars(args), "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Measures the resident memory held by VM records at fleet scale
+
+Builds N VMs with realistic value repetition (a handful of podboxes,
+versions, statuses and owners) and reports the bytes retained per VM for
+the compact slotted model in vm_model.py and for an equivalent plain
+dataclass, along with the process's peak RSS.
+
+Run from the backend directory:
+
+    python -m benchmarks.memory_footprint --sizes 100000 1000000
+"""
+
+import gc
+import sys
+import argparse
+import resource
+import tracemalloc
+from dataclasses import dataclass
+from .fleet import owner_of, vm_record
+from vm_model import VM
+
+USERS = 2000
+
+
+@dataclass
+class PlainVM:
+    """The VM layout before interning and slots, kept for comparison"""
+
+    vm_id: int
+    deployedclustername: str
+    deployedclusterdescr: str
+    clusterdescr: str
+    podbox: str
+    version: str
+    deployedvmstatus: str
+    deployedvmtimestamp: str
+    deployedclusterowner: str
+
+
+def measure(model, size: int) -> int:
+    """Returns the bytes still allocated after building size VMs of model"""
+    gc.collect()
+    tracemalloc.start()
+    vms = [
+        model(**vm_record(vm_id, owner_of(vm_id, size, USERS)))
+        for vm_id in range(1, size + 1)
+    ]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del vms
+    gc.collect()
+    return retained
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args(argv)
+    print(f"{'VMs':>10} {'model':>8} {'MiB':>9} {'bytes/VM':>9}")
+    for size in args.sizes:
+        for name, model in (("plain", PlainVM), ("compact", VM)):
+            retained = measure(model, size)
+            print(
+                f"{size:>10} {name:>8} {retained / 2**20:>9.1f} {retained / size:>9.0f}"
+            )
+    print(f"peak RSS: {peak_rss_mb():.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Benchmarks every model method and Flask route on a synthetic fleet
+
+Generates a fleet (or reuses one from --data), points the storage layer at
+it, and measures latency percentiles and allocations for the User model,
+VMAuth and each route through Flask's test client. Results are printed,
+written as JSON to --out and, with --baseline, compared against an earlier
+run; the exit status is 1 if any metric regressed by more than --threshold.
+
+    python -m benchmarks.run --vms 100000 --users 1000 --save-baseline base.json
+    python -m benchmarks.run --vms 100000 --users 1000 --baseline base.json
+"""
+
+import os
+import sys
+import random
+import argparse
+import platform
+import tempfile
+from typing import List
+from . import fleet
+from .harness import (
+    Result,
+    format_table,
+    load_results,
+    measure,
+    regressions,
+    write_results,
+)
+
+# Repeats of the benchmarks costing a full listing, a delete or a password KDF
+HEAVY_REPEAT = 10
+# Users logged in before the route benchmarks that act as one of them
+SIGNED_IN_USERS = 32
+
+
+def prepare(args) -> str:
+    """Generates the fleet if needed and configures storage through the
+    environment; must run before any app module is imported"""
+    data_dir = args.data or tempfile.mkdtemp(prefix="fleet-")
+    users_data = os.path.join(data_dir, "users_data.json")
+    if not os.path.exists(users_data):
+        fleet.generate(data_dir, args.vms, args.users)
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ.setdefault("JWT_SECRET", "benchmark")
+    # Every benchmark client shares one address; set RATE_LIMITS to measure them
+    os.environ.setdefault("RATE_LIMITS", "off")
+    if args.backend == "sqlite":
+        db_path = os.path.join(data_dir, "fleet.db")
+        os.environ["SQLITE_PATH"] = db_path
+        from sqlite_repository import SQLiteRepository
+
+        SQLiteRepository(db_path).import_json(
+            users_data,
+            os.path.join(data_dir, "vms_all.json"),
+            os.path.join(data_dir, "users.json"),
+        )
+    return data_dir
+
+
+def run_benchmarks(args) -> List[Result]:
+    """Runs each benchmark whose name contains --only, deletes last"""
+    from app import app
+    from auth_controller import VMAuth
+    from user_model import User
+
+    rng = random.Random(args.seed)
+    users = [fleet.username(u) for u in range(args.users)]
+    # A reused --data directory no longer holds the VMs earlier runs deleted
+    owners = {vm["vm_id"]: vm["deployedclusterowner"] for vm in User.iter_all_vms()}
+    vm_ids = sorted(owners)
+    heavy = min(args.repeat, HEAVY_REPEAT)
+    doomed = rng.sample(vm_ids, min(len(vm_ids), 2 * (heavy + 10)))
+
+    def any_user(_):
+        return rng.choice(users)
+
+    def any_vm(_):
+        return rng.choice(vm_ids)
+
+    def token_for(name):
+        return VMAuth().authenticate(name, fleet.password(name))
+
+    # Log in every user a route benchmark acts as up front, so no measured
+    # request pays for the password KDF
+    signed_in = rng.sample(users, min(len(users), SIGNED_IN_USERS))
+    headers = {
+        name: {"Authorization": f"Bearer {token_for(name)}"}
+        for name in {*signed_in, *(owners[vm_id] for vm_id in doomed)}
+    }
+
+    def any_signed_in(_):
+        return headers[rng.choice(signed_in)]
+
+    client = app.test_client()
+
+    def get(path, headers=None):
+        response = client.get(path, headers=headers)
+        response.get_data()
+        assert response.status_code == 200, (path, response.status_code)
+
+    def delete_model(call):
+        vm_id = doomed.pop()
+        assert User.delete_vm(owners[vm_id], vm_id)
+
+    def delete_route(call):
+        vm_id = doomed.pop()
+        get(f"/vms/delete/{vm_id}", headers[owners[vm_id]])
+
+    def login(call):
+        name = any_user(call)
+        response = client.post(
+            "/login", json={"username": name, "password": fleet.password(name)}
+        )
+        assert response.status_code == 200
+
+    def lookup(call):
+        ids = ",".join(str(rng.choice(vm_ids)) for _ in range(50))
+        get(f"/vms/lookup?ids={ids}")
+
+    benchmarks = [
+        ("model.load_user", lambda c: User.load_user(any_user(c)), args.repeat),
+        ("model.get_vm", lambda c: User.get_vm(any_vm(c)), args.repeat),
+        ("model.get_all_vms", lambda c: User.get_all_vms(), heavy),
+        ("auth.authenticate", lambda c: token_for(any_user(c)), heavy),
+        ("route.POST /login", login, heavy),
+        (
+            "route.GET /vms_by_user",
+            lambda c: get("/vms_by_user", any_signed_in(c)),
+            args.repeat,
+        ),
+        ("route.GET /vms/<id>", lambda c: get(f"/vms/{any_vm(c)}"), args.repeat),
+        ("route.GET /vms/lookup", lookup, args.repeat),
+        (
+            "route.GET /vms/all?limit=50",
+            lambda c: get("/vms/all?limit=50&sort=deployedvmtimestamp"),
+            args.repeat,
+        ),
+        ("route.GET /vms/all", lambda c: get("/vms/all"), heavy),
+        ("model.delete_vm", delete_model, heavy),
+        ("route.GET /vms/delete/<id>", delete_route, heavy),
+    ]
+    results = []
+    for name, fn, repeat in benchmarks:
+        if args.only and args.only not in name:
+            continue
+        results.append(measure(name, fn, repeat))
+        print(f"  {name} done", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the backend on a synthetic fleet"
+    )
+    parser.add_argument("--vms", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument(
+        "--data", help="directory holding (or receiving) the fleet files"
+    )
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", help="run only benchmarks whose name contains this")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--save-baseline", help="also write the results here")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    data_dir = prepare(args)
+    results = run_benchmarks(args)
+    meta = {
+        "vms": args.vms,
+        "users": args.users,
+        "backend": args.backend,
+        "repeat": args.repeat,
+        "data_dir": data_dir,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    print(format_table(results))
+    write_results(args.out, meta, results)
+    if args.save_baseline:
+        write_results(args.save_baseline, meta, results)
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        for key in ("vms", "users", "backend"):
+            if baseline["meta"].get(key) != meta[key]:
+                print(
+                    f"warning: baseline {key} is {baseline['meta'].get(key)!r},"
+                    f" this run used {meta[key]!r}",
+                    file=sys.stderr,
+                )
+        found = regressions(results, baseline, args.threshold)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
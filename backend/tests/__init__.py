@@ -0,0 +1,17 @@
+import os
+import atexit
+import shutil
+import tempfile
+
+# Serve the app from a scratch copy of the mock data, so deletes, journals
+# and snapshots made by the tests never land in backend/mock_data
+if "DATA_DIR" not in os.environ:
+    DATA_DIR = tempfile.mkdtemp(prefix="cluster_manager_tests_")
+    atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), "..", "mock_data"),
+        DATA_DIR,
+        dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns("*.snapshot", "*.journal", "*.db", "*.tmp"),
+    )
+    os.environ["DATA_DIR"] = DATA_DIR
@@ -1,11 +1,27 @@
+import gzip
+import json
+import time
 import unittest
-from unittest.mock import patch
-from app.app import app
+from unittest.mock import MagicMock, patch
+from app.app import (
+    app,
+    MAX_DELETE_IDS,
+    RATE_LIMITER,
+    RESPONSE_CACHE,
+    TOKEN_CACHE,
+    VerifierBusy,
+)
+from app.change_feed import ChangeFeed
+from app.rate_limit import ConcurrencyLimit, RateLimiter
+from app.response_encoding import COLUMNAR
 
 
 class AppRoutesTestCase(unittest.TestCase):
     def setUp(self):
         self.client = app.test_client()
+        TOKEN_CACHE.clear()
+        RESPONSE_CACHE.clear()
+        RATE_LIMITER.clear()
 
     @patch("app.app.VMAuth")
     def test_login_success(self, mock_auth):
@@ -25,6 +41,15 @@ class AppRoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 401)
         self.assertIn("login_status", response.get_json())
 
+    @patch("app.app.VMAuth")
+    def test_login_busy(self, mock_auth):
+        mock_auth.return_value.authenticate.side_effect = VerifierBusy("busy")
+        response = self.client.post(
+            "/login", json={"username": "user", "password": "pass"}
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
     @patch("app.app.get_username_from_token", return_value="user")
     @patch("app.app.User")
     def test_whoami_success(self, mock_user, mock_token):
@@ -48,6 +73,22 @@ class AppRoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.get_json()["token_validated"])
 
+    @patch("app.app.User")
+    @patch("app.app.VMAuth")
+    def test_token_verified_once(self, mock_auth, mock_user):
+        payload = {"username": "user", "exp": time.time() + 60}
+        mock_auth.return_value.validate_token.return_value = (True, payload)
+        mock_user.load_user.return_value.whoami.return_value = "user"
+        for _ in range(3):
+            response = self.client.get(
+                "/whoami", headers={"Authorization": "Bearer cached"}
+            )
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post("/validate", json={"token": "cached"})
+        self.assertTrue(response.get_json()["token_validated"])
+        mock_auth.return_value.validate_token.assert_called_once_with("cached")
+        self.assertEqual(TOKEN_CACHE.stats()["hits"], 3)
+
     @patch("app.app.VMAuth")
     def test_validate_token_invalid(self, mock_auth):
         mock_auth.return_value.validate_token.return_value = (False, "error")
@@ -72,18 +113,325 @@ class AppRoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("id", response.get_json())
 
+    @patch("app.app.User")
+    def test_get_vm_cached_per_version(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.get_vm.return_value = {"vm_id": 1}
+        self.client.get("/vms/1")
+        response = self.client.get("/vms/1")
+        self.assertEqual(response.get_json(), {"vm_id": 1})
+        mock_user.get_vm.assert_called_once()
+        mock_user.data_version.return_value = 2
+        self.client.get("/vms/1")
+        self.assertEqual(mock_user.get_vm.call_count, 2)
+
+    @patch("app.app.User")
+    def test_vm_list_stream_fills_cache(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.iter_all_vms.side_effect = lambda: iter([{"vm_id": 1}])
+        first = self.client.get("/vms/all")
+        self.assertTrue(first.is_streamed)
+        self.assertEqual(first.get_json(), [{"vm_id": 1}])
+        second = self.client.get("/vms/all")
+        self.assertNotIn("Content-Length", first.headers)
+        self.assertEqual(second.headers["Content-Length"], str(len(second.data)))
+        self.assertEqual(second.get_json(), [{"vm_id": 1}])
+        mock_user.iter_all_vms.assert_called_once()
+        stats = self.client.get("/cache/stats").get_json()["responses"]
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    @patch("app.app.User")
+    def test_metrics_records_route_latency(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.get_vm.return_value = None
+        mock_user.iter_all_vms.return_value = iter([{"vm_id": 1}])
+        self.client.get("/vms/999")
+        self.client.get("/vms/all").get_data()
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        text = response.get_data(as_text=True)
+        self.assertIn(
+            'cluster_manager_request_duration_seconds_count{route="/vms/<int:vm_id>",'
+            'method="GET",status="404"}',
+            text,
+        )
+        self.assertIn(
+            'cluster_manager_request_duration_seconds_count{route="/vms/all",'
+            'method="GET",status="200"}',
+            text,
+        )
+        self.assertIn('cluster_manager_cache_hit_ratio{cache="tokens"}', text)
+
+    @patch("app.app.User")
+    def test_search_vms(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.search_vms.return_value = ([{"vm_id": 12}], 3, True)
+        response = self.client.get("/vms/search?q=web&limit=1")
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual((body["items"], body["total"]), ([{"vm_id": 12}], 3))
+        search = mock_user.search_vms.call_args[0][0]
+        self.assertEqual((search.q, search.limit, search.offset), ("web", 1, 0))
+        response = self.client.get(
+            f"/vms/search?q=web&limit=1&cursor={body['next_cursor']}"
+        )
+        self.assertEqual(mock_user.search_vms.call_args[0][0].offset, 1)
+
+    @patch("app.app.User")
+    def test_search_vms_last_page_and_errors(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.search_vms.return_value = ([{"vm_id": 12}], 1, True)
+        body = self.client.get("/vms/search?q=web").get_json()
+        self.assertIsNone(body["next_cursor"])
+        self.assertEqual(self.client.get("/vms/search?limit=0").status_code, 400)
+
+    @patch("app.app.User")
+    def test_vm_stats(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.fleet_stats.return_value = {
+            "total": 2,
+            "counts": {"version": {"1.0": 2}},
+        }
+        body = self.client.get("/vms/stats?podbox=PODBOX1&by=version").get_json()
+        mock_user.fleet_stats.assert_called_once_with(
+            {"podbox": "PODBOX1"}, ["version"]
+        )
+        self.assertEqual(body["filters"], {"podbox": "PODBOX1"})
+        self.assertEqual(body["counts"], {"version": {"1.0": 2}})
+        self.assertEqual(self.client.get("/vms/stats?by=color").status_code, 400)
+
     @patch("app.app.User")
     def test_get_vm_not_found(self, mock_user):
         mock_user.get_vm.return_value = None
         response = self.client.get("/vms/999")
         self.assertEqual(response.status_code, 404)
 
+    @patch("app.app.User")
+    def test_get_vm_conditional(self, mock_user):
+        mock_user.data_version.return_value = 1_700_000_000_000_000_000
+        mock_user.get_vm.return_value = {"vm_id": 1}
+        response = self.client.get("/vms/1")
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        self.assertEqual(etag, 'W/"v1700000000000000000"')
+
+        mock_user.get_vm.reset_mock()
+        response = self.client.get("/vms/1", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        mock_user.get_vm.assert_not_called()
+
+        self.assertEqual(last_modified, "Tue, 14 Nov 2023 22:13:20 GMT")
+        response = self.client.get(
+            "/vms/1", headers={"If-Modified-Since": last_modified}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        mock_user.data_version.return_value += 1_000_000_000
+        response = self.client.get(
+            "/vms/1", headers={"If-Modified-Since": last_modified}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/vms/1", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    @patch("app.app.User")
+    def test_get_vm_not_found_has_no_etag(self, mock_user):
+        mock_user.get_vm.return_value = None
+        response = self.client.get("/vms/999")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response.headers)
+
+    @patch("app.app.get_username_from_token")
+    @patch("app.app.User")
+    def test_list_of_vms_etag_per_user(self, mock_user, mock_token):
+        mock_user.data_version.return_value = 1
+        mock_user.load_user.return_value.vms_user.return_value = []
+        mock_token.return_value = "alice"
+        alice = self.client.get("/vms_by_user").headers["ETag"]
+        mock_token.return_value = "bob"
+        response = self.client.get("/vms_by_user", headers={"If-None-Match": alice})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], alice)
+        self.assertIn("Authorization", response.headers["Vary"])
+        mock_token.return_value = "alice"
+        response = self.client.get("/vms_by_user", headers={"If-None-Match": alice})
+        self.assertEqual(response.status_code, 304)
+
+    @patch("app.app.get_username_from_token")
+    @patch("app.app.User")
+    def test_list_of_vms_not_cached_under_later_version(self, mock_user, mock_token):
+        mock_token.return_value = "alice"
+        state = {"version": 1, "vms": [{"vm_id": 1}, {"vm_id": 2}]}
+        mock_user.data_version.side_effect = lambda: state["version"]
+
+        def load_user(username):
+            user = MagicMock()
+            user.vms_user.return_value = list(state["vms"])
+            # A delete lands after the listing was read but before it is cached
+            state["version"], state["vms"] = 2, [{"vm_id": 1}]
+            return user
+
+        mock_user.load_user.side_effect = load_user
+        response = self.client.get("/vms_by_user")
+        self.assertEqual(response.get_json(), [{"vm_id": 1}, {"vm_id": 2}])
+        self.assertEqual(response.headers["X-Data-Version"], "1")
+        response = self.client.get("/vms_by_user")
+        self.assertEqual(response.get_json(), [{"vm_id": 1}])
+        self.assertEqual(response.headers["X-Data-Version"], "2")
+
+    @patch("app.app.User")
+    def test_get_vms_lookup(self, mock_user):
+        mock_user.get_vms.return_value = ([{"vm_id": 1, "podbox": "p"}], [2])
+        response = self.client.get("/vms/lookup?ids=1,2&fields=podbox")
+        self.assertEqual(response.status_code, 200)
+        mock_user.get_vms.assert_called_once_with([1, 2], fields=["podbox"])
+        self.assertEqual(response.get_json()["missing"], [2])
+
+    def test_get_vms_lookup_bad_args(self):
+        for query in ("", "ids=a,b", "ids=1&fields=password"):
+            response = self.client.get(f"/vms/lookup?{query}")
+            self.assertEqual(response.status_code, 400)
+
     @patch("app.app.User")
     def test_vm_list(self, mock_user):
-        mock_user.get_all_vms.return_value = {"all_vms": []}
+        mock_user.iter_all_vms.return_value = iter([{"vm_id": 1}, {"vm_id": 2}])
         response = self.client.get("/vms/all")
         self.assertEqual(response.status_code, 200)
-        self.assertIn("all_vms", response.get_json())
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json(), [{"vm_id": 1}, {"vm_id": 2}])
+
+    @patch("app.app.User")
+    def test_vm_list_gzip(self, mock_user):
+        records = [{"vm_id": i, "podbox": "PODBOX16"} for i in range(200)]
+        mock_user.data_version.return_value = 1
+        mock_user.iter_all_vms.side_effect = lambda: iter(records)
+        for _ in range(2):
+            response = self.client.get("/vms/all", headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertEqual(json.loads(gzip.decompress(response.data)), records)
+        mock_user.iter_all_vms.assert_called_once()
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+
+    @patch("app.app.User")
+    def test_vm_list_columnar(self, mock_user):
+        mock_user.data_version.return_value = 2
+        mock_user.iter_all_vms.side_effect = lambda: iter([{"vm_id": 7}])
+        response = self.client.get("/vms/all", headers={"Accept": COLUMNAR})
+        self.assertEqual(response.mimetype, COLUMNAR)
+        self.assertEqual(response.get_json()["rows"][0][0], 7)
+        self.assertTrue(
+            response.headers["ETag"].endswith('-vnd.cluster-manager.columnar+json"')
+        )
+
+    @patch("app.app.STREAM_THRESHOLD", 1)
+    @patch("app.app.get_username_from_token", return_value="user")
+    @patch("app.app.User")
+    def test_list_of_vms_streams_large_listing(self, mock_user, mock_token):
+        vm = MagicMock()
+        vm.to_dict.return_value = {"vm_id": 1}
+        mock_user.load_user.return_value.vms_user.return_value = [vm, vm]
+        response = self.client.get(
+            "/vms_by_user", headers={"Authorization": "Bearer fake"}
+        )
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json(), [{"vm_id": 1}, {"vm_id": 1}])
+
+    @patch("app.app.User")
+    def test_vm_list_paged(self, mock_user):
+        mock_user.query_vms.return_value = ([{"vm_id": 1}], 5, "next")
+        response = self.client.get("/vms/all?limit=1&sort=vm_id&podbox=box1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_json(),
+            {"items": [{"vm_id": 1}], "total": 5, "next_cursor": "next"},
+        )
+        query = mock_user.query_vms.call_args.args[0]
+        self.assertEqual((query.limit, query.filters), (1, {"podbox": "box1"}))
+
+    def test_vm_list_paged_bad_args(self):
+        response = self.client.get("/vms/all?sort=password")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/vms/all?deployed_after=last-week")
+        self.assertEqual(response.status_code, 400)
+
+    @patch("app.app.User")
+    def test_vm_list_time_range(self, mock_user):
+        mock_user.query_vms.return_value = ([], 0, None)
+        response = self.client.get(
+            "/vms/all?status=FAILED&deployed_after=2024-01-01T00:00:00Z"
+        )
+        self.assertEqual(response.status_code, 200)
+        query = mock_user.query_vms.call_args.args[0]
+        self.assertEqual(query.filters, {"status": "FAILED"})
+        self.assertEqual(query.time_range, (1704067200000000, None))
+
+    @patch("app.app.get_username_from_token", return_value="user")
+    @patch("app.app.User")
+    def test_list_of_vms_paged(self, mock_user, mock_token):
+        mock_user.query_vms.return_value = ([], 0, None)
+        response = self.client.get(
+            "/vms_by_user?limit=10", headers={"Authorization": "Bearer fake"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_user.query_vms.call_args.kwargs, {"owner": "user"})
+
+    @patch("app.app.CHANGE_FEED", new_callable=ChangeFeed)
+    @patch("app.app.User")
+    def test_vm_list_since(self, mock_user, feed):
+        mock_user.data_version.return_value = 10
+        mock_user.query_vms.return_value = ([], 0, None)
+        listing = self.client.get("/vms/all?limit=1")
+        self.assertEqual(listing.headers["X-Data-Version"], "10")
+        feed.record(10, 11, "alice", {1, 2})
+        mock_user.data_version.return_value = 11
+        response = self.client.get("/vms/all?since=10")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["version"], 11)
+        self.assertEqual(
+            response.get_json()["changes"],
+            [
+                {"version": 11, "op": "delete", "vm_id": 1, "owner": "alice"},
+                {"version": 11, "op": "delete", "vm_id": 2, "owner": "alice"},
+            ],
+        )
+        self.assertEqual(self.client.get("/vms/all?since=11").get_json()["changes"], [])
+        too_old = self.client.get("/vms/all?since=9")
+        self.assertEqual(too_old.status_code, 410)
+        self.assertEqual(too_old.get_json()["version"], 11)
+        self.assertEqual(self.client.get("/vms/all?since=x").status_code, 400)
+        mock_user.query_vms.assert_called_once()
+
+    @patch("app.app.CHANGE_FEED", new_callable=ChangeFeed)
+    @patch("app.app.get_username_from_token", return_value="bob")
+    @patch("app.app.User")
+    def test_list_of_vms_since_only_own(self, mock_user, mock_token, feed):
+        mock_user.data_version.return_value = 12
+        feed.start(10)
+        feed.record(10, 11, "alice", {1})
+        feed.record(11, 12, "bob", {2})
+        response = self.client.get(
+            "/vms_by_user?since=10", headers={"Authorization": "Bearer fake"}
+        )
+        self.assertEqual(
+            [stone["vm_id"] for stone in response.get_json()["changes"]], [2]
+        )
+
+    @patch("app.app.CHANGE_FEED", new_callable=ChangeFeed)
+    @patch("app.app.User")
+    def test_vm_changes_stream(self, mock_user, feed):
+        mock_user.data_version.return_value = 11
+        feed.start(10)
+        feed.record(10, 11, "alice", {1})
+        response = self.client.get("/vms/changes", headers={"Last-Event-ID": "10"})
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = iter(response.response)
+        next(events)
+        self.assertIn(b"id: 11\nevent: delete\n", next(events))
+        response.close()
+        self.assertEqual(self.client.get("/vms/changes?since=x").status_code, 400)
 
     @patch("app.app.get_username_from_token", return_value="user")
     @patch("app.app.User")
@@ -110,6 +458,99 @@ class AppRoutesTestCase(unittest.TestCase):
         response = self.client.get("/vms/delete/1")
         self.assertEqual(response.status_code, 401)
 
+    @patch("app.app.RATE_LIMITER", RateLimiter({"login": (0.5, 2)}))
+    @patch("app.app.VMAuth")
+    def test_login_rate_limited_by_address(self, mock_auth):
+        mock_auth.return_value.authenticate.return_value = "fake_token"
+        statuses = []
+        for address in ("10.0.0.1", "10.0.0.1", "10.0.0.1", "10.0.0.2"):
+            response = self.client.post(
+                "/login",
+                json={"username": "user", "password": "pass"},
+                environ_base={"REMOTE_ADDR": address},
+            )
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 200, 429, 200])
+
+    @patch("app.app.RATE_LIMITER", RateLimiter({"read": (1.0, 1)}))
+    @patch("app.app.User")
+    def test_reads_rate_limited_per_user_and_route(self, mock_user):
+        mock_user.data_version.return_value = 1
+        mock_user.get_vm.return_value = {"vm_id": 1}
+        with patch("app.app.get_username_from_token", return_value="alice"):
+            self.assertEqual(self.client.get("/vms/1").status_code, 200)
+            limited = self.client.get("/vms/2")
+            self.assertEqual(limited.status_code, 429)
+            self.assertEqual(limited.headers["Retry-After"], "1")
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+        with patch("app.app.get_username_from_token", return_value="bob"):
+            self.assertEqual(self.client.get("/vms/1").status_code, 200)
+
+    @patch("app.app.WRITE_LIMIT", ConcurrencyLimit(1))
+    @patch("app.app.get_username_from_token", return_value="user")
+    @patch("app.app.User")
+    def test_write_concurrency_cap(self, mock_user, mock_token):
+        from app.app import WRITE_LIMIT
+
+        mock_user.delete_vm.return_value = True
+        self.assertTrue(WRITE_LIMIT.try_enter())
+        response = self.client.get(
+            "/vms/delete/1", headers={"Authorization": "Bearer fake"}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        WRITE_LIMIT.leave()
+        for _ in range(2):
+            response = self.client.get(
+                "/vms/delete/1", headers={"Authorization": "Bearer fake"}
+            )
+            self.assertEqual(response.status_code, 200)
+
+    @patch("app.app.get_username_from_token", return_value="user")
+    @patch("app.app.User")
+    def test_vm_cluster_bulk_delete_success(self, mock_user, mock_token):
+        mock_user.delete_vms.return_value = {1: "deleted", 2: "deleted"}
+        response = self.client.post(
+            "/vms/delete",
+            json={"vm_ids": [1, 2]},
+            headers={"Authorization": "Bearer fake"},
+        )
+        self.assertEqual(response.status_code, 200)
+        mock_user.delete_vms.assert_called_once_with(username="user", vm_ids=[1, 2])
+        self.assertEqual(
+            response.get_json()["results"], {"1": "deleted", "2": "deleted"}
+        )
+
+    @patch("app.app.get_username_from_token", return_value="user")
+    @patch("app.app.User")
+    def test_vm_cluster_bulk_delete_partial(self, mock_user, mock_token):
+        mock_user.delete_vms.return_value = {1: "deleted", 2: "forbidden"}
+        response = self.client.post(
+            "/vms/delete",
+            json={"vm_ids": [1, 2]},
+            headers={"Authorization": "Bearer fake"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()["success"])
+        self.assertEqual(response.get_json()["results"]["2"], "forbidden")
+
+    @patch("app.app.get_username_from_token", return_value="user")
+    @patch("app.app.User")
+    def test_vm_cluster_bulk_delete_bad_payload(self, mock_user, mock_token):
+        for vm_ids in (["1"], [], list(range(MAX_DELETE_IDS + 1))):
+            response = self.client.post(
+                "/vms/delete",
+                json={"vm_ids": vm_ids},
+                headers={"Authorization": "Bearer fake"},
+            )
+            self.assertEqual(response.status_code, 400)
+        mock_user.delete_vms.assert_not_called()
+
+    @patch("app.app.get_username_from_token", return_value=None)
+    def test_vm_cluster_bulk_delete_unauthenticated(self, mock_token):
+        response = self.client.post("/vms/delete", json={"vm_ids": [1]})
+        self.assertEqual(response.status_code, 401)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,27 +1,62 @@
 import unittest
-from unittest.mock import patch, mock_open
+from unittest.mock import patch
+import tempfile
+import json
 import os
 
 from app.auth_controller import VMAuth
+from app.credential_store import CredentialStore
+from app.password_hasher import PasswordVerifier, VerifierBusy
 
 
 class TestVMAuth(unittest.TestCase):
     @patch.dict(os.environ, {"JWT_SECRET": "testsecret"})
-    @patch(
-        "builtins.open",
-        new_callable=mock_open,
-        read_data='[{"username": "user1",'
-                  '"password_hash": "5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8"}]',
-    )
-    @patch("os.path.exists", return_value=True)
-    def setUp(self, mock_exists, mock_file):
-        self.auth = VMAuth()
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.users_file = os.path.join(self.tmpdir.name, "users.json")
+        self.write_users(
+            [
+                {
+                    "username": "user1",
+                    "password_hash": "5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8",
+                }
+            ]
+        )
+        self.auth = VMAuth(credentials=CredentialStore(self.users_file))
+
+    def write_users(self, users):
+        with open(self.users_file, "w") as f:
+            json.dump(users, f)
+
+    def read_users(self):
+        with open(self.users_file) as f:
+            return json.load(f)
 
     def test_hash_password(self):
         hashed = self.auth._hash_password("password")
-        self.assertEqual(
-            hashed, "5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8"
-        )
+        self.assertTrue(hashed.startswith(("scrypt$", "pbkdf2_sha256$")))
+        self.assertNotEqual(hashed, self.auth._hash_password("password"))
+
+    def test_legacy_hash_upgraded_on_login(self):
+        self.auth.authenticate("user1", "password")
+        upgraded = self.read_users()[0]["password_hash"]
+        self.assertTrue(upgraded.startswith(("scrypt$", "pbkdf2_sha256$")))
+        self.assertIsInstance(self.auth.authenticate("user1", "password"), str)
+        self.assertEqual(self.read_users()[0]["password_hash"], upgraded)
+        with self.assertRaises(RuntimeError):
+            self.auth.authenticate("user1", "wrongpassword")
+
+    def test_failed_login_keeps_legacy_hash(self):
+        with self.assertRaises(RuntimeError):
+            self.auth.authenticate("user1", "wrongpassword")
+        self.assertEqual(len(self.read_users()[0]["password_hash"]), 64)
+
+    def test_busy_verifier(self):
+        verifier = PasswordVerifier(workers=1, max_pending=0)
+        auth = VMAuth(credentials=self.auth.credentials, verifier=verifier)
+        with self.assertRaises(VerifierBusy):
+            auth.authenticate("user1", "password")
 
     def test_authenticate_success(self):
         token = self.auth.authenticate("user1", "password")
@@ -31,6 +66,28 @@ class TestVMAuth(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             self.auth.authenticate("user1", "wrongpassword")
 
+    def test_authenticate_unknown_user(self):
+        with self.assertRaises(RuntimeError):
+            self.auth.authenticate("nobody", "password")
+
+    def test_credentials_loaded_once(self):
+        self.auth.authenticate("user1", "password")
+        with patch("builtins.open") as mock_file:
+            VMAuth(credentials=self.auth.credentials).authenticate("user1", "password")
+        mock_file.assert_not_called()
+
+    def test_credentials_reload_on_change(self):
+        self.auth.authenticate("user1", "password")
+        self.write_users(
+            [
+                {"username": "user2", "password_hash": self.auth._hash_password("pw2")},
+                {"username": "user3", "password_hash": self.auth._hash_password("pw3")},
+            ]
+        )
+        self.assertIsInstance(self.auth.authenticate("user2", "pw2"), str)
+        with self.assertRaises(RuntimeError):
+            self.auth.authenticate("user1", "password")
+
     def test_generate_jwt_and_validate(self):
         token = self.auth._generate_jwt("user1")
         is_valid, payload = self.auth.validate_token(token)
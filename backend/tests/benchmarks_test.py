@@ -0,0 +1,130 @@
+import os
+import json
+import tempfile
+import unittest
+
+from benchmarks import fleet
+from benchmarks.dashboard_load import (
+    Recorder,
+    format_level,
+    ramp,
+    saturation,
+    summarize,
+)
+from benchmarks.harness import Result, measure, regressions
+from benchmarks.login_load import format_rows, percentile
+
+
+class TestFleet(unittest.TestCase):
+    def test_owner_of_inverts_vm_ids_for(self):
+        for vms, users in ((10, 3), (7, 7), (100, 9)):
+            seen = []
+            for user_index in range(users):
+                for vm_id in fleet.vm_ids_for(user_index, vms, users):
+                    self.assertEqual(
+                        fleet.owner_of(vm_id, vms, users), fleet.username(user_index)
+                    )
+                    seen.append(vm_id)
+            self.assertEqual(seen, list(range(1, vms + 1)))
+
+    def test_generate_writes_consistent_files(self):
+        with tempfile.TemporaryDirectory() as out:
+            fleet.generate(out, 10, 3)
+            with open(os.path.join(out, "users_data.json")) as f:
+                users = json.load(f)
+            with open(os.path.join(out, "vms_all.json")) as f:
+                vms_all = json.load(f)
+            with open(os.path.join(out, "users.json")) as f:
+                credentials = json.load(f)
+        self.assertEqual(len(users), 3)
+        self.assertEqual(sum(len(u["vms"]) for u in users), 10)
+        self.assertEqual(sorted(vm["vm_id"] for vm in vms_all), list(range(1, 11)))
+        self.assertEqual(len(credentials), 3)
+
+
+class TestHarness(unittest.TestCase):
+    def result(self, p50, alloc=0):
+        return Result("bench", 10, p50, p50, p50, p50, p50, alloc)
+
+    def test_measure_counts_samples(self):
+        calls = []
+        result = measure("bench", calls.append, 20, warmup=2, alloc_calls=1)
+        self.assertEqual(result.samples, 20)
+        self.assertEqual(calls, list(range(23)))
+        self.assertLessEqual(result.p50_ms, result.max_ms)
+
+    def test_regressions_respect_threshold_and_noise_floor(self):
+        baseline = {"results": {"bench": vars(self.result(1.0))}}
+        self.assertEqual(regressions([self.result(1.2)], baseline, 0.25), [])
+        self.assertEqual(len(regressions([self.result(2.0)], baseline, 0.25)), 2)
+        small = {"results": {"bench": vars(self.result(0.01))}}
+        self.assertEqual(regressions([self.result(0.05)], small, 0.25), [])
+
+    def test_regressions_skip_new_benchmarks(self):
+        self.assertEqual(regressions([self.result(5.0)], {"results": {}}, 0.25), [])
+
+
+class TestLoginLoad(unittest.TestCase):
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+        self.assertEqual(percentile([float(i) for i in range(1, 102)], 50), 51.0)
+
+    def test_format_rows(self):
+        row = {
+            "concurrency": 4,
+            "logins_per_second": 12.5,
+            "login_p50_ms": 80.0,
+            "login_p99_ms": 120.0,
+            "refused": 2,
+            "failed": 0,
+            "probe_p50_ms": 1.0,
+            "probe_p99_ms": 5.0,
+        }
+        table = format_rows([row]).splitlines()
+        self.assertEqual(len(table), 3)
+        self.assertEqual(
+            table[2].split(), ["4", "12.5", "80.0", "120.0", "2", "0", "1.00", "5.00"]
+        )
+
+
+class TestDashboardLoad(unittest.TestCase):
+    def test_summarize(self):
+        recorder = Recorder()
+        for ms in (1.0, 2.0, 3.0):
+            recorder.record("GET /vms/all", 200, ms)
+        recorder.record("GET /vms/all", 304, 0.5)
+        recorder.record("POST /login", 503, 9.0)
+        recorder.record("POST /login", 0, 1.0)
+        recorder.page_loaded()
+        level = summarize(recorder, 4, 2.0)
+        self.assertEqual(level["requests_per_second"], 3.0)
+        self.assertEqual(level["page_loads_per_second"], 0.5)
+        self.assertAlmostEqual(level["error_rate"], 2 / 6)
+        listing = level["routes"]["GET /vms/all"]
+        self.assertEqual((listing["requests"], listing["error_rate"]), (4, 0.0))
+        self.assertEqual(listing["statuses"], {"200": 3, "304": 1})
+        self.assertEqual(level["routes"]["POST /login"]["error_rate"], 1.0)
+        self.assertEqual(len(format_level(level).splitlines()), 5)
+
+    def test_ramp(self):
+        self.assertEqual(list(ramp(1, 10)), [1, 2, 4, 8])
+
+    def test_saturation(self):
+        def level(clients, rps, errors=0.0):
+            return {
+                "clients": clients,
+                "requests_per_second": rps,
+                "error_rate": errors,
+            }
+
+        levels = [level(1, 100), level(2, 190)]
+        self.assertEqual(saturation(levels, 0.05, 0.01), (False, levels[1]))
+        levels.append(level(4, 195))
+        self.assertEqual(saturation(levels, 0.05, 0.01), (True, levels[2]))
+        levels = [level(1, 100), level(2, 300, errors=0.2)]
+        self.assertEqual(saturation(levels, 0.05, 0.01), (True, levels[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
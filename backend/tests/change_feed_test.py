@@ -0,0 +1,119 @@
+import json
+import threading
+import unittest
+from unittest.mock import patch
+
+from app.change_feed import ChangeFeed, event_stream, tombstones
+
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self):
+        self.feed = ChangeFeed(max_changes=5)
+        self.feed.start(10)
+
+    def test_changes_since(self):
+        self.feed.record(10, 11, "alice", {2, 1})
+        self.feed.record(11, 12, "bob", {3})
+        self.assertEqual(
+            self.feed.changes_since(10, 12),
+            (12, [(11, "alice", (1, 2)), (12, "bob", (3,))]),
+        )
+        self.assertEqual(self.feed.changes_since(11, 12), (12, [(12, "bob", (3,))]))
+        self.assertEqual(self.feed.changes_since(12, 12), (12, []))
+
+    def test_unknown_versions_need_reload(self):
+        self.feed.record(10, 11, "alice", {1})
+        self.assertEqual(self.feed.changes_since(9, 11), (11, None))
+        self.assertEqual(self.feed.changes_since(13, 11), (11, None))
+
+    def test_oldest_changes_dropped(self):
+        self.feed.record(10, 11, "alice", {1, 2, 3})
+        self.feed.record(11, 12, "alice", {4, 5})
+        self.assertEqual(
+            self.feed.changes_since(10, 12)[1],
+            [(11, "alice", (1, 2, 3)), (12, "alice", (4, 5))],
+        )
+        self.feed.record(12, 13, "bob", {6})
+        self.assertIsNone(self.feed.changes_since(10, 13)[1])
+        self.assertEqual(
+            self.feed.changes_since(11, 13)[1],
+            [(12, "alice", (4, 5)), (13, "bob", (6,))],
+        )
+        self.assertEqual(self.feed.stats()["vms"], 3)
+
+    def test_delete_from_unknown_version_resets(self):
+        self.feed.record(10, 11, "alice", {1})
+        self.feed.record(15, 16, "alice", {2})
+        self.assertIsNone(self.feed.changes_since(11, 16)[1])
+        self.assertEqual(self.feed.changes_since(16, 16), (16, []))
+
+    @patch("app.change_feed.SETTLE_SECONDS", 0)
+    def test_unrecorded_version_resets(self):
+        self.feed.record(10, 11, "alice", {1})
+        self.assertEqual(self.feed.changes_since(10, 20), (20, None))
+        self.assertEqual(self.feed.stats()["oldest_version"], 20)
+
+    def test_waits_for_delete_being_reported(self):
+        timer = threading.Timer(0.01, self.feed.record, (10, 11, "alice", {1}))
+        timer.start()
+        self.assertEqual(self.feed.changes_since(10, 11), (11, [(11, "alice", (1,))]))
+        timer.join()
+
+    def test_starts_at_first_delete_without_start(self):
+        feed = ChangeFeed()
+        feed.record(3, 4, "alice", {1})
+        self.assertEqual(feed.changes_since(3, 4), (4, [(4, "alice", (1,))]))
+
+    def test_wait(self):
+        self.assertFalse(self.feed.wait(10, 0))
+        self.feed.record(10, 11, "alice", {1})
+        self.assertTrue(self.feed.wait(10, 0))
+
+    def test_tombstones(self):
+        changes = [(11, "alice", (1, 2)), (12, "bob", (3,))]
+        self.assertEqual(
+            tombstones(changes, owner="bob"),
+            [{"version": 12, "op": "delete", "vm_id": 3, "owner": "bob"}],
+        )
+        self.assertEqual([stone["vm_id"] for stone in tombstones(changes)], [1, 2, 3])
+
+
+class TestEventStream(unittest.TestCase):
+    def setUp(self):
+        self.feed = ChangeFeed()
+        self.feed.start(10)
+        self.version = 10
+
+    def current(self):
+        return self.version
+
+    def test_streams_deletes_after_version(self):
+        self.feed.record(10, 11, "alice", {1})
+        self.version = 11
+        events = event_stream(self.feed, self.current, 10, poll_seconds=0)
+        self.assertEqual(next(events), "retry: 3000\n\n")
+        event = next(events)
+        self.assertTrue(event.startswith("id: 11\nevent: delete\ndata: "))
+        data = json.loads(event.split("data: ", 1)[1])
+        self.assertEqual(data, {"version": 11, "owner": "alice", "vm_ids": [1]})
+        self.feed.record(11, 12, "bob", {2})
+        self.version = 12
+        self.assertTrue(next(events).startswith("id: 12\nevent: delete"))
+
+    def test_heartbeat_when_idle(self):
+        events = event_stream(
+            self.feed, self.current, poll_seconds=0.001, heartbeat_seconds=0.002
+        )
+        next(events)
+        self.assertEqual(next(events), ": keepalive\n\n")
+
+    def test_reset_when_too_old(self):
+        events = event_stream(self.feed, self.current, 5, poll_seconds=0)
+        next(events)
+        self.assertEqual(
+            next(events), 'id: 10\nevent: reset\ndata: {"version": 10}\n\n'
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
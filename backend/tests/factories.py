@@ -0,0 +1,39 @@
+from app.vm_model import VM
+
+
+def make_vm_record(vm_id, owner="alice", **fields):
+    """Returns a VM record as stored in users_data.json, with fields
+    overriding the defaults"""
+    record = {
+        "vm_id": vm_id,
+        "deployedclustername": f"{owner}_{vm_id}",
+        "deployedclusterdescr": "desc",
+        "clusterdescr": "desc",
+        "podbox": "box1",
+        "version": "1.0",
+        "deployedvmstatus": "INSTALLED",
+        "deployedvmtimestamp": "2024-01-01T00:00:00",
+        "deployedclusterowner": owner,
+    }
+    record.update(fields)
+    return record
+
+
+def make_vm(vm_id, owner="alice", **fields):
+    """Returns a VM built from make_vm_record"""
+    return VM(**make_vm_record(vm_id, owner, **fields))
+
+
+def make_user(username, vm_ids):
+    """Returns a users_data.json user record owning one VM per ID"""
+    return {
+        "authtype": "local",
+        "email": f"{username}@example.com",
+        "fullname": username,
+        "id": 1,
+        "spusername": None,
+        "status": "active",
+        "username": username,
+        "userpass": None,
+        "vms": [make_vm_record(vm_id, username) for vm_id in vm_ids],
+    }
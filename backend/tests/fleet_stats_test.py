@@ -0,0 +1,76 @@
+import unittest
+
+from app.fleet_stats import FleetStats, parse_stats_args
+from tests.factories import make_vm
+
+
+class TestFleetStats(unittest.TestCase):
+    def setUp(self):
+        self.vms = [
+            make_vm(
+                1, "alice", deployedvmstatus="RUNNING", podbox="PODBOX1", version="1.0"
+            ),
+            make_vm(
+                2, "alice", deployedvmstatus="RUNNING", podbox="PODBOX1", version="2.0"
+            ),
+            make_vm(
+                3, "alice", deployedvmstatus="STOPPED", podbox="PODBOX2", version="2.0"
+            ),
+            make_vm(
+                4, "bob", deployedvmstatus="RUNNING", podbox="PODBOX1", version="2.0"
+            ),
+        ]
+        self.stats = FleetStats(self.vms)
+
+    def test_unfiltered_counts(self):
+        total, counts = self.stats.counts({}, ["status", "owner"])
+        self.assertEqual(total, 4)
+        self.assertEqual(
+            counts,
+            {"status": {"RUNNING": 3, "STOPPED": 1}, "owner": {"alice": 3, "bob": 1}},
+        )
+        self.assertEqual(list(counts["status"]), ["RUNNING", "STOPPED"])
+
+    def test_facet_filters(self):
+        total, counts = self.stats.counts({"podbox": "PODBOX1"}, ["version"])
+        self.assertEqual((total, counts), (3, {"version": {"2.0": 2, "1.0": 1}}))
+        total, counts = self.stats.counts(
+            {"owner": "alice", "version": "2.0"}, ["podbox"]
+        )
+        self.assertEqual((total, counts), (2, {"podbox": {"PODBOX1": 1, "PODBOX2": 1}}))
+        self.assertEqual(
+            self.stats.counts({"podbox": "PODBOX9"}, ["status"]), (0, {"status": {}})
+        )
+
+    def test_remove_updates_built_and_later_tables(self):
+        self.stats.counts({"podbox": "PODBOX1"}, ["version"])
+        self.stats.remove(self.vms[0])
+        self.stats.remove(self.vms[0])
+        self.assertEqual(
+            self.stats.counts({"podbox": "PODBOX1"}, ["version"]),
+            (2, {"version": {"2.0": 2}}),
+        )
+        self.assertEqual(
+            self.stats.counts({}, ["owner"]), (3, {"owner": {"alice": 2, "bob": 1}})
+        )
+        self.stats.remove(self.vms[3])
+        self.assertEqual(self.stats.counts({}, ["owner"]), (2, {"owner": {"alice": 2}}))
+
+
+class TestParseStatsArgs(unittest.TestCase):
+    def test_defaults_to_unfiltered_facets(self):
+        self.assertEqual(
+            parse_stats_args({"podbox": "PODBOX1"}),
+            ({"podbox": "PODBOX1"}, ["owner", "status", "version"]),
+        )
+        self.assertEqual(
+            parse_stats_args({"by": "version,status"}), ({}, ["version", "status"])
+        )
+
+    def test_unknown_facet(self):
+        with self.assertRaises(ValueError):
+            parse_stats_args({"by": "color"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app.journal import DeleteJournal, write_json_atomic
+
+
+class TestDeleteJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.journal = DeleteJournal(os.path.join(self.tmpdir.name, "deletes.journal"))
+
+    def test_append_and_read(self):
+        self.assertEqual(self.journal.entries(), [])
+        self.journal.append("alice", {2, 1})
+        self.journal.append("bob", {3})
+        self.assertEqual(self.journal.entries(), [("alice", {1, 2}), ("bob", {3})])
+
+    def test_torn_line_ignored(self):
+        self.journal.append("alice", {1})
+        with open(self.journal.path, "a") as f:
+            f.write('{"owner": "bob", "vm_')
+        self.assertEqual(self.journal.entries(), [("alice", {1})])
+
+    def test_retain(self):
+        self.journal.append("alice", {1})
+        self.journal.append("bob", {2})
+        self.journal.retain(lambda entry: entry[0] == "bob")
+        self.assertEqual(self.journal.entries(), [("bob", {2})])
+        self.journal.append("carol", {3})
+        self.assertEqual(len(self.journal.entries()), 2)
+
+    def test_retain_failure_keeps_journal(self):
+        self.journal.append("alice", {1})
+        self.journal.append("bob", {2})
+        with patch("app.journal.os.fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.journal.retain(lambda entry: entry[0] == "bob")
+        self.assertEqual(self.journal.entries(), [("alice", {1}), ("bob", {2})])
+
+    def test_write_json_atomic(self):
+        path = os.path.join(self.tmpdir.name, "data.json")
+        write_json_atomic(path, [1])
+        write_json_atomic(path, [2])
+        with open(path) as f:
+            self.assertEqual(json.load(f), [2])
+        self.assertEqual(os.listdir(self.tmpdir.name), ["data.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
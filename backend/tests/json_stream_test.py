@@ -0,0 +1,60 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from app.json_stream import iter_json_array, stream_json_array
+
+SAMPLE = [
+    {"vm_id": 1, "name": "a, [b]", "nested": {"x": [1, 2, 3]}},
+    12345,
+    'text with "quotes"',
+    True,
+    None,
+    [1, [2, [3]]],
+    -0.5e3,
+]
+
+
+class TestJSONStream(unittest.TestCase):
+    def test_iter_json_array_matches_json_load(self):
+        text = json.dumps(SAMPLE, indent=2)
+        for chunk_size in (1, 2, 7, 64, 1 << 16):
+            items = list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+            self.assertEqual(items, SAMPLE, chunk_size)
+
+    def test_iter_json_array_large_element_decoded_few_times(self):
+        vms = [{"vm_id": i, "deployedclustername": f"alice_{i}"} for i in range(5000)]
+        text = json.dumps([{"username": "alice", "vms": vms}, 1])
+        decode = json.JSONDecoder.raw_decode
+        with patch.object(
+            json.JSONDecoder, "raw_decode", autospec=True, side_effect=decode
+        ) as raw_decode:
+            items = list(iter_json_array(io.StringIO(text), chunk_size=64))
+        self.assertEqual(items, [{"username": "alice", "vms": vms}, 1])
+        # The element spans thousands of chunks but the buffer doubles
+        # between attempts, so it is only decoded a logarithmic number of times
+        self.assertGreater(len(text) // 64, 2000)
+        self.assertLess(raw_decode.call_count, 30)
+
+    def test_iter_json_array_empty(self):
+        self.assertEqual(list(iter_json_array(io.StringIO(" [ ] "))), [])
+
+    def test_iter_json_array_rejects_bad_input(self):
+        for text in ("{}", "[1, 2", "[1 2]", "[{]"):
+            with self.assertRaises(ValueError):
+                list(iter_json_array(io.StringIO(text), chunk_size=2))
+
+    def test_stream_json_array(self):
+        for chunk_size in (1, 10, 1 << 16):
+            body = b"".join(stream_json_array(iter(SAMPLE), chunk_size=chunk_size))
+            self.assertEqual(json.loads(body), SAMPLE)
+        self.assertEqual(b"".join(stream_json_array([])), b"[]")
+
+    def test_stream_json_array_yields_incrementally(self):
+        chunks = list(stream_json_array(({"i": i} for i in range(100)), chunk_size=50))
+        self.assertGreater(len(chunks), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app.journal import write_json_atomic
+from app.metrics import METRICS, Metrics, count_read
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.01, 0.1))
+
+    def test_histogram_buckets_are_cumulative(self):
+        self.metrics.observe("/vms/all", "GET", 200, 0.005)
+        self.metrics.observe("/vms/all", "GET", 200, 0.05)
+        self.metrics.observe("/vms/all", "GET", 200, 3.0)
+        text = self.metrics.render()
+        labels = 'route="/vms/all",method="GET",status="200"'
+        name = "cluster_manager_request_duration_seconds"
+        self.assertIn(f'{name}_bucket{{{labels},le="0.01"}} 1\n', text)
+        self.assertIn(f'{name}_bucket{{{labels},le="0.1"}} 2\n', text)
+        self.assertIn(f'{name}_bucket{{{labels},le="+Inf"}} 3\n', text)
+        self.assertIn(f"{name}_sum{{{labels}}} 3.05", text)
+        self.assertIn(f"{name}_count{{{labels}}} 3\n", text)
+
+    def test_counters(self):
+        self.metrics.inc("file_reads_total", file="users.json")
+        self.metrics.inc("file_read_bytes_total", 512, file="users.json")
+        self.metrics.inc("file_read_bytes_total", 512, file="users.json")
+        self.assertEqual(
+            self.metrics.value("file_read_bytes_total", file="users.json"), 1024
+        )
+        text = self.metrics.render()
+        self.assertIn("# TYPE cluster_manager_file_reads_total counter\n", text)
+        self.assertIn(
+            'cluster_manager_file_read_bytes_total{file="users.json"} 1024\n', text
+        )
+
+    def test_unknown_counter(self):
+        with self.assertRaises(KeyError):
+            self.metrics.inc("made_up_total")
+
+    def test_label_values_are_escaped(self):
+        self.metrics.inc("file_reads_total", file='a"b\\c')
+        self.assertIn('{file="a\\"b\\\\c"}', self.metrics.render())
+
+    def test_gauges_are_grouped_by_name(self):
+        self.metrics.add_gauges(
+            lambda: [("cache_hits", "Cache hits", {"cache": "a"}, 1)]
+        )
+        self.metrics.add_gauges(
+            lambda: [("cache_hits", "Cache hits", {"cache": "b"}, 2)]
+        )
+        lines = self.metrics.render().splitlines()
+        start = lines.index("# TYPE cluster_manager_cache_hits gauge") + 1
+        self.assertEqual(
+            lines[start:][:2],
+            [
+                'cluster_manager_cache_hits{cache="a"} 1',
+                'cluster_manager_cache_hits{cache="b"} 2',
+            ],
+        )
+
+    def test_clear(self):
+        self.metrics.observe("/", "GET", 200, 0.001)
+        self.metrics.inc("file_reads_total", file="x")
+        self.metrics.clear()
+        self.assertNotIn("_count", self.metrics.render())
+        self.assertEqual(self.metrics.value("file_reads_total", file="x"), 0)
+
+
+class TestFileCounters(unittest.TestCase):
+    def setUp(self):
+        METRICS.clear()
+
+    def test_count_read(self):
+        count_read("/data/users.json", 100, records=4)
+        self.assertEqual(METRICS.value("file_reads_total", file="users.json"), 1)
+        self.assertEqual(METRICS.value("file_read_bytes_total", file="users.json"), 100)
+        self.assertEqual(METRICS.value("records_parsed_total", file="users.json"), 4)
+
+    @patch("app.journal.count_write")
+    def test_atomic_write_counts_bytes(self, mock_count):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "data.json")
+            write_json_atomic(path, [1, 2, 3])
+            mock_count.assert_called_once_with(path, os.path.getsize(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import sys
+import base64
+import hashlib
+import tempfile
+import unittest
+import subprocess
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+from app import password_hasher
+from app.password_hasher import (
+    PasswordVerifier,
+    VerifierBusy,
+    VerifierTimeout,
+    hash_password,
+    needs_upgrade,
+    verify_password,
+)
+
+LEGACY = hashlib.sha256(b"secret").hexdigest()
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def test_hash_round_trip(self):
+        stored = hash_password("secret")
+        self.assertEqual(verify_password("secret", stored), (True, None))
+        self.assertEqual(verify_password("wrong", stored), (False, None))
+        self.assertFalse(needs_upgrade(stored))
+
+    def test_hashes_are_salted(self):
+        self.assertNotEqual(hash_password("secret"), hash_password("secret"))
+
+    def test_legacy_hash_verified_and_upgraded(self):
+        matches, upgraded = verify_password("secret", LEGACY)
+        self.assertTrue(matches)
+        self.assertFalse(needs_upgrade(upgraded))
+        self.assertEqual(verify_password("secret", upgraded), (True, None))
+        self.assertEqual(verify_password("wrong", LEGACY), (False, None))
+
+    def test_weaker_parameters_upgraded(self):
+        with patch("app.password_hasher.SCRYPT_PARAMS", (2**10, 8, 1)), patch(
+            "app.password_hasher.PBKDF2_ITERATIONS", 1000
+        ):
+            weak = hash_password("secret")
+        self.assertTrue(needs_upgrade(weak))
+        matches, upgraded = verify_password("secret", weak)
+        self.assertTrue(matches)
+        self.assertNotEqual(upgraded, weak)
+
+    def test_pbkdf2_hash_verified(self):
+        salt = b"salt" * 4
+        key = hashlib.pbkdf2_hmac("sha256", b"secret", salt, 1000, dklen=32)
+        stored = "$".join(
+            (
+                "pbkdf2_sha256",
+                "1000",
+                base64.b64encode(salt).decode(),
+                base64.b64encode(key).decode(),
+            )
+        )
+        self.assertTrue(verify_password("secret", stored)[0])
+        self.assertFalse(verify_password("wrong", stored)[0])
+
+    def test_missing_or_malformed_hash_never_matches(self):
+        for stored in (None, "", "scrypt$x$8$1$salt$key", "plain-text-password"):
+            self.assertEqual(verify_password("secret", stored), (False, None))
+
+
+class TestPasswordVerifier(unittest.TestCase):
+    def test_inline(self):
+        verifier = PasswordVerifier(workers=0)
+        self.assertTrue(verifier.verify("secret", LEGACY)[0])
+
+    def test_pool(self):
+        verifier = PasswordVerifier(workers=1)
+        matches, upgraded = verifier.verify("secret", LEGACY)
+        self.assertTrue(matches)
+        self.assertEqual(verifier.verify("secret", upgraded), (True, None))
+        self.assertEqual(verifier.pending, 0)
+
+    def test_pool_workers_import_main_again(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            marker = os.path.join(tmpdir, "imports")
+            script = os.path.join(tmpdir, "entry.py")
+            with open(script, "w") as f:
+                f.write(
+                    "from password_hasher import PasswordVerifier\n"
+                    f"with open({marker!r}, 'a') as f:\n"
+                    "    f.write(__name__ + '\\n')\n"
+                    "if __name__ == '__main__':\n"
+                    f"    print(PasswordVerifier(workers=1).verify('secret', {LEGACY!r})[0])\n"
+                )
+            app_dir = os.path.dirname(password_hasher.__file__)
+            result = subprocess.run(
+                [sys.executable, script],
+                env={**os.environ, "PYTHONPATH": app_dir},
+                capture_output=True,
+                text=True,
+                timeout=60,
+            )
+            self.assertEqual(result.stdout.strip(), "True", result.stderr)
+            with open(marker) as f:
+                self.assertEqual(f.read().split(), ["__main__", "__mp_main__"])
+
+    def test_timeout_then_busy(self):
+        verifier = PasswordVerifier(workers=1, max_pending=1, timeout=0.01)
+        stuck = Future()
+        stuck.set_running_or_notify_cancel()
+        verifier._executor = MagicMock(return_value=MagicMock(submit=lambda *a: stuck))
+        with self.assertRaises(VerifierTimeout):
+            verifier.verify("secret", LEGACY)
+        with self.assertRaises(VerifierBusy):
+            verifier.verify("secret", LEGACY)
+        stuck.set_result((True, None))
+        self.assertEqual(verifier.pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
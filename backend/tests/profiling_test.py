@@ -0,0 +1,124 @@
+import os
+import pstats
+import tempfile
+import unittest
+from flask import Flask, Response
+
+from app.profiling import PROFILE_ID_HEADER, RequestProfiler
+
+
+def busy():
+    return sum(i * i for i in range(20000))
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route("/work")
+    def work():
+        return str(busy())
+
+    @app.route("/stream")
+    def stream():
+        return Response(str(busy()) for _ in range(3))
+
+    return app
+
+
+class TestRequestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.app = make_app()
+
+    def install(self, **kwargs):
+        RequestProfiler(self.tmpdir.name, **kwargs).install(self.app)
+        return self.app.test_client()
+
+    def files(self):
+        return sorted(os.listdir(self.tmpdir.name))
+
+    def test_token_header_profiles_request(self):
+        client = self.install(token="secret")
+        response = client.get("/work", headers={"X-Profile": "secret"})
+        profile_id = response.headers[PROFILE_ID_HEADER]
+        self.assertTrue(profile_id.endswith("-GET-work"))
+        self.assertEqual(
+            self.files(), [profile_id + ".collapsed", profile_id + ".pstats"]
+        )
+        stats = pstats.Stats(os.path.join(self.tmpdir.name, profile_id + ".pstats"))
+        self.assertIn("busy", {func[2] for func in stats.stats})
+
+    def test_wrong_or_missing_token_is_not_profiled(self):
+        client = self.install(token="secret")
+        response = client.get("/work", headers={"X-Profile": "guess"})
+        client.get("/work")
+        self.assertNotIn(PROFILE_ID_HEADER, response.headers)
+        self.assertEqual(self.files(), [])
+
+    def test_sampling_profiles_one_in_n(self):
+        client = self.install(sample_rate=3)
+        profiled = [PROFILE_ID_HEADER in client.get("/work").headers for _ in range(6)]
+        self.assertEqual(profiled, [False, False, True, False, False, True])
+
+    def test_streamed_body_is_profiled_until_sent(self):
+        client = self.install(sample_rate=1)
+        response = client.get("/stream")
+        self.assertEqual(self.files(), [])
+        response.get_data()
+        profile_id = response.headers[PROFILE_ID_HEADER]
+        stats = pstats.Stats(os.path.join(self.tmpdir.name, profile_id + ".pstats"))
+        busy_calls = [v[1] for k, v in stats.stats.items() if k[2] == "busy"]
+        self.assertEqual(busy_calls, [3])
+
+    def test_collapsed_stacks(self):
+        RequestProfiler(self.tmpdir.name, sample_rate=1, interval=0.0001).install(
+            self.app
+        )
+        response = self.app.test_client().get("/work")
+        path = os.path.join(
+            self.tmpdir.name, response.headers[PROFILE_ID_HEADER] + ".collapsed"
+        )
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            self.assertIn(";", stack)
+
+    def test_rotation_keeps_newest(self):
+        client = self.install(sample_rate=1, max_profiles=2)
+        ids = [client.get("/work").headers[PROFILE_ID_HEADER] for _ in range(4)]
+        expected = sorted(
+            i + suffix for i in ids[2:] for suffix in (".pstats", ".collapsed")
+        )
+        self.assertEqual(self.files(), expected)
+
+    def test_rotation_skips_foreign_profiles(self):
+        foreign = os.path.join(self.tmpdir.name, "baseline.pstats")
+        open(foreign, "w").close()
+        client = self.install(sample_rate=1, max_profiles=1)
+        for _ in range(2):
+            response = client.get("/work")
+            self.assertEqual(response.status_code, 200)
+        profile_id = response.headers[PROFILE_ID_HEADER]
+        self.assertEqual(
+            self.files(),
+            sorted(
+                ["baseline.pstats", profile_id + ".collapsed", profile_id + ".pstats"]
+            ),
+        )
+
+    def test_max_profiles_must_keep_one(self):
+        with self.assertRaises(ValueError):
+            RequestProfiler(self.tmpdir.name, max_profiles=0)
+
+    def test_not_installed_adds_no_hooks(self):
+        RequestProfiler(self.tmpdir.name, sample_rate=1)
+        self.assertEqual(dict(self.app.before_request_funcs), {})
+        self.assertEqual(dict(self.app.after_request_funcs), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from app.pruned import PrunedDict
+
+
+class TestPrunedDict(unittest.TestCase):
+    def setUp(self):
+        self.data = {1: "a", 2: "b", 3: "c", 4: "d"}
+        self.mapping = PrunedDict(self.data)
+
+    def test_reads_like_a_dict(self):
+        self.assertEqual(dict(self.mapping), self.data)
+        self.assertEqual(list(self.mapping.values()), ["a", "b", "c", "d"])
+        self.assertEqual(self.mapping.get(5), None)
+        with self.assertRaises(TypeError):
+            self.mapping[5] = "e"
+
+    def test_copies_share_data(self):
+        first = self.mapping.copy()
+        del first[2]
+        second = first.copy()
+        del second[4]
+        self.assertEqual(self.data, {1: "a", 2: "b", 3: "c", 4: "d"})
+        self.assertEqual(len(self.mapping), 4)
+        self.assertEqual(list(first), [1, 3, 4])
+        self.assertEqual(list(second.values()), ["a", "c"])
+        self.assertNotIn(2, second)
+        self.assertIs(second._tombstones, first._tombstones)
+        with self.assertRaises(KeyError):
+            del second[2]
+
+    def test_delete_from_older_copy(self):
+        newer = self.mapping.copy()
+        del newer[1]
+        del self.mapping[3]
+        self.assertEqual(list(newer), [2, 3, 4])
+        self.assertEqual(list(self.mapping), [1, 2, 4])
+        self.assertIsNot(self.mapping._tombstones, newer._tombstones)
+
+
+if __name__ == "__main__":
+    unittest.main()
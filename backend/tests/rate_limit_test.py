@@ -0,0 +1,82 @@
+import unittest
+
+from app.rate_limit import DEFAULT_LIMITS, ConcurrencyLimit, RateLimiter, parse_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = RateLimiter({"read": (2.0, 3)}, clock=self.clock)
+
+    def test_burst_then_refill(self):
+        self.assertEqual(
+            [self.limiter.acquire("read", "alice") for _ in range(3)], [0, 0, 0]
+        )
+        self.assertAlmostEqual(self.limiter.acquire("read", "alice"), 0.5)
+        self.clock.now = 0.25
+        self.assertAlmostEqual(self.limiter.acquire("read", "alice"), 0.25)
+        self.clock.now = 0.5
+        self.assertEqual(self.limiter.acquire("read", "alice"), 0)
+        self.clock.now = 100
+        self.assertEqual(
+            [self.limiter.acquire("read", "alice") for _ in range(3)], [0, 0, 0]
+        )
+        self.assertGreater(self.limiter.acquire("read", "alice"), 0)
+
+    def test_keys_and_limits_are_independent(self):
+        for _ in range(3):
+            self.limiter.acquire("read", "alice")
+        self.assertEqual(self.limiter.acquire("read", "bob"), 0)
+        self.assertEqual(self.limiter.acquire("write", "alice"), 0)
+
+    def test_keys_bounded(self):
+        limiter = RateLimiter(
+            {"read": (1.0, 1)}, max_keys=4, shards=2, clock=self.clock
+        )
+        for n in range(100):
+            limiter.acquire("read", n)
+        self.assertLessEqual(len(limiter), 4)
+        limiter.clear()
+        self.assertEqual(len(limiter), 0)
+
+
+class TestParseLimits(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_limits(None), DEFAULT_LIMITS)
+        self.assertEqual(parse_limits("off"), {})
+        limits = parse_limits("read=10/20, login=0,write=5")
+        self.assertEqual(limits["read"], (10.0, 20))
+        self.assertEqual(limits["write"], (5.0, 5))
+        self.assertNotIn("login", limits)
+
+    def test_malformed(self):
+        for spec in ("read", "read=fast", "read=1/x"):
+            with self.assertRaises(ValueError):
+                parse_limits(spec)
+
+
+class TestConcurrencyLimit(unittest.TestCase):
+    def test_cap(self):
+        limit = ConcurrencyLimit(2)
+        self.assertTrue(limit.try_enter())
+        self.assertTrue(limit.try_enter())
+        self.assertFalse(limit.try_enter())
+        limit.leave()
+        self.assertTrue(limit.try_enter())
+
+    def test_unlimited(self):
+        limit = ConcurrencyLimit(0)
+        self.assertTrue(all(limit.try_enter() for _ in range(100)))
+        limit.leave()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from app.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+
+    def fill(self, version=1):
+        self.cache.get(("all",), version)
+        self.cache.put(("all", "json"), version, b"a" * 10)
+        self.cache.put(("user", "alice", "json"), version, b"b" * 10)
+        self.cache.put(("user", "bob", "json"), version, b"c" * 10)
+        self.cache.put(("vm", 1), version, b"d" * 10)
+        self.cache.put(("vm", 2), version, b"e" * 10)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get(("vm", 1), 1))
+        self.cache.put(("vm", 1), 1, b"{}")
+        self.assertEqual(self.cache.get(("vm", 1), 1), (b"{}", False))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_new_version_empties_cache(self):
+        self.fill()
+        self.assertIsNone(self.cache.get(("vm", 1), 2))
+        self.assertEqual(self.cache.stats()["bytes"], 0)
+
+    def test_stale_put_ignored(self):
+        self.cache.get(("vm", 1), 2)
+        self.cache.put(("vm", 1), 1, b"old")
+        self.assertIsNone(self.cache.get(("vm", 1), 2))
+
+    def test_invalidate_drops_only_affected_entries(self):
+        self.fill()
+        self.cache.invalidate(1, 2, "alice", {1})
+        self.assertIsNone(self.cache.get(("all", "json"), 2))
+        self.assertIsNone(self.cache.get(("user", "alice", "json"), 2))
+        self.assertIsNone(self.cache.get(("vm", 1), 2))
+        self.assertIsNotNone(self.cache.get(("user", "bob", "json"), 2))
+        self.assertIsNotNone(self.cache.get(("vm", 2), 2))
+        self.assertEqual(self.cache.stats()["invalidations"], 3)
+
+    def test_invalidate_from_unknown_version_empties_cache(self):
+        self.fill()
+        self.cache.invalidate(5, 6, "alice", {1})
+        self.assertIsNone(self.cache.get(("user", "bob", "json"), 6))
+
+    def test_lru_eviction_by_size(self):
+        for vm_id in range(4):
+            self.cache.put(("vm", vm_id), None, b"x" * 30)
+        self.cache.get(("vm", 1), None)
+        self.cache.put(("vm", 9), None, b"x" * 30)
+        self.assertIsNone(self.cache.get(("vm", 0), None))
+        self.assertIsNone(self.cache.get(("vm", 2), None))
+        self.assertIsNotNone(self.cache.get(("vm", 1), None))
+        self.assertEqual(self.cache.stats()["bytes"], 90)
+        self.assertEqual(self.cache.stats()["evictions"], 2)
+
+    def test_oversized_bodies_not_stored(self):
+        self.cache.put(("all",), None, b"x" * 61)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_tee(self):
+        self.cache.get(("all",), 1)
+        chunks = list(self.cache.tee(("all",), 1, [b"[1", b",2]"]))
+        self.assertEqual(chunks, [b"[1", b",2]"])
+        self.assertEqual(self.cache.get(("all",), 1), (b"[1,2]", False))
+        list(self.cache.tee(("user", "a"), 1, [b"x" * 40, b"x" * 40]))
+        self.assertIsNone(self.cache.get(("user", "a"), 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
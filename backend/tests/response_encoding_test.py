@@ -0,0 +1,78 @@
+import gzip
+import json
+import unittest
+
+from werkzeug.datastructures import LanguageAccept, MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from app import response_encoding
+from app.response_encoding import (
+    COLUMNAR,
+    JSON,
+    MSGPACK,
+    accepts_gzip,
+    choose_format,
+    encode,
+)
+from app.vm_model import VM
+from tests.factories import make_vm_record
+
+RECORDS = [make_vm_record(vm_id, "alice") for vm_id in range(50)]
+
+
+def accept(header):
+    return parse_accept_header(header, MIMEAccept)
+
+
+class TestResponseEncoding(unittest.TestCase):
+    def test_choose_format(self):
+        self.assertEqual(choose_format(accept("")), JSON)
+        self.assertEqual(choose_format(accept("*/*")), JSON)
+        self.assertEqual(choose_format(accept(f"{COLUMNAR}, {JSON};q=0.5")), COLUMNAR)
+        if response_encoding.msgpack is not None:
+            self.assertEqual(choose_format(accept("application/x-msgpack")), MSGPACK)
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip(parse_accept_header("gzip, br", LanguageAccept)))
+        self.assertFalse(accepts_gzip(parse_accept_header("br", LanguageAccept)))
+
+    def test_encode_json_and_gzip(self):
+        body, gzipped = encode(RECORDS, JSON, compress=False)
+        self.assertFalse(gzipped)
+        self.assertEqual(json.loads(body), RECORDS)
+        compressed, gzipped = encode(RECORDS, JSON, compress=True)
+        self.assertTrue(gzipped)
+        self.assertEqual(gzip.decompress(compressed), body)
+        self.assertLess(len(compressed), len(body))
+
+    def test_small_bodies_not_gzipped(self):
+        _, gzipped = encode(RECORDS[:1], JSON, compress=True)
+        self.assertFalse(gzipped)
+
+    def test_encode_vm_objects(self):
+        vms = [VM(**record) for record in RECORDS]
+        self.assertEqual(
+            encode(vms, JSON, compress=False), encode(RECORDS, JSON, compress=False)
+        )
+        self.assertEqual(
+            encode(vms, COLUMNAR, compress=False),
+            encode(RECORDS, COLUMNAR, compress=False),
+        )
+
+    def test_encode_columnar(self):
+        body, _ = encode(RECORDS, COLUMNAR, compress=False)
+        decoded = json.loads(body)
+        self.assertEqual(decoded["columns"][0], "vm_id")
+        rows = [dict(zip(decoded["columns"], row)) for row in decoded["rows"]]
+        self.assertEqual(rows, RECORDS)
+        self.assertLess(len(body), len(encode(RECORDS, JSON, compress=False)[0]))
+
+    @unittest.skipIf(response_encoding.msgpack is None, "msgpack not installed")
+    def test_encode_msgpack(self):
+        body, _ = encode(RECORDS, MSGPACK, compress=False)
+        decoded = response_encoding.msgpack.unpackb(body)
+        self.assertEqual(decoded["rows"][3][0], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import patch
+
+from app import search_index
+from app.search_index import SearchIndex, SearchQuery
+from app.vm_query import encode_cursor
+from tests.factories import make_vm
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.vms = [
+            make_vm(12, deployedclustername="Web-Prod-1", podbox="PODBOX1"),
+            make_vm(120, deployedclustername="web", owner="bob", podbox="PODBOX1"),
+            make_vm(7, deployedclustername="db-web", owner="bob", podbox="PODBOX12"),
+            make_vm(
+                3, deployedclustername="webserver", owner="webmaster", podbox="PODBOX1"
+            ),
+            make_vm(1200, deployedclustername="cache", podbox="PODBOX2"),
+        ]
+        self.index = SearchIndex(self.vms)
+
+    def ids(self, q, **kwargs):
+        return self.index.search(q, **kwargs)[0]
+
+    def test_exact_then_prefix_then_word(self):
+        # exact name, then names and owners starting with "web", then the
+        # later word of "db-web"
+        self.assertEqual(self.ids("WEB"), [120, 12, 3, 7])
+
+    def test_vm_id_exact_then_prefix(self):
+        self.assertEqual(self.ids("12"), [12, 120, 1200])
+        self.assertEqual(self.ids("120"), [120, 1200])
+
+    def test_owner_and_podbox(self):
+        self.assertEqual(self.ids("bob"), [7, 120])
+        self.assertEqual(self.ids("podbox1"), [3, 12, 120, 7])
+
+    def test_later_words(self):
+        self.assertEqual(self.ids("prod"), [12])
+        self.assertEqual(self.ids("rod"), [])
+
+    def test_pagination_and_count(self):
+        self.assertEqual(
+            self.index.search("web", offset=0, limit=2), ([120, 12], 4, True)
+        )
+        self.assertEqual(self.index.search("web", offset=2, limit=2), ([3, 7], 4, True))
+
+    def test_count_is_capped(self):
+        with patch.object(search_index, "COUNT_LIMIT", 2):
+            self.assertEqual(self.index.search("web", limit=1), ([120], 2, False))
+            self.assertEqual(
+                self.index.search("web", limit=3), ([120, 12, 3], 3, False)
+            )
+
+    def test_id_range(self):
+        self.assertEqual(self.ids("", id_range=(5, 200)), [7, 12, 120])
+        self.assertEqual(self.ids("web", id_range=(5, 200)), [120, 12, 7])
+
+    def test_remove(self):
+        self.index.remove(self.vms[1])
+        self.assertEqual(self.ids("web"), [12, 3, 7])
+        self.assertEqual(self.ids("bob"), [7])
+        self.index.remove(self.vms[2])
+        self.assertEqual(self.ids("bob"), [])
+        self.assertEqual(self.ids("12"), [12, 1200])
+        self.index.remove(self.vms[2])
+        self.assertEqual(self.ids(""), [3, 12, 1200])
+
+
+class TestSearchQuery(unittest.TestCase):
+    def test_from_args(self):
+        search = SearchQuery.from_args({"q": " web ", "limit": "5", "min_id": "10"})
+        self.assertEqual(search.q, "web")
+        self.assertEqual(search.limit, 5)
+        self.assertEqual(search.id_range, (10, 2**63))
+        following = SearchQuery.from_args({"q": "web", "cursor": search.next_cursor()})
+        self.assertEqual(following.offset, 5)
+
+    def test_invalid(self):
+        for args in (
+            {"limit": "0"},
+            {"limit": "x"},
+            {"min_id": "a"},
+            {"cursor": "nope"},
+            {"q": "db", "cursor": encode_cursor(("web", 5))},
+        ):
+            with self.assertRaises(ValueError):
+                SearchQuery.from_args(args)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import unittest
+
+from app.shared_generation import SharedGeneration
+
+
+class TestSharedGeneration(unittest.TestCase):
+    def test_changes_since(self):
+        shared = SharedGeneration(capacity=8, version=5)
+        self.assertEqual(shared.changes_since(0), (0, 5, set()))
+        first = shared.publish([1, 2], 6)
+        second = shared.publish([3], 7)
+        self.assertEqual((first, second), (1, 2))
+        self.assertEqual(shared.changes_since(0), (2, 7, {1, 2, 3}))
+        self.assertEqual(shared.changes_since(1), (2, 7, {3}))
+        self.assertEqual(shared.changes_since(2), (2, 7, set()))
+
+    def test_overflow(self):
+        shared = SharedGeneration(capacity=4)
+        shared.publish([1, 2, 3], 1)
+        shared.publish([4, 5], 2)
+        self.assertIsNone(shared.changes_since(0))
+        self.assertEqual(shared.changes_since(1), (2, 2, {4, 5}))
+
+    def test_shared_across_fork(self):
+        shared = SharedGeneration()
+        pid = os.fork()
+        if pid == 0:
+            shared.publish([42], 9)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(shared.changes_since(0), (1, 9, {42}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+
+from app.snapshot import (
+    Snapshot,
+    SnapshotError,
+    SnapshotOwners,
+    SnapshotRows,
+    SnapshotUserVMs,
+    write_snapshot,
+)
+from tests.factories import make_vm
+
+STAMP = (1, 2, 3)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "users_data.json.snapshot")
+        self.users = {
+            "alice": {"username": "alice", "email": "alice@example.com"},
+            "bob": {"username": "bob", "email": "bob@example.com"},
+            "carol": {"username": "carol", "email": "carol@example.com"},
+        }
+        self.vms_by_owner = {
+            "alice": (
+                make_vm(3, "alice"),
+                make_vm(1, "alice", deployedvmstatus="FAILED"),
+            ),
+            "bob": (make_vm(2, "bob"),),
+            "carol": (),
+        }
+        write_snapshot(self.path, STAMP, self.users, self.vms_by_owner)
+        self.snapshot = Snapshot(self.path, STAMP)
+
+    def test_round_trip(self):
+        self.assertEqual(self.snapshot.users, list(self.users.values()))
+        for username, vms in self.vms_by_owner.items():
+            self.assertEqual(
+                [vm.to_dict() for vm in self.snapshot.user_vms(username)],
+                [vm.to_dict() for vm in vms],
+            )
+        self.assertEqual(list(self.snapshot.column("vm_id")), [3, 1, 2])
+        self.assertEqual(
+            list(self.snapshot.column("deployed_at")),
+            [
+                vm.deployed_at
+                for vm in self.vms_by_owner["alice"] + self.vms_by_owner["bob"]
+            ],
+        )
+        self.assertEqual(self.snapshot.row_of(1), 1)
+        self.assertIsNone(self.snapshot.row_of(4))
+        self.assertEqual(self.snapshot.owner(2), "bob")
+
+    def test_vms_built_once(self):
+        self.assertEqual(self.snapshot._vms, {})
+        vm = self.snapshot.vm(0)
+        self.assertIs(self.snapshot.user_vms("alice")[0], vm)
+        self.assertIs(vm.podbox, self.snapshot.vm(2).podbox)
+
+    def test_stale_or_corrupt_rejected(self):
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path, (1, 2, 4))
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 8)
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path, STAMP)
+        with open(self.path, "wb") as f:
+            f.write(b"[]")
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path, STAMP)
+        open(self.path, "wb").close()
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path, STAMP)
+
+    def test_unwritable_vm_leaves_old_snapshot(self):
+        bad = make_vm(9, "bob")
+        bad.deployedclustername = None
+        with self.assertRaises(ValueError):
+            write_snapshot(
+                self.path, (4, 5, 6), self.users, {**self.vms_by_owner, "bob": (bad,)}
+            )
+        Snapshot(self.path, STAMP)
+        self.assertEqual(os.listdir(self.tmpdir.name), ["users_data.json.snapshot"])
+
+
+class TestSnapshotMappings(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "snapshot")
+        vms_by_owner = {
+            "alice": (make_vm(1, "alice"), make_vm(2, "alice")),
+            "bob": (make_vm(3, "bob"),),
+        }
+        write_snapshot(
+            path,
+            STAMP,
+            {name: {"username": name} for name in vms_by_owner},
+            vms_by_owner,
+        )
+        self.snapshot = Snapshot(path, STAMP)
+
+    def test_rows(self):
+        vms = SnapshotRows(self.snapshot)
+        self.assertEqual(len(vms), 3)
+        self.assertEqual(vms[2].deployedclusterowner, "alice")
+        self.assertNotIn("2", vms)
+        copy = vms.copy()
+        del copy[2]
+        self.assertEqual(list(copy), [1, 3])
+        self.assertEqual([vm.vm_id for vm in copy.values()], [1, 3])
+        self.assertEqual(len(copy), 2)
+        self.assertIn(2, vms)
+        with self.assertRaises(KeyError):
+            del copy[2]
+        with self.assertRaises(TypeError):
+            vms[4] = make_vm(4, "bob")
+
+    def test_owners_build_no_vms(self):
+        owners = SnapshotOwners(self.snapshot)
+        self.assertEqual(dict(owners), {1: "alice", 2: "alice", 3: "bob"})
+        self.assertEqual(self.snapshot._vms, {})
+
+    def test_user_vms(self):
+        vms_by_owner = SnapshotUserVMs(self.snapshot)
+        self.assertEqual(list(vms_by_owner), ["alice", "bob"])
+        copy = vms_by_owner.copy()
+        copy["alice"] = ()
+        self.assertEqual(copy["alice"], ())
+        self.assertEqual(len(vms_by_owner["alice"]), 2)
+        self.assertNotIn("carol", copy)
+        with self.assertRaises(KeyError):
+            copy["carol"] = ()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+import tempfile
+import sqlite3
+import json
+import os
+from unittest.mock import Mock
+
+from app.credential_store import CredentialStore
+from app.sqlite_repository import SQLiteRepository
+from app.vm_query import VMQuery
+from tests.factories import make_user
+
+
+class TestSQLiteRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        files = {
+            "users_data.json": [make_user("alice", [1, 2]), make_user("bob", [3])],
+            "vms_all.json": [{"vm_id": 1}, {"vm_id": 2}, {"vm_id": 3}],
+            "users.json": [{"username": "alice", "password_hash": "abc"}],
+        }
+        for name, data in files.items():
+            with open(os.path.join(self.tmpdir.name, name), "w") as f:
+                json.dump(data, f)
+        self.repo = SQLiteRepository(os.path.join(self.tmpdir.name, "cm.db"))
+        self.repo.import_json(*(os.path.join(self.tmpdir.name, name) for name in files))
+
+    def test_lookups(self):
+        record, vms = self.repo.get_user("alice")
+        self.assertEqual(record["email"], "alice@example.com")
+        self.assertEqual([vm.vm_id for vm in vms], [1, 2])
+        self.assertEqual(self.repo.get_vm(3).deployedclusterowner, "bob")
+        self.assertIsNone(self.repo.get_vm(999))
+        self.assertIsNone(self.repo.get_user("nobody"))
+        self.assertEqual([vm.vm_id for vm in self.repo.all_vms()], [1, 2, 3])
+
+    def test_version(self):
+        version = self.repo.version
+        self.assertGreater(version, 0)
+        self.repo.delete_vm("bob", 1)
+        self.assertEqual(self.repo.version, version)
+        self.repo.delete_vm("alice", 1)
+        self.assertGreater(self.repo.version, version)
+
+    def test_get_vms(self):
+        self.assertEqual(sorted(self.repo.get_vms([3, 1, 999])), [1, 3])
+
+    def test_delete_vm(self):
+        self.assertFalse(self.repo.delete_vm("bob", 1))
+        self.assertTrue(self.repo.delete_vm("alice", 1))
+        self.assertIsNone(self.repo.get_vm(1))
+        conn = self.repo._connection()
+        self.assertEqual(
+            conn.execute("SELECT vm_id FROM fleet_vms ORDER BY vm_id").fetchall(),
+            [(2,), (3,)],
+        )
+
+    def test_delete_vms(self):
+        results = self.repo.delete_vms("alice", [1, 2, 3, 999])
+        self.assertEqual(
+            results, {1: "deleted", 2: "deleted", 3: "forbidden", 999: "not_found"}
+        )
+        self.assertEqual([vm.vm_id for vm in self.repo.all_vms()], [3])
+
+    def test_delete_notifies_listeners(self):
+        calls = []
+        self.repo.subscribe(lambda *args: calls.append(args))
+        before = self.repo.version
+        self.repo.delete_vms("alice", [1, 3, 999])
+        self.repo.delete_vms("alice", [999])
+        self.assertEqual(calls, [(before, self.repo.version, "alice", {1})])
+
+    def test_query_vms(self):
+        page, total, cursor = self.repo.query_vms(VMQuery(limit=2, order="desc"))
+        self.assertEqual(([vm.vm_id for vm in page], total), ([3, 2], 3))
+        page, _, cursor = self.repo.query_vms(
+            VMQuery.from_args({"limit": 2, "order": "desc", "cursor": cursor})
+        )
+        self.assertEqual(([vm.vm_id for vm in page], cursor), ([1], None))
+        page, total, _ = self.repo.query_vms(VMQuery(q="ALICE_2"), owner="alice")
+        self.assertEqual(([vm.vm_id for vm in page], total), ([2], 1))
+
+    def test_query_vms_time_range(self):
+        query = VMQuery.from_args(
+            {"deployed_after": "2024-01-01", "deployed_before": "2024-01-02"}
+        )
+        page, total, _ = self.repo.query_vms(query, owner="alice")
+        self.assertEqual(([vm.vm_id for vm in page], total), ([1, 2], 2))
+        page, total, _ = self.repo.query_vms(
+            VMQuery.from_args({"deployed_after": "2024-01-01T00:00:01"})
+        )
+        self.assertEqual((page, total), ([], 0))
+
+    def test_deployed_at_added_to_old_database(self):
+        path = os.path.join(self.tmpdir.name, "cm.db")
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP INDEX vms_deployed_at")
+            conn.execute("ALTER TABLE vms DROP COLUMN deployed_at")
+        repo = SQLiteRepository(path)
+        page, total, _ = repo.query_vms(
+            VMQuery.from_args({"deployed_before": "2024-01-02"})
+        )
+        self.assertEqual(total, 3)
+
+    def test_search_vms_tracks_deletes(self):
+        page, total, _ = self.repo.search_vms("bob")
+        self.assertEqual(([vm.vm_id for vm in page], total), ([3], 1))
+        self.assertTrue(self.repo.delete_vm("bob", 3))
+        self.assertEqual(self.repo.search_vms("bob"), ([], 0, True))
+        other = SQLiteRepository(self.repo.db_path)
+        other.delete_vm("alice", 1)
+        page, _, _ = self.repo.search_vms("alice")
+        self.assertEqual([vm.vm_id for vm in page], [2])
+
+    def test_fleet_stats_track_deletes(self):
+        self.assertEqual(self.repo.fleet_stats({}, ["owner"])[0], 3)
+        self.assertTrue(self.repo.delete_vm("bob", 3))
+        self.assertEqual(
+            self.repo.fleet_stats({}, ["owner"]), (2, {"owner": {"alice": 2}})
+        )
+        SQLiteRepository(self.repo.db_path).delete_vm("alice", 1)
+        self.assertEqual(self.repo.fleet_stats({"owner": "alice"}, [])[0], 1)
+
+    def test_load_credentials(self):
+        self.assertEqual(
+            self.repo.load_credentials(),
+            [{"username": "alice", "password_hash": "abc"}],
+        )
+
+    def test_save_credential(self):
+        self.repo.save_credential("alice", "scrypt$new")
+        self.repo.save_credential("nobody", "scrypt$other")
+        self.assertEqual(
+            self.repo.load_credentials(),
+            [{"username": "alice", "password_hash": "scrypt$new"}],
+        )
+
+    def test_credentials_reload_only_when_they_change(self):
+        loader = Mock(wraps=self.repo.load_credentials)
+        store = CredentialStore(
+            self.repo.db_path,
+            loader=loader,
+            saver=self.repo.save_credential,
+            stamp=self.repo.credentials_version,
+        )
+        self.assertEqual(store.get("alice"), "abc")
+        self.assertTrue(SQLiteRepository(self.repo.db_path).delete_vm("bob", 3))
+        self.assertEqual(store.get("alice"), "abc")
+        self.assertEqual(loader.call_count, 1)
+        SQLiteRepository(self.repo.db_path).save_credential("alice", "scrypt$new")
+        self.assertEqual(store.get("alice"), "scrypt$new")
+        self.assertEqual(loader.call_count, 2)
+
+    def test_import_is_repeatable(self):
+        self.repo.import_json(
+            *(
+                os.path.join(self.tmpdir.name, name)
+                for name in ("users_data.json", "vms_all.json", "users.json")
+            )
+        )
+        self.assertEqual(len(self.repo.all_vms()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import threading
+
+from app.token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(max_size=2, clock=self.clock)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", {"username": "alice", "exp": 2000})
+        self.assertEqual(self.cache.get("a")["username"], "alice")
+        self.assertEqual(
+            self.cache.stats(), {"size": 1, "hits": 1, "misses": 1, "hit_ratio": 0.5}
+        )
+
+    def test_expiry(self):
+        self.cache.put("a", {"username": "alice", "exp": 1500})
+        self.clock.now = 1500
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_not_cached_without_future_exp(self):
+        self.cache.put("a", {"username": "alice"})
+        self.cache.put("b", {"username": "bob", "exp": 10})
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_lru_eviction(self):
+        self.cache.put("a", {"exp": 2000})
+        self.cache.put("b", {"exp": 2000})
+        self.cache.get("a")
+        self.cache.put("c", {"exp": 2000})
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+    def test_keys_are_digests(self):
+        self.cache.put("secret.token", {"exp": 2000})
+        self.assertNotIn("secret.token", self.cache._entries)
+        self.assertEqual(len(next(iter(self.cache._entries))), 32)
+
+    def test_concurrent_access(self):
+        cache = TokenCache(max_size=50, clock=self.clock)
+
+        def worker(n):
+            for i in range(200):
+                cache.put(f"{n}-{i}", {"exp": 2000})
+                cache.get(f"{n}-{i // 2}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = cache.stats()
+        self.assertEqual(stats["size"], 50)
+        self.assertEqual(stats["hits"] + stats["misses"], 8 * 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
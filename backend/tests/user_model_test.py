@@ -1,6 +1,9 @@
 import unittest
-from unittest.mock import patch, mock_open
+import tempfile
+import os
+from unittest.mock import patch
 from app.user_model import User, VM
+from app.vm_repository import VMRepository
 
 
 import json
@@ -47,18 +50,28 @@ MOCK_VMS_ALL = [
 
 
 class TestVMControllers(unittest.TestCase):
-    @patch("os.path.exists", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data=json.dumps(MOCK_USERS))
-    def test_load_user_success(self, mock_file, mock_exists):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.users_file = os.path.join(self.tmpdir.name, "users_data.json")
+        self.vms_all_file = os.path.join(self.tmpdir.name, "vms_all.json")
+        with open(self.users_file, "w") as f:
+            json.dump(MOCK_USERS, f)
+        with open(self.vms_all_file, "w") as f:
+            json.dump(MOCK_VMS_ALL, f)
+        self.repo = VMRepository(self.users_file, self.vms_all_file)
+        patcher = patch("app.user_model.REPOSITORY", self.repo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_load_user_success(self):
         user = User.load_user("testuser")
         self.assertIsNotNone(user)
         self.assertEqual(user.username, "testuser")
         self.assertEqual(len(user.vms), 1)
         self.assertIsInstance(user.vms[0], VM)
 
-    @patch("os.path.exists", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data=json.dumps(MOCK_USERS))
-    def test_get_all_vms(self, mock_file, mock_exists):
+    def test_get_all_vms(self):
         vms = User.get_all_vms()
         self.assertEqual(len(vms), 1)
         self.assertEqual(vms[0]["vm_id"], 101)
@@ -102,36 +115,42 @@ class TestVMControllers(unittest.TestCase):
         )
         self.assertEqual(user.vms_user(), [vm])
 
-    @patch("os.path.exists", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data=json.dumps(MOCK_USERS))
-    def test_get_vm_found(self, mock_file, mock_exists):
+    def test_get_vm_found(self):
         vm = User.get_vm(101)
         self.assertIsNotNone(vm)
         self.assertEqual(vm["vm_id"], 101)
 
-    @patch("os.path.exists", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data=json.dumps(MOCK_USERS))
-    def test_get_vm_not_found(self, mock_file, mock_exists):
+    def test_get_vm_not_found(self):
         vm = User.get_vm(999)
         self.assertIsNone(vm)
 
-    @patch(
-        "os.path.exists",
-        side_effect=lambda path: "users_data" in path or "vms_all" in path,
-    )
-    @patch("builtins.open")
-    def test_delete_vm(self, mock_open_func, mock_exists):
-        # Setup mock for users_data.json and vms_all.json
-        users_file = mock_open(read_data=json.dumps(MOCK_USERS))
-        vms_all_file = mock_open(read_data=json.dumps(MOCK_VMS_ALL))
-        mock_open_func.side_effect = [
-            users_file.return_value,
-            users_file.return_value,
-            vms_all_file.return_value,
-            vms_all_file.return_value,
-        ]
+    def test_get_vms_projection(self):
+        vms, missing = User.get_vms([999, 101], fields=["podbox", "version"])
+        self.assertEqual(vms, [{"vm_id": 101, "podbox": "box1", "version": "1.0"}])
+        self.assertEqual(missing, [999])
+        vms, _ = User.get_vms([101])
+        self.assertEqual(vms[0], MOCK_USERS[0]["vms"][0])
+
+    def test_delete_vm(self):
         result = User.delete_vm("testuser", 101)
         self.assertTrue(result)
+        self.assertIsNone(User.get_vm(101))
+        self.repo.flush()
+        with open(self.users_file) as f:
+            self.assertEqual(json.load(f)[0]["vms"], [])
+        with open(self.vms_all_file) as f:
+            self.assertEqual(json.load(f), [])
+
+    def test_data_version_bumped_by_delete(self):
+        version = User.data_version()
+        self.assertEqual(User.data_version(), version)
+        User.delete_vm("testuser", 101)
+        self.assertGreater(User.data_version(), version)
+
+    def test_delete_vm_wrong_owner(self):
+        result = User.delete_vm("someoneelse", 101)
+        self.assertFalse(result)
+        self.assertIsNotNone(User.get_vm(101))
 
     @patch("os.path.exists", return_value=False)
     def test_load_user_file_not_exist(self, mock_exists):
@@ -0,0 +1,40 @@
+import unittest
+
+from app.vm_model import VM, VM_FIELDS, parse_timestamp
+from tests.factories import make_vm_record
+
+
+class TestVM(unittest.TestCase):
+    def test_slotted(self):
+        vm = VM(**make_vm_record(1, "alice"))
+        self.assertFalse(hasattr(vm, "__dict__"))
+        with self.assertRaises(AttributeError):
+            vm.extra = 1
+
+    def test_low_cardinality_strings_shared(self):
+        first = VM(**make_vm_record(1, "".join(["ali", "ce"])))
+        second = VM(**make_vm_record(2, "".join(["al", "ice"])))
+        self.assertIs(first.deployedclusterowner, second.deployedclusterowner)
+        self.assertIs(first.podbox, second.podbox)
+
+    def test_to_dict_round_trip(self):
+        record = make_vm_record(3, "bob")
+        vm = VM(**record)
+        self.assertEqual(vm.to_dict(), record)
+        self.assertNotIn("deployed_at", VM_FIELDS)
+
+    def test_deployed_at(self):
+        vm = VM(
+            **{
+                **make_vm_record(4, "bob"),
+                "deployedvmtimestamp": "1970-01-01T00:00:01.5",
+            }
+        )
+        self.assertEqual(vm.deployed_at, 1_500_000)
+        self.assertEqual(parse_timestamp("1970-01-01T01:00:00+01:00"), 0)
+        self.assertEqual(parse_timestamp("not a date"), 0)
+        self.assertEqual(parse_timestamp(None), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
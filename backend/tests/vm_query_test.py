@@ -0,0 +1,98 @@
+import unittest
+
+from app.vm_query import QueryIndex, VMQuery, decode_cursor, encode_cursor
+from tests.factories import make_vm
+
+
+class TestVMQuery(unittest.TestCase):
+    def setUp(self):
+        vms = [
+            make_vm(
+                i,
+                "alice" if i % 2 else "bob",
+                deployedvmtimestamp=f"2024-01-{i:02d}T00:00:00",
+            )
+            for i in range(1, 11)
+        ]
+        vms[0] = make_vm(1, "alice", deployedvmstatus="FAILED", podbox="box2")
+        self.index = QueryIndex(vms, {vm.vm_id: vm.deployedclusterowner for vm in vms})
+
+    def walk(self, **args):
+        """Collects every page of a query by following next_cursor"""
+        ids, cursor = [], None
+        while True:
+            if cursor:
+                args["cursor"] = cursor
+            page, total, cursor = self.index.query(VMQuery.from_args(args))
+            ids.extend(vm.vm_id for vm in page)
+            if cursor is None:
+                return ids, total
+
+    def test_unfiltered_pages(self):
+        self.assertEqual(self.walk(limit=3), (list(range(1, 11)), 10))
+        self.assertEqual(self.walk(limit=4, order="desc"), (list(range(10, 0, -1)), 10))
+
+    def test_sort_by_name(self):
+        ids, _ = self.walk(limit=2, sort="deployedclustername")
+        self.assertEqual(ids, [1, 3, 5, 7, 9, 10, 2, 4, 6, 8])
+
+    def test_filters(self):
+        self.assertEqual(self.walk(owner="bob", limit=2), ([2, 4, 6, 8, 10], 5))
+        self.assertEqual(self.walk(owner="alice", status="FAILED"), ([1], 1))
+        self.assertEqual(self.walk(podbox="missing"), ([], 0))
+        self.assertEqual(self.walk(owner="bob", q="bob_1"), ([10], 1))
+        self.assertEqual(self.walk(q="10"), ([10], 1))
+
+    def test_remove(self):
+        self.index.remove(4)
+        self.assertEqual(self.walk(owner="bob"), ([2, 6, 8, 10], 4))
+        self.assertNotIn(4, self.walk(sort="deployedvmtimestamp")[0])
+
+    def test_time_range(self):
+        self.assertEqual(
+            self.walk(
+                deployed_after="2024-01-03", deployed_before="2024-01-06T00:00:00Z"
+            ),
+            ([3, 4, 5], 3),
+        )
+        self.assertEqual(
+            self.walk(deployed_before="2024-01-03T01:00:00+02:00"), ([1, 2], 2)
+        )
+        self.assertEqual(
+            self.walk(deployed_after="2024-01-08", order="desc"), ([10, 9, 8], 3)
+        )
+        self.assertEqual(
+            self.walk(owner="bob", deployed_after="2024-01-05", limit=1),
+            ([6, 8, 10], 3),
+        )
+        self.assertEqual(
+            self.walk(status="FAILED", deployed_after="2024-01-02"), ([], 0)
+        )
+        self.assertEqual(self.walk(deployed_after="2025-01-01"), ([], 0))
+
+    def test_remove_from_time_range(self):
+        self.index.remove(4)
+        self.assertEqual(
+            self.walk(deployed_after="2024-01-03", deployed_before="2024-01-06"),
+            ([3, 5], 2),
+        )
+
+    def test_invalid_args(self):
+        for args in (
+            {"deployed_after": "yesterday"},
+            {"limit": "0"},
+            {"limit": "x"},
+            {"sort": "email"},
+            {"order": "up"},
+            {"cursor": "garbage"},
+            {"cursor": encode_cursor(("name", 1))},
+        ):
+            with self.assertRaises(ValueError):
+                VMQuery.from_args(args)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(("x", 3))), ("x", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
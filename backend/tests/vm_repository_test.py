@@ -0,0 +1,271 @@
+import unittest
+import tempfile
+import json
+import os
+import time
+import threading
+from unittest.mock import patch
+
+from app.vm_query import VMQuery
+from app.journal import DeleteJournal, write_json_atomic
+from app.shared_generation import SharedGeneration
+from app.vm_repository import VMRepository
+from tests.factories import make_user
+
+
+class TestVMRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.users_file = os.path.join(self.tmpdir.name, "users_data.json")
+        self.vms_all_file = os.path.join(self.tmpdir.name, "vms_all.json")
+        self.write_users([make_user("alice", [1, 2]), make_user("bob", [3])])
+        with open(self.vms_all_file, "w") as f:
+            json.dump([{"vm_id": 1}, {"vm_id": 2}, {"vm_id": 3}], f)
+        self.repo = VMRepository(self.users_file, self.vms_all_file)
+
+    def write_users(self, users):
+        with open(self.users_file, "w") as f:
+            json.dump(users, f)
+
+    def test_indexes(self):
+        record, vms = self.repo.get_user("alice")
+        self.assertEqual(record["username"], "alice")
+        self.assertEqual([vm.vm_id for vm in vms], [1, 2])
+        self.assertEqual(self.repo.get_vm(3).deployedclusterowner, "bob")
+        self.assertEqual([vm.vm_id for vm in self.repo.all_vms()], [1, 2, 3])
+        self.assertIsNone(self.repo.get_user("nobody"))
+
+    def test_file_parsed_once(self):
+        self.repo.get_vm(1)
+        index = self.repo._index
+        self.repo.get_vm(2)
+        self.repo.get_user("bob")
+        self.assertIs(self.repo._index, index)
+
+    def test_user_vms_are_shared_view(self):
+        _, first = self.repo.get_user("alice")
+        _, second = self.repo.get_user("alice")
+        self.assertIsInstance(first, tuple)
+        self.assertIs(first, second)
+        self.assertIs(first[0], self.repo.get_vm(1))
+
+    def test_reload_on_change(self):
+        self.assertIsNotNone(self.repo.get_vm(1))
+        self.write_users([make_user("carol", [10, 11, 12])])
+        self.assertIsNone(self.repo.get_vm(1))
+        self.assertEqual(self.repo.get_vm(10).deployedclusterowner, "carol")
+
+    def test_delete_does_not_trigger_reload(self):
+        self.repo.get_vm(1)
+        with patch.object(self.repo, "_load", side_effect=AssertionError("reloaded")):
+            self.assertTrue(self.repo.delete_vm("alice", 1))
+            self.assertIsNone(self.repo.get_vm(1))
+            self.repo.flush()
+            self.assertIsNone(self.repo.get_vm(1))
+        with open(self.vms_all_file) as f:
+            self.assertEqual(json.load(f), [{"vm_id": 2}, {"vm_id": 3}])
+
+    def test_delete_shares_lookup_tables(self):
+        self.repo.get_vm(1)
+        before = self.repo._index
+        self.assertTrue(self.repo.delete_vm("alice", 1))
+        after = self.repo._index
+        self.assertIs(after.vms._data, before.vms._data)
+        self.assertIs(after.owners._data, before.owners._data)
+        # Readers still holding the old index keep seeing the VM
+        self.assertIn(1, before.vms)
+        self.assertNotIn(1, after.vms)
+        self.assertEqual(len(after.owners), 2)
+
+    def test_delete_requires_ownership(self):
+        self.assertFalse(self.repo.delete_vm("bob", 1))
+        self.assertFalse(self.repo.delete_vm("alice", 999))
+        self.assertIsNotNone(self.repo.get_vm(1))
+
+    def shared_pair(self, capacity=16):
+        shared = SharedGeneration(capacity=capacity)
+        self.repo.share(shared)
+        other = VMRepository(self.users_file, self.vms_all_file)
+        other.share(shared)
+        return other
+
+    def test_shared_delete_replayed_without_reload(self):
+        other = self.shared_pair()
+        other.query_vms(VMQuery())
+        calls = []
+        other.subscribe(lambda *args: calls.append(args))
+        self.repo.delete_vm("alice", 1)
+        with patch.object(other, "_load", side_effect=AssertionError("reloaded")):
+            self.assertIsNone(other.get_vm(1))
+            self.assertEqual([vm.vm_id for vm in other.get_user("alice")[1]], [2])
+            self.assertEqual(other.query_vms(VMQuery())[1], 2)
+        self.assertEqual(other.version, self.repo.version)
+        self.assertEqual(calls[0][1:], (self.repo.version, "alice", {1}))
+
+    def test_shared_compaction_adopted_without_reload(self):
+        other = self.shared_pair()
+        self.repo.delete_vm("alice", 1)
+        self.assertIsNone(other.get_vm(1))
+        self.repo.flush()
+        with patch.object(other, "_load", side_effect=AssertionError("reloaded")):
+            self.assertIsNone(other.get_vm(1))
+            self.assertEqual(other._index.stamp, self.repo._index.stamp)
+
+    def test_shared_delete_from_stale_worker_keeps_others(self):
+        other = self.shared_pair()
+        self.repo.delete_vm("alice", 1)
+        self.assertTrue(other.delete_vm("alice", 2))
+        self.repo.reload()
+        self.assertEqual(self.repo.get_user("alice")[1], ())
+
+    def test_shared_falls_back_to_reload(self):
+        other = self.shared_pair(capacity=1)
+        self.repo.delete_vms("alice", [1, 2])
+        self.assertIsNone(other.get_vm(2))
+        self.write_users([make_user("carol", [10])])
+        self.assertIsNotNone(other.get_vm(10))
+
+    def test_delete_notifies_listeners(self):
+        calls = []
+        self.repo.subscribe(lambda *args: calls.append(args))
+        before = self.repo.version
+        self.repo.delete_vms("alice", [1, 3, 999])
+        self.repo.delete_vms("alice", [999])
+        self.assertEqual(calls, [(before, self.repo.version, "alice", {1})])
+
+    def test_delete_vms_single_write(self):
+        results = self.repo.delete_vms("alice", [1, 2, 3, 999])
+        self.assertEqual(
+            results, {1: "deleted", 2: "deleted", 3: "forbidden", 999: "not_found"}
+        )
+        self.assertEqual(self.repo.get_user("alice")[1], ())
+        self.assertIsNotNone(self.repo.get_vm(3))
+        self.repo.flush()
+        with open(self.vms_all_file) as f:
+            self.assertEqual(json.load(f), [{"vm_id": 3}])
+
+    def test_burst_of_deletes_compacted_once(self):
+        with patch(
+            "app.vm_repository.write_json_atomic", wraps=write_json_atomic
+        ) as write:
+            self.repo.delete_vm("alice", 1)
+            self.repo.delete_vm("alice", 2)
+            self.repo.delete_vm("bob", 3)
+            self.assertEqual(write.call_count, 0)
+            self.repo.flush()
+            self.repo.flush()
+        self.assertEqual(write.call_count, 2)
+        self.assertEqual(self.repo.journal.entries(), [])
+        with open(self.users_file) as f:
+            self.assertEqual([user["vms"] for user in json.load(f)], [[], []])
+
+    def test_compaction_runs_in_background(self):
+        repo = VMRepository(self.users_file, self.vms_all_file, compact_delay=0)
+        repo.delete_vm("alice", 1)
+        for _ in range(200):
+            if not repo.journal.entries():
+                break
+            time.sleep(0.01)
+        with open(self.vms_all_file) as f:
+            self.assertEqual(json.load(f), [{"vm_id": 2}, {"vm_id": 3}])
+
+    def test_journal_replayed_after_crash(self):
+        self.repo.delete_vm("alice", 1)
+        restarted = VMRepository(self.users_file, self.vms_all_file)
+        self.assertIsNone(restarted.get_vm(1))
+        self.assertEqual([vm.vm_id for vm in restarted.all_vms()], [2, 3])
+
+    def test_compaction_cut_short_is_finished_on_restart(self):
+        self.repo.journal.append("alice", {1})
+        # The users file was rewritten but vms_all.json was not
+        self.write_users([make_user("alice", [2]), make_user("bob", [3])])
+        restarted = VMRepository(self.users_file, self.vms_all_file)
+        with patch.object(restarted, "_schedule_compaction") as schedule:
+            self.assertEqual([vm.vm_id for vm in restarted.all_vms()], [2, 3])
+        schedule.assert_called_once_with()
+        restarted.flush()
+        with open(self.vms_all_file) as f:
+            self.assertEqual(json.load(f), [{"vm_id": 2}, {"vm_id": 3}])
+        self.assertEqual(restarted.journal.entries(), [])
+
+    def test_concurrent_deletes_keep_every_update(self):
+        self.write_users(
+            [make_user(f"user{n}", range(n * 10, n * 10 + 10)) for n in range(8)]
+        )
+
+        def delete_all(n):
+            for vm_id in range(n * 10, n * 10 + 10):
+                self.repo.delete_vm(f"user{n}", vm_id)
+
+        threads = [threading.Thread(target=delete_all, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.repo.flush()
+        self.assertEqual(self.repo.all_vms(), [])
+        restarted = VMRepository(self.users_file, self.vms_all_file)
+        restarted.journal = DeleteJournal(os.path.join(self.tmpdir.name, "empty"))
+        self.assertEqual(restarted.all_vms(), [])
+
+    def test_query_vms_tracks_deletes(self):
+        page, total, _ = self.repo.query_vms(VMQuery(), owner="alice")
+        self.assertEqual(([vm.vm_id for vm in page], total), ([1, 2], 2))
+        self.repo.delete_vm("alice", 1)
+        page, total, _ = self.repo.query_vms(VMQuery(order="desc"))
+        self.assertEqual(([vm.vm_id for vm in page], total), ([3, 2], 2))
+
+    def test_search_vms_tracks_deletes(self):
+        page, total, exact = self.repo.search_vms("alice")
+        self.assertEqual(([vm.vm_id for vm in page], total, exact), ([1, 2], 2, True))
+        self.repo.delete_vm("alice", 1)
+        page, total, _ = self.repo.search_vms("alice")
+        self.assertEqual(([vm.vm_id for vm in page], total), ([2], 1))
+        self.repo.reload()
+        page, _, _ = self.repo.search_vms("", id_range=(2, 3))
+        self.assertEqual([vm.vm_id for vm in page], [2, 3])
+
+    def test_fleet_stats_track_deletes(self):
+        self.assertEqual(
+            self.repo.fleet_stats({}, ["owner"]), (3, {"owner": {"alice": 2, "bob": 1}})
+        )
+        self.repo.delete_vm("alice", 1)
+        self.assertEqual(
+            self.repo.fleet_stats({"podbox": "box1"}, ["owner"]),
+            (2, {"owner": {"alice": 1, "bob": 1}}),
+        )
+
+    def test_restart_maps_snapshot(self):
+        self.repo.get_vm(1)
+        self.assertTrue(os.path.exists(self.users_file + ".snapshot"))
+        restarted = VMRepository(self.users_file, self.vms_all_file)
+        with patch("app.vm_repository.iter_json_array") as parse:
+            self.assertEqual(restarted.get_user("alice")[0]["username"], "alice")
+            self.assertEqual([vm.vm_id for vm in restarted.all_vms()], [1, 2, 3])
+            self.assertTrue(restarted.delete_vm("alice", 1))
+            restarted.flush()
+        parse.assert_not_called()
+        self.assertEqual(type(restarted._index.vms).__name__, "SnapshotRows")
+        self.assertEqual([vm.vm_id for vm in restarted.all_vms()], [2, 3])
+        again = VMRepository(self.users_file, self.vms_all_file)
+        self.assertEqual([vm.vm_id for vm in again.all_vms()], [2, 3])
+
+    def test_stale_or_corrupt_snapshot_ignored(self):
+        self.repo.get_vm(1)
+        self.write_users([make_user("carol", [10])])
+        restarted = VMRepository(self.users_file, self.vms_all_file)
+        self.assertEqual([vm.vm_id for vm in restarted.all_vms()], [10])
+        with open(self.users_file + ".snapshot", "wb") as f:
+            f.write(b"garbage")
+        restarted = VMRepository(self.users_file, self.vms_all_file)
+        self.assertEqual([vm.vm_id for vm in restarted.all_vms()], [10])
+
+    def test_snapshot_disabled(self):
+        repo = VMRepository(self.users_file, self.vms_all_file, snapshot_file="")
+        repo.get_vm(1)
+        self.assertFalse(os.path.exists(self.users_file + ".snapshot"))
+
+
+if __name__ == "__main__":
+    unittest.main()
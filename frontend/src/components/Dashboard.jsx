@@ -1,6 +1,6 @@
 import {useEffect, useState, useCallback} from 'react'
 import {
-	deleteVMS, displayVMDetailData, getAllVMS, getLCData, getPodboxData, getVersionData, getVMFromUser
+	deleteVMS, getVMPage, searchVMs, subscribeToChanges
 } from "../utils/routeData.jsx";
 import 'bootstrap/dist/css/bootstrap.min.css';
 import '../App.css'
@@ -8,21 +8,22 @@ import React from "react";
 import DeleteIcon from '../assets/delete-icon.svg?react' ;
 import {Table, Form, Button, Spinner, Pagination, InputGroup, Badge, Dropdown, Modal} from "react-bootstrap";
 
-
 function Dashboard({username}) {
-	const [allVMData, setAllVMData] = useState(null);
-	const [tableData, setTableData] = useState([]);
+	const [tableData, setTableData] = useState(null);
 	const [selectedClusterIds, setSelectedClusterIds] = useState(new Set());
 	const displayNumber = 10;
-	const [tableRange, setTableRange] = useState([0, displayNumber]);
 	const [page, setPage] = useState(0);
-	const [userVMData, setUserVMData] = useState(null)
+	const [cursors, setCursors] = useState([null]);
+	const [nextCursor, setNextCursor] = useState(null);
+	const [total, setTotal] = useState(0);
+	const [sort, setSort] = useState('vm_id');
+	const [order, setOrder] = useState('asc');
+	const [reloadCount, setReloadCount] = useState(0);
 	const [displayAllVMs, setDisplayAllVMs] = useState(false)
-	const [currentDisplaySource, setCurrentDisplaySource] = useState(userVMData)
-	const isAllSelected = tableData.length > 0 && selectedClusterIds.size === tableData.length;
+	const rows = tableData || [];
+	const isAllSelected = rows.length > 0 && selectedClusterIds.size === rows.length;
 	const [searchQuery, setSearchQuery] = useState('');
 	const [searchCluster, setSearchCluster] = useState('')
-	const [isSearchByCluster, setIsSearchByCluster] = useState(false)
 	const [showDeleteModal, setShowDeleteModal] = useState(false)
 	const [showDeleteStatusModal, setShowDeleteStatusModal] = useState(false)
 	const [deleteStatusMessage, setDeleteStatusMessage] = useState('')
@@ -43,119 +44,55 @@ function Dashboard({username}) {
 	const handleSelectAllCheckboxChange = useCallback((event) => {
         // Function to handle "Select All" checkbox changes
 		if (event.target.checked) {
-			const allClusterIds = new Set(tableData.map(cluster => cluster.id));
+			const allClusterIds = new Set(rows.map(cluster => cluster.id));
 			setSelectedClusterIds(allClusterIds);
 		} else {
 			setSelectedClusterIds(new Set());
 		}
-	}, [tableData]);
+	}, [rows]);
+
+	const resetPaging = useCallback(() => {
+        // Function to go back to the first page when the sort, filter or view changes
+		setTableData(null);
+		setPage(0);
+		setCursors([null]);
+	}, []);
 
 	const handleNextPage = useCallback(() => {
         // Function to handle pagination to the next page
-		if (currentDisplaySource && (tableRange[1] < currentDisplaySource.length)) {
+        // the backend's cursor for the next page is kept so the previous pages can be revisited
+		if (nextCursor) {
+			setCursors(prevCursors => [...prevCursors.slice(0, page + 1), nextCursor]);
 			setPage(prevPage => prevPage + 1);
-			setTableRange(prevRange => [prevRange[0] + displayNumber, prevRange[1] + displayNumber]);
-			setSelectedClusterIds(new Set()); // Clear selection on page change
 		}
-	}, [currentDisplaySource, tableRange, displayNumber]);
+	}, [nextCursor, page]);
 
 	const handlePrevPage = useCallback(() => {
         // Function to handle pagination to the previous page
 		if (page > 0) { // Check if not on the first page
 			setPage(prevPage => prevPage - 1);
-			setTableRange(prevRange => [prevRange[0] - displayNumber, prevRange[1] - displayNumber]);
-			setSelectedClusterIds(new Set());
 		}
-	}, [page, displayNumber]);
-
-	const sortAscendingIds = useCallback((vmsData) => {
-        // Function to sort VMs by ascending IDs
-        // Complexity of O(n log n) where n is the number of VMs
-		setTableData([]);
-		setTableRange([0, displayNumber]);
-		setPage(0);
-		console.log('SORTING (Ascending)');
-		const sortedVMs = vmsData.sort((a, b) => a.vm_id - b.vm_id);
-		console.log('SORTED (Ascending)');
-		setCurrentDisplaySource(sortedVMs);
-	}, [currentDisplaySource]);
-
-	const sortDescendingIds = useCallback((vmsData) => {
-        // Function to sort VMs by descending IDs
-        // Complexity of O(n log n) where n is the number of VMs
-		setTableData([]);
-		setTableRange([0, displayNumber]);
-		setPage(0);
-		console.log('SORTING (Descending)');
-		const sortedVMs = vmsData.sort((a, b) => b.vm_id - a.vm_id);
-		console.log('SORTED (Descending)');
-		setCurrentDisplaySource(sortedVMs);
-	}, [currentDisplaySource]);
-
-	const sortAscendingUsers = useCallback((vmsData) => {
-        // Function to sort VMs by ascending usernames
-        // Complexity of O(n log n) where n is the number of VMs
-		setTableData([]);
-		setTableRange([0, displayNumber]);
-		setPage(0);
-		console.log('SORTING (Ascending)');
-		console.log(vmsData)
-		const sortedVMs = vmsData.sort((a, b) => {
-			return a.deployedclustername.localeCompare(b.deployedclustername)
-		});
-		console.log(sortedVMs)
-		console.log('SORTED (Ascending)');
-		setCurrentDisplaySource(sortedVMs);
-	}, [currentDisplaySource]);
+	}, [page]);
 
-	const sortDescendingUsers = useCallback((vmsData) => {
-        // Function to sort VMs by descending usernames
-        // Complexity of O(n log n) where n is the number of VMs
-		setTableData([]);
-		setTableRange([0, displayNumber]);
-		setPage(0);
-		console.log(currentDisplaySource)
-		console.log('SORTING (Ascending)');
-		console.log(vmsData)
-		const sortedVMs = vmsData.sort((a, b) => {
-			return b.deployedclustername.localeCompare(a.deployedclustername)
-		});
-		console.log(sortedVMs)
-		console.log('SORTED (Ascending)');
-		setCurrentDisplaySource(sortedVMs);
-	}, [currentDisplaySource]);
+	const handleSort = useCallback((key, direction) => {
+        // Function to sort VMs by the given key and direction
+        // the backend keeps a sorted index per key, so only one page is fetched
+		setSort(key);
+		setOrder(direction);
+		resetPaging();
+	}, [resetPaging]);
 
 	const handleSwitchViewToggle = () => {
         // Function to toggle between user-specific and all VMs view
 		setDisplayAllVMs(prevState => !prevState);
-		setTableRange([0, displayNumber]);
-		setPage(0)
+		setSearchCluster('');
+		resetPaging();
 	}
 
 	const handleSearchCluster = (cluster) => {
-        // Function to handle searching clusters by user or ID
-		setTableData([]);
-		setTableRange([0, displayNumber]);
-		setPage(0);
-		if (cluster.trim().length === 0) return setIsSearchByCluster(false);
-		const isNumeric = /^\d+$/.test(cluster);
-		if (isNumeric) {
-			const filteredByID = allVMData.filter(vmData => {
-				const clusterID = vmData.vm_id.toString()
-				return clusterID === cluster;
-			});
-			setSearchCluster(filteredByID)
-			setIsSearchByCluster(true)
-		} else {
-			const filteredByUsername = allVMData.filter(vmData => {
-				const clusterName = vmData.deployedclusterowner.toLowerCase();
-				const searchUsername = cluster.toLowerCase();
-				return clusterName === searchUsername;
-			});
-			setSearchCluster(filteredByUsername)
-			setIsSearchByCluster(true)
-		}
-
+        // Function to handle filtering clusters by ID or name
+		setSearchCluster(cluster.trim());
+		resetPaging();
 	}
 
 	const handleKeyDown = (event) => {
@@ -170,12 +107,19 @@ function Dashboard({username}) {
 	const handleDeleteModalOpen = () => setShowDeleteModal(true);
 	const handleDeleteStatusModalOpen = () => setShowDeleteStatusModal(true);
 	const handleDeleteStatusModalClose = () => setShowDeleteStatusModal(false)
+	const reloadPage = useCallback(() => {
+        // Function to fetch the current page again after VMs were deleted
+        // only the rows on screen are requested, never the whole fleet
+		setReloadCount(prevCount => prevCount + 1);
+	}, []);
+
 	const handleDeleteVMS = async (ids) => {
         // Function to handle deletion of selected VMs
 		if (ids.size > 0) {
 			const result = await deleteVMS(ids)
 			console.log(result.status)
 			if (result.status) {
+				reloadPage()
 				handleDeleteModalClose()
 				handleDeleteStatusModalOpen()
 				setDeleteStatusMessage(result.status)
@@ -186,119 +130,45 @@ function Dashboard({username}) {
 	}
 
 	const handlePageReload = () => {
-        // Function to reload the page after deletion
-		if (deleteStatusMessage === 'success') window.location.reload()
+        // Function to clear the selection after deletion
+        // the current page is fetched again, so the page is not reloaded
+		if (deleteStatusMessage === 'success') setSelectedClusterIds(new Set())
 	}
 
 	useEffect(() => {
-        // Fetch initial VM data on component mount
-		async function fetchData() {
-			try {
-				let userData = await getVMFromUser();
-				let allVMs = await getAllVMS();
-				setUserVMData(userData)
-				setAllVMData(allVMs); // Set initial unsorted data
-			} catch (error) {
-				console.error("Error fetching initial VM data:", error);
-				setAllVMData([]); // Set to empty array on error
-			}
-		}
-
-		fetchData()
-
-	}, []);
+        // Keep the page in sync with VMs deleted from any dashboard
+        // each batch of deletes costs one event and one page request
+		return subscribeToChanges(reloadPage, reloadPage);
+	}, [reloadPage]);
 
 	useEffect(() => {
-        // Effect to fetch and update table data based on current display source and pagination
+        // Effect to fetch the current page with the chosen sort, filter and cursor
 		let isCurrent = true; // Flag to handle race conditions for async operations
 		async function fetchTableData() {
+			// searches go through the backend's search index and come back best matches first
+			const result = displayAllVMs && searchCluster
+				? await searchVMs(searchCluster, displayNumber, cursors[page])
+				: await getVMPage({limit: displayNumber, sort, order, cursor: cursors[page]}, !displayAllVMs);
+			if (!isCurrent) return; // Exit if a newer effect run has started
 
-			if (displayAllVMs && !isSearchByCluster) {
-				setCurrentDisplaySource(allVMData)
-				setSelectedClusterIds(new Set());
-				if (!allVMData || allVMData.length === 0) {
-					if (isCurrent) {
-						setTableData([]); // Clear table if no data or still loading allVMData
-					}
-					return;
-				}
-			} else if (!displayAllVMs) {
-				setCurrentDisplaySource(userVMData)
-				setSelectedClusterIds(new Set());
-				if (!userVMData || userVMData.length === 0) {
-					if (isCurrent) {
-						setTableData([]); // Clear table if no data or still loading userVMData
-					}
-					return;
-				}
-			} else if (displayAllVMs && isSearchByCluster) {
-				setCurrentDisplaySource(searchCluster)
-				setSelectedClusterIds(new Set());
-				if (!searchCluster || searchCluster.length === 0) {
-					if (isCurrent) {
-						setTableData([]); // Clear table if no data or still loading searchCluster
-					}
-					return;
-				}
-			}
-
-			// 1. Initialize tableData with basic VM info and a loading state
-			setTableData([])
-			const sourceData = displayAllVMs ? (isSearchByCluster ? searchCluster : allVMData) : userVMData;
-			const initialTableDataSlice = sourceData.slice(tableRange[0], tableRange[1]).map(vm => ({
-				id: vm.vm_id, loading: true, error: false, errorMessage: '',
+			setSelectedClusterIds(new Set());
+			setTotal(result.total || 0);
+			setNextCursor(result.next_cursor || null);
+			setTableData((result.items || []).map(vmDetails => {
+				const deployedClusterTime = new Date(vmDetails.deployedvmtimestamp)
+				const formatDateTime = deployedClusterTime.toLocaleString()
+				return { // Construct complete row data
+					id: vmDetails.vm_id,
+					pod: vmDetails.podbox || 'not found',
+					version: vmDetails.version || 'data not found',
+					deployedclusterstart: formatDateTime || 'data not found',
+					deployedclusterowner: vmDetails.deployedclusterowner,
+					deployedvmstatus: vmDetails.deployedvmstatus || 'data not found',
+					loading: false,
+					error: false,
+					errorMessage: '',
+				};
 			}));
-
-
-			if (isCurrent) {
-				setTableData(initialTableDataSlice);
-			}
-
-			// 2. Fetch details for each item in the slice and update incrementally
-			for (let i = 0; i < initialTableDataSlice.length; i++) {
-				if (!isCurrent) return; // Exit if a newer effect run has started
-
-				const vm = initialTableDataSlice[i];
-				const globalIndex = tableRange[0] + i;
-
-				try {
-                    // Fetch detailed data for the VM
-					const vmDetails = displayAllVMs ? await displayVMDetailData(sourceData, globalIndex) : await displayVMDetailData(userVMData, globalIndex);
-					const vmVersion = displayAllVMs ? await getVersionData(sourceData, globalIndex) : await getVersionData(userVMData, globalIndex);
-					const vmLCData = displayAllVMs ? await getLCData(sourceData, globalIndex) : await getLCData(userVMData, globalIndex);
-					const vmPodbox = displayAllVMs ? await getPodboxData(sourceData, globalIndex) : await getPodboxData(userVMData, globalIndex);
-					const deployedClusterTime = new Date(vmDetails ? vmDetails?.deployedvmtimestamp : vmLCData?.deployedvmtimestamp)
-					const formatDateTime = deployedClusterTime.toLocaleString()
-
-					if (!isCurrent) return;
-
-					const completeRowData = { // Construct complete row data
-						id: vm.id,
-						pod: vmPodbox || 'not found',
-						version: vmVersion || 'data not found',
-						deployedclusterstart: formatDateTime || 'data not found',
-						deployedclusterowner: vmDetails?.deployedclusterowner,
-						deployedvmstatus: vmDetails?.deployedvmstatus || 'data not found',
-						loading: false,
-						error: false,
-						errorMessage: '',
-					};
-
-					setTableData(prevData => { // Update the specific row in tableData
-						return prevData.map(item => item.id === vm.id ? completeRowData : item);
-					});
-
-				} catch (error) {
-					console.error(`Failed to fetch details for VM ID ${vm.id}:`, error);
-					if (!isCurrent) return;
-					setTableData(prevData => {
-						return prevData.map(item => item.id === vm.id ? {
-							...item, loading: false, error: true, errorMessage: error.message
-						} : item);
-					});
-				}
-			}
-			console.log('TABLEDATA', tableData)
 		}
 
 		fetchTableData();
@@ -307,7 +177,7 @@ function Dashboard({username}) {
 		return () => {
 			isCurrent = false; // Mark this effect run as stale
 		};
-	}, [allVMData, tableRange, displayVMDetailData, getLCData, displayAllVMs, isSearchByCluster, searchCluster]);
+	}, [displayAllVMs, searchCluster, sort, order, cursors, page, reloadCount]);
 
 	useEffect(() => {
 		console.log("Selected Cluster IDs:", selectedClusterIds);
@@ -346,9 +216,9 @@ function Dashboard({username}) {
 
 							<Dropdown.Menu>
 								<Dropdown.Item eventKey='1'
-								               onClick={() => sortAscendingIds(currentDisplaySource)}>Increasing</Dropdown.Item>
+								               onClick={() => handleSort('vm_id', 'asc')}>Increasing</Dropdown.Item>
 								<Dropdown.Item eventKey='2'
-								               onClick={() => sortDescendingIds(currentDisplaySource)}>Decreasing</Dropdown.Item>
+								               onClick={() => handleSort('vm_id', 'desc')}>Decreasing</Dropdown.Item>
 							</Dropdown.Menu></Dropdown>
 						<th>POD</th>
 						<th>VERSION</th>
@@ -361,9 +231,9 @@ function Dashboard({username}) {
 								<Dropdown.Item eventKey='1'
 								               onClick={() => handleSwitchViewToggle()}>{!displayAllVMs ? 'ALL USERS' : username}</Dropdown.Item>
 								{displayAllVMs && <><Dropdown.Item eventKey='2'
-								                                   onClick={() => sortAscendingUsers(allVMData)}>A-Z</Dropdown.Item>
+								                                   onClick={() => handleSort('deployedclusterowner', 'asc')}>A-Z</Dropdown.Item>
 									<Dropdown.Item eventKey='3'
-									               onClick={() => sortDescendingUsers(allVMData)}>Z-A</Dropdown.Item></>}
+									               onClick={() => handleSort('deployedclusterowner', 'desc')}>Z-A</Dropdown.Item></>}
 							</Dropdown.Menu></Dropdown>
 						<th>STATUS</th>
 						<th className="select-header">
@@ -373,17 +243,17 @@ function Dashboard({username}) {
 								id="select-all-checkbox"
 								checked={isAllSelected}
 								onChange={handleSelectAllCheckboxChange}
-								disabled={tableData.length === 0 || tableData.some(row => row.loading)} // Disable if no data or still loading
+								disabled={rows.length === 0} // Disable if no data or still loading
 							/>
 						</th>
 					</tr>
 					</thead>
 					<tbody>
-					{currentDisplaySource === null ? (<tr>
+					{tableData === null ? (<tr>
 						<td rowSpan={10} colSpan={7} className="loading-message text-center">
-							Loading all VM data... <Spinner animation="border" size="sm"/>
+							Loading VM data... <Spinner animation="border" size="sm"/>
 						</td>
-					</tr>) : currentDisplaySource.length === 0 ? (<tr>
+					</tr>) : tableData.length === 0 ? (<tr>
 						<td colSpan={7} className="no-data-message text-center">
 							No VMs available.
 						</td>
@@ -415,13 +285,12 @@ function Dashboard({username}) {
 				</Table>
 			</div>
 			<div className="pagination-info">
-				{currentDisplaySource && currentDisplaySource.length > 0 ? (
-						<p>Showing {tableRange[0] + 1} - {tableRange[1] > currentDisplaySource?.length ? tableData?.length : tableRange[1]} of {currentDisplaySource?.length}</p>) :
+				{rows.length > 0 ? (
+						<p>Showing {page * displayNumber + 1} - {page * displayNumber + rows.length} of {total}</p>) :
 					<p>{''}</p>}
 				<Pagination className="pagination-controls">
 					<Pagination.Prev onClick={handlePrevPage} disabled={page === 0}/>
-					<Pagination.Next onClick={handleNextPage}
-					                 disabled={currentDisplaySource && (tableRange[1] >= currentDisplaySource.length)}/>
+					<Pagination.Next onClick={handleNextPage} disabled={!nextCursor}/>
 				</Pagination>
 			</div>
 		</div>
@@ -1,134 +1,101 @@
 export const BACKEND_URL = `http://${window.location.hostname}:5000`
-export const getAllVMS = async () => {
-    // Call to fetch all VMs from the backend
-	console.log('GETTING ALL VMS')
-	try {
-		const response = await fetch(`${BACKEND_URL}/vms/all`);
-		const result = await response.json();
-		return result
-	} catch (err) {
-		console.log(err);
+const validatorCache = new Map(); // least recently used first
+const VALIDATOR_CACHE_SIZE = 50;
+
+const rememberValidated = (key, entry) => {
+        // Store entry as the most recently used, evicting the oldest past the cap
+	validatorCache.delete(key);
+	validatorCache.set(key, entry);
+	if (validatorCache.size > VALIDATOR_CACHE_SIZE) {
+		validatorCache.delete(validatorCache.keys().next().value);
 	}
 };
 
-export const displayVMDetailData = async (vmDetails, index) => {
-    // Call to fetch specific VM details from the backend
-    // using the vm_id obtained from vmDetails at the given index
-	console.log('GETTING VM DETAILS');
-    try {
-        const vms = await vmDetails;
-        if (!Array.isArray(vms) || index < 0 || index >= vms.length) return null;
-        const vm = vms[index]?.vm_id;
-        if (!vm) return null;
-        const response = await fetch(`${BACKEND_URL}/vms/${vm}`);
-        if (!response.ok) {
-          const text = await response.text();
-          console.log('Failed to fetch VM details:', response.status, text);
-          return null;
-        }
-        return await response.json();
-    } catch (err) {
-        console.log(err);
-        return null;
-   }
+export const fetchWithValidators = async (url, options = {}) => {
+    // Fetch a GET endpoint, revalidating the body cached from a previous call
+    // sends the stored ETag as If-None-Match and reuses the cached body on 304
+	const key = `${options.headers?.Authorization || ''} ${url}`;
+	const cached = validatorCache.get(key);
+	const headers = {...options.headers};
+	if (cached) headers['If-None-Match'] = cached.etag;
+	const response = await fetch(url, {...options, headers});
+	if (response.status === 304 && cached) {
+		rememberValidated(key, cached);
+		return cached.body;
+	}
+	const body = await response.json();
+	const etag = response.headers?.get('ETag');
+	if (response.ok && etag) rememberValidated(key, {etag, body});
+	return body;
 };
 
-export const deleteVMS = async (vmDeletionList) => {
-    // Call to delete VMs from the backend
-    // Given a list of vm IDs to delete
-	console.log("DELETING: ", vmDeletionList)
-    const token = localStorage.getItem('access_token');
+export const clearValidatorCache = () => validatorCache.clear();
+
+export const getVMPage = async (params = {}, ownOnly = false) => {
+    // Call to fetch one sorted and filtered page of VMs from the backend
+    // params may hold limit, cursor, sort, order, owner, status, podbox, version and q
+    // returns {items, total, next_cursor}
+	const query = new URLSearchParams(Object.entries(params).filter(([, value]) => value != null && value !== ''))
+	if (!query.has('limit')) query.set('limit', '10')
 	try {
-		for (const id of vmDeletionList) {
-			console.log("DELETING: ", id)
-			const response = await fetch(`${BACKEND_URL}/vms/delete/${id}`, {
-              headers: {
-                'Authorization': `Bearer ${token}`,
-              },
-            });
-			if(response.status !== 200) return {status: 'failed'}
-		}
-		return {status: 'success'}
+		const token = localStorage.getItem('access_token');
+		return await fetchWithValidators(`${BACKEND_URL}/${ownOnly ? 'vms_by_user' : 'vms/all'}?${query}`, {
+			headers: {
+				'Authorization': `Bearer ${token}`,
+			},
+		});
 	} catch (err) {
-		console.log(err)
-		return {status: 'failed'}
+		console.log(err);
+		return {items: [], total: 0, next_cursor: null};
 	}
 };
 
-export const getLCData = async (vmDetails, index) => {
-    // Call to fetch lifecycle data for a specific VM
-    // using the vm_id obtained from vmDetails at the given index
-	console.log('GETTING STATUS')
+export const searchVMs = async (q, limit = 10, cursor = null) => {
+    // Call to search VMs by ID, cluster name, owner or podbox on the backend
+    // returns one page of the best matches first as {items, total, next_cursor}
+	const query = new URLSearchParams({q, limit: String(limit)})
+	if (cursor) query.set('cursor', cursor)
 	try {
-		const vms = await vmDetails
-		const vm = vms[index]?.vm_id;
-        if (!vm) return null;
-		const response = await fetch(`${BACKEND_URL}/vms/${vm}`)
-		const result = await response.json();
-		return result.deployedvmstatus || null;
+		const result = await fetchWithValidators(`${BACKEND_URL}/vms/search?${query}`);
+		return {items: result.items || [], total: result.total || 0, next_cursor: result.next_cursor || null}
 	} catch (err) {
 		console.log(err);
+		return {items: [], total: 0, next_cursor: null};
 	}
 };
 
-export const getPodboxData = async (vmDetails, index) => {
-    // Call to fetch podbox data for a specific VM
-    // using the vm_id obtained from vmDetails at the given index
-  console.log('GETTING PODBOX DATA');
-  try {
-		const vms = await vmDetails
-		const vm = vms[index]?.vm_id;
-        if (!vm) return null;
-		const response = await fetch(`${BACKEND_URL}/vms/${vm}`)
-		const result = await response.json();
-		return result.podbox || null;
-  } catch (err) {
-		console.log(err);
-  }
+export const subscribeToChanges = (onDelete, onReset) => {
+    // Open the backend's server-sent change feed
+    // onDelete is called with the IDs of every batch of deleted VMs, from any dashboard
+    // onReset is called when the feed missed changes and the listings must be fetched again
+    // the browser reconnects on its own, resuming after the last event it received
+    // returns a function that closes the feed
+	if (typeof EventSource === 'undefined') return () => {};
+	const source = new EventSource(`${BACKEND_URL}/vms/changes`);
+	source.addEventListener('delete', (event) => onDelete(JSON.parse(event.data).vm_ids));
+	source.addEventListener('reset', () => onReset());
+	return () => source.close();
 };
 
-
-export const getVMFromUser = async () => {
-  // Call to fetch VMs associated with the current user
-  console.log('GETTING VMS FROM CURRENT USER');
-  try {
+export const deleteVMS = async (vmDeletionList) => {
+    // Call to delete VMs from the backend
+    // Given a list of vm IDs to delete, sent as a single batch request
+	const ids = Array.from(vmDeletionList)
+	console.log("DELETING: ", ids)
+	if (ids.length === 0) return {status: 'success'}
     const token = localStorage.getItem('access_token');
-        const response = await fetch(`${BACKEND_URL}/vms_by_user`, {
-      headers: {
-        'Authorization': `Bearer ${token}`,
-      },
-    });
-    const result = await response.json();
-    if (!Array.isArray(result) || result.length === 0) return [];
-    const seenIds = new Set();
-    const uniqueVMs = [];
-    for (const obj of result) {
-      if (obj.vm_id && !seenIds.has(obj.vm_id)) {
-        uniqueVMs.push(obj);
-        seenIds.add(obj.vm_id);
-      }
-    }
-    return uniqueVMs;
-  } catch (err) {
-    console.log(err);
-    return [];
-  }
-};
-
-export const getVersionData = async (vmDetails, index) => {
-    // Call to fetch version data for a specific VM
-    // using the vm_id obtained from vmDetails at the given index
-	console.log('GETTING VERSION DATA')
 	try {
-		const vms = await vmDetails
-		const vm = vms[index].vm_id;
-        if (!vm) return null;
-		const response = await fetch(`${BACKEND_URL}/vms/${vm}`)
-		const result = await response.json();
-		return result.version;
+		const response = await fetch(`${BACKEND_URL}/vms/delete`, {
+			method: 'POST', headers: {
+				'Content-Type': 'application/json',
+				'Authorization': `Bearer ${token}`,
+			}, body: JSON.stringify({vm_ids: ids})
+		});
+		const result = await response.json()
+		return {status: result.success ? 'success' : 'failed', results: result.results}
 	} catch (err) {
-		console.log(err);
-        return null;
+		console.log(err)
+		return {status: 'failed'}
 	}
 };
 
@@ -1,14 +1,13 @@
 import {
-  getAllVMS,
-  displayVMDetailData,
   deleteVMS,
-  getLCData,
-  getPodboxData,
-  getVMFromUser,
-  getVersionData,
   loginUser,
   validateToken,
   getUsername,
+  getVMPage,
+  searchVMs,
+  subscribeToChanges,
+  fetchWithValidators,
+  clearValidatorCache,
   BACKEND_URL // Import BACKEND_URL to use in tests
 } from './routeData'; // Assuming routeData.js is the file containing your functions
 
@@ -21,6 +20,7 @@ describe('Global Setup', () => {
 
   beforeEach(() => {
     fetch.mockClear();
+    clearValidatorCache();
     jest.spyOn(console, 'log').mockImplementation(() => {});
   });
 
@@ -29,202 +29,161 @@ describe('Global Setup', () => {
   });
   // Existing tests (unchanged, but now use the mocked BACKEND_URL implicitly)
 
-  describe('getAllVMS', () => {
-    it('should fetch all VMs and return JSON data', async () => {
-      const mockData = [{ id: 1, name: 'vm1' }];
-      fetch.mockResolvedValue({
+  describe('fetchWithValidators', () => {
+    it('should send the stored ETag back and reuse the body on 304', async () => {
+      const mockData = [{ vm_id: 1 }];
+      fetch.mockResolvedValueOnce({
+        ok: true,
+        status: 200,
+        headers: { get: () => 'W/"v1"' },
         json: jest.fn().mockResolvedValue(mockData),
       });
+      fetch.mockResolvedValueOnce({ ok: false, status: 304, headers: { get: () => 'W/"v1"' } });
 
-      const result = await getAllVMS();
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/all`);
-      expect(result).toEqual(mockData);
-    });
-
-    it('should log and return undefined on fetch error', async () => {
-      fetch.mockRejectedValue(new Error('Network error'));
-      const result = await getAllVMS();
-      expect(console.log).toHaveBeenCalled();
-      expect(result).toBeUndefined();
-    });
-  });
-
-  describe('displayVMDetailData', () => {
-    it('should fetch VM detail and return result', async () => {
-      const vmDetails = Promise.resolve([{ id: 42, name: 'vm42' }]);
-      const mockResult = { id: 42, detail: 'info' };
-      fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue(mockResult),
+      expect(await fetchWithValidators(`${BACKEND_URL}/vms/all`)).toEqual(mockData);
+      expect(await fetchWithValidators(`${BACKEND_URL}/vms/all`)).toEqual(mockData);
+      expect(fetch).toHaveBeenLastCalledWith(`${BACKEND_URL}/vms/all`, {
+        headers: { 'If-None-Match': 'W/"v1"' },
       });
-
-      const result = await displayVMDetailData(vmDetails, 0);
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/lc/detail/42`);
-      expect(result).toEqual(mockResult);
-    });
-
-    it('should log and return undefined on fetch error', async () => {
-      const vmDetails = Promise.resolve([{ id: 99, name: 'vm99' }]);
-      fetch.mockRejectedValue(new Error('Network error'));
-
-      const result = await displayVMDetailData(vmDetails, 0);
-      expect(console.log).toHaveBeenCalled();
-      expect(result).toBeUndefined();
     });
-  });
 
-  describe('deleteVMS', () => {
-   it('should call fetch for each VM in the deletion list', async () => {
-      const vmDeletionList = [1, 2, 3];
+    it('should forget the least recently used ETag past 50 URLs', async () => {
       fetch.mockResolvedValue({
+        ok: true,
         status: 200,
-        json: jest.fn().mockResolvedValue({ success: true }),
+        headers: { get: () => 'W/"v1"' },
+        json: jest.fn().mockResolvedValue([]),
       });
-
-      const result = await deleteVMS(vmDeletionList);
-
-      expect(fetch).toHaveBeenCalledTimes(vmDeletionList.length);
-      vmDeletionList.forEach(id => {
-        expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/delete/${id}`);
+      for (let page = 0; page < 50; page++) {
+        await fetchWithValidators(`${BACKEND_URL}/vms/all?cursor=${page}`);
+      }
+      await fetchWithValidators(`${BACKEND_URL}/vms/all?cursor=0`); // refresh the oldest
+      await fetchWithValidators(`${BACKEND_URL}/vms/all?cursor=50`);
+
+      await fetchWithValidators(`${BACKEND_URL}/vms/all?cursor=0`);
+      expect(fetch).toHaveBeenLastCalledWith(`${BACKEND_URL}/vms/all?cursor=0`, {
+        headers: { 'If-None-Match': 'W/"v1"' },
       });
-      expect(result).toEqual({ status: 'success' });
+      await fetchWithValidators(`${BACKEND_URL}/vms/all?cursor=1`);
+      expect(fetch).toHaveBeenLastCalledWith(`${BACKEND_URL}/vms/all?cursor=1`, { headers: {} });
     });
+  });
 
-    it('should not call fetch if the deletion list is empty', async () => {
-      const result = await deleteVMS([]);
-      expect(fetch).not.toHaveBeenCalled();
-      expect(result).toEqual({ status: 'success' }); // Should still return success if nothing to delete
-    });
+  describe('getVMPage', () => {
+    it('should request a page with the given query parameters', async () => {
+      const mockPage = { items: [{ vm_id: 1 }], total: 1, next_cursor: null };
+      fetch.mockResolvedValue({
+        json: jest.fn().mockResolvedValue(mockPage),
+      });
 
-    it('should log error and return failed status if fetch fails', async () => {
-      fetch.mockRejectedValue(new Error('Network error'));
-      const result = await deleteVMS([42]);
-      expect(console.log).toHaveBeenCalled();
-      expect(result).toEqual({ status: 'failed' });
+      const result = await getVMPage({ sort: 'vm_id', order: 'desc', owner: '' });
+      expect(fetch).toHaveBeenCalledWith(
+        `${BACKEND_URL}/vms/all?sort=vm_id&order=desc&limit=10`,
+        expect.anything(),
+      );
+      expect(result).toEqual(mockPage);
     });
-  });
 
-  describe('getLCData', () => {
-    it('should fetch LC data and return the first result', async () => {
-      const vmDetails = Promise.resolve([{ id: 7, name: 'vm7' }]);
-      const mockResult = [{ status: 'running', id: 7 }];
+    it('should query the current user listing when ownOnly is set', async () => {
       fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue(mockResult),
+        json: jest.fn().mockResolvedValue({ items: [], total: 0, next_cursor: null }),
       });
 
-      const result = await getLCData(vmDetails, 0);
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/7`);
-      expect(result).toEqual(mockResult[0]);
+      await getVMPage({ limit: 5 }, true);
+      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms_by_user?limit=5`, expect.anything());
     });
 
-    it('should log and return undefined on fetch error', async () => {
-      const vmDetails = Promise.resolve([{ id: 8, name: 'vm8' }]);
+    it('should return an empty page on fetch error', async () => {
       fetch.mockRejectedValue(new Error('Network error'));
-
-      const result = await getLCData(vmDetails, 0);
-      expect(console.log).toHaveBeenCalled();
-      expect(result).toBeUndefined();
+      const result = await getVMPage();
+      expect(result).toEqual({ items: [], total: 0, next_cursor: null });
     });
   });
 
-  // New tests for additional functions
-
-  describe('getPodboxData', () => {
-    it('should fetch podbox data and return the first result', async () => {
-      const mockId = 123;
-      const mockResult = [{ podboxInfo: 'data' }];
+  describe('searchVMs', () => {
+    it('should return a page of matches from the search endpoint', async () => {
+      const items = [{ vm_id: 12 }, { vm_id: 120 }];
       fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue(mockResult),
+        json: jest.fn().mockResolvedValue({ items, total: 5, total_exact: true, next_cursor: 'abc' }),
       });
 
-      const result = await getPodboxData(mockId);
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/detail/${mockId}`);
-      expect(result).toEqual(mockResult[0]);
+      const result = await searchVMs('12', 2, 'xyz');
+      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/search?q=12&limit=2&cursor=xyz`, expect.anything());
+      expect(result).toEqual({ items, total: 5, next_cursor: 'abc' });
     });
 
-    it('should log and return undefined on fetch error', async () => {
-      const mockId = 456;
+    it('should return an empty page on fetch error', async () => {
       fetch.mockRejectedValue(new Error('Network error'));
-
-      const result = await getPodboxData(mockId);
-      expect(console.log).toHaveBeenCalled();
-      expect(result).toBeUndefined();
+      expect(await searchVMs('web')).toEqual({ items: [], total: 0, next_cursor: null });
     });
   });
 
-  describe('getVMFromUser', () => {
-    it('should fetch VMs from current user and return unique cluster IDs', async () => {
-      const mockData = [
-        { id: 1, deployedclusterid: 43, name: 'vmA' },
-        { id: 2, deployedclusterid: 44, name: 'vmB' },
-        { id: 3, deployedclusterid: 43, name: 'vmC' }, // Duplicate deployedclusterid
-      ];
-      const expectedResult = [
-        { id: 1, deployedclusterid: 43, name: 'vmA' },
-        { id: 2, deployedclusterid: 44, name: 'vmB' },
-      ];
-      fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue(mockData),
-      });
-
-      const result = await getVMFromUser();
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms_by_user`);
-      expect(result).toEqual(expectedResult);
+  describe('subscribeToChanges', () => {
+    it('should pass deleted IDs and resets from the change feed', () => {
+      const listeners = {};
+      const source = { addEventListener: (type, listener) => { listeners[type] = listener; }, close: jest.fn() };
+      global.EventSource = jest.fn(() => source);
+      const onDelete = jest.fn();
+      const onReset = jest.fn();
+
+      const close = subscribeToChanges(onDelete, onReset);
+      expect(EventSource).toHaveBeenCalledWith(`${BACKEND_URL}/vms/changes`);
+      listeners.delete({ data: JSON.stringify({ version: 2, owner: 'alice', vm_ids: [1, 2] }) });
+      expect(onDelete).toHaveBeenCalledWith([1, 2]);
+      listeners.reset({ data: JSON.stringify({ version: 3 }) });
+      expect(onReset).toHaveBeenCalled();
+      close();
+      expect(source.close).toHaveBeenCalled();
+      delete global.EventSource;
     });
+  });
 
-    it('should return an empty array if no VMs are returned', async () => {
+  describe('deleteVMS', () => {
+   it('should send the whole deletion list in a single request', async () => {
+      const vmDeletionList = [1, 2, 3];
+      const results = { 1: 'deleted', 2: 'deleted', 3: 'deleted' };
       fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue([]),
+        status: 200,
+        json: jest.fn().mockResolvedValue({ success: true, results }),
       });
 
-      const result = await getVMFromUser();
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms_by_user`);
-      expect(result).toEqual([]);
-    });
-
-    it('should log and return undefined on fetch error', async () => {
-      fetch.mockRejectedValue(new Error('Network error'));
+      const result = await deleteVMS(vmDeletionList);
 
-      const result = await getVMFromUser();
-      expect(console.log).toHaveBeenCalled();
-      expect(result).toBeUndefined();
+      expect(fetch).toHaveBeenCalledTimes(1);
+      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/delete`, expect.objectContaining({
+        method: 'POST',
+        body: JSON.stringify({ vm_ids: vmDeletionList }),
+      }));
+      expect(result).toEqual({ status: 'success', results });
     });
-  });
 
-  describe('getVersionData', () => {
-    it('should fetch version data using deployedclusterid if available', async () => {
-      const vmDetails = Promise.resolve([{ id: 10, deployedclusterid: 'clusterXYZ', name: 'vmX' }]);
-      const mockResult = { message: [{ version: '1.0.0' }] };
+    it('should return failed status if any VM was not deleted', async () => {
+      const results = { 1: 'deleted', 2: 'forbidden' };
       fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue(mockResult),
+        status: 400,
+        json: jest.fn().mockResolvedValue({ success: false, results }),
       });
 
-      const result = await getVersionData(vmDetails, 0);
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/version/clusterXYZ`);
-      expect(result).toEqual('1.0.0');
+      const result = await deleteVMS(new Set([1, 2]));
+      expect(result).toEqual({ status: 'failed', results });
     });
 
-    it('should fetch version data using id if deployedclusterid is not available', async () => {
-      const vmDetails = Promise.resolve([{ id: 11, name: 'vmY' }]);
-      const mockResult = { message: [{ version: '2.0.0' }] };
-      fetch.mockResolvedValue({
-        json: jest.fn().mockResolvedValue(mockResult),
-      });
-
-      const result = await getVersionData(vmDetails, 0);
-      expect(fetch).toHaveBeenCalledWith(`${BACKEND_URL}/vms/version/11`);
-      expect(result).toEqual('2.0.0');
+    it('should not call fetch if the deletion list is empty', async () => {
+      const result = await deleteVMS([]);
+      expect(fetch).not.toHaveBeenCalled();
+      expect(result).toEqual({ status: 'success' }); // Should still return success if nothing to delete
     });
 
-    it('should log and return undefined on fetch error', async () => {
-      const vmDetails = Promise.resolve([{ id: 12, name: 'vmZ' }]);
+    it('should log error and return failed status if fetch fails', async () => {
       fetch.mockRejectedValue(new Error('Network error'));
-
-      const result = await getVersionData(vmDetails, 0);
+      const result = await deleteVMS([42]);
       expect(console.log).toHaveBeenCalled();
-      expect(result).toBeUndefined();
+      expect(result).toEqual({ status: 'failed' });
     });
   });
 
+  // New tests for additional functions
+
   describe('loginUser', () => {
     it('should successfully log in with username and password', async () => {
       const mockUsername = 'testuser';